@@ -14,26 +14,61 @@ type PageInfo = {
   }>;
 };
 
+type ScanProgress = {
+  pages_done: number;
+  total_pages: number;
+};
+
 export default function HomePage() {
   const [loading, setLoading] = useState(false);
   const [result, setResult] = useState<PageInfo[] | null>(null);
+  const [progress, setProgress] = useState<ScanProgress | null>(null);
 
   const handleUpload = async (file: File) => {
     setLoading(true);
     setResult(null);
+    setProgress(null);
     const formData = new FormData();
     formData.append("file", file);
 
     try {
-      const res = await fetch("https://hidden-backend-1.onrender.com/upload", {
+      // Pages arrive one NDJSON event per line as soon as each is scanned
+      const res = await fetch("https://hidden-backend-1.onrender.com/upload/stream", {
         method: "POST",
         body: formData,
       });
 
-      if (!res.ok) throw new Error("Upload failed");
+      if (!res.ok || !res.body) throw new Error("Upload failed");
+
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffered = "";
+
+      const handleEvent = (line: string) => {
+        if (!line.trim()) return;
+        const event = JSON.parse(line);
+        if (event.type === "page") {
+          setResult((prev) =>
+            [...(prev ?? []), event.page as PageInfo].sort((a, b) => a.page - b.page)
+          );
+        } else if (event.type === "progress") {
+          setProgress({ pages_done: event.pages_done, total_pages: event.total_pages });
+        } else if (event.type === "summary") {
+          setResult((prev) => prev ?? []);
+        } else if (event.type === "error") {
+          throw new Error(event.error);
+        }
+      };
 
-      const data = await res.json();
-      setResult(data);
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split("\n");
+        buffered = lines.pop() ?? "";
+        lines.forEach(handleEvent);
+      }
+      handleEvent(buffered);
     } catch (err) {
       console.error(err);
       alert("Upload failed, check backend console!");
@@ -147,7 +182,11 @@ export default function HomePage() {
           <div className="bg-white rounded-2xl shadow-2xl border-2 border-gray-300 p-12 mb-12">
             <div className="text-center">
               <Loader />
-              <p className="text-gray-700 mt-6 text-xl font-medium">Analyzing your PDF file...</p>
+              <p className="text-gray-700 mt-6 text-xl font-medium">
+                {progress
+                  ? `Analyzing your PDF file... page ${progress.pages_done} of ${progress.total_pages}`
+                  : "Analyzing your PDF file..."}
+              </p>
             </div>
           </div>
         )}
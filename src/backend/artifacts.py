@@ -0,0 +1,146 @@
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+from config import BACKEND_URL, EXTRACT_FOLDER
+
+log = logging.getLogger(__name__)
+
+# Namespaces untouched for ARTIFACT_TTL seconds are deleted; past
+# ARTIFACT_MAX_MB the least recently used ones go first.
+ARTIFACT_TTL = int(os.environ.get("ARTIFACT_TTL", 3600))
+ARTIFACT_MAX_BYTES = int(os.environ.get("ARTIFACT_MAX_MB", 1024)) * 1024 * 1024
+ARTIFACT_SWEEP_INTERVAL = int(os.environ.get("ARTIFACT_SWEEP_INTERVAL", 60))
+
+_NAMESPACE_RE = re.compile(r"^[0-9a-f]{32}$")
+_NAME_RE = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]{2,5}$")
+
+
+class ArtifactStore:
+    """Images produced by scans, one namespace (directory) per scan.
+
+    Files are named by the SHA-256 of their bytes, so a scan never
+    overwrites another scan's images and identical crops are stored once
+    per namespace. Whole namespaces are evicted by age (TTL since last
+    write or read) and by total size, oldest first, from a background
+    thread started on first use.
+    """
+
+    def __init__(self, directory, ttl=ARTIFACT_TTL, max_bytes=ARTIFACT_MAX_BYTES,
+                 sweep_interval=ARTIFACT_SWEEP_INTERVAL):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._sweeper = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _namespace_path(self, namespace):
+        return os.path.join(self.directory, namespace)
+
+    def new_namespace(self):
+        self.start_sweeper()
+        namespace = uuid.uuid4().hex
+        os.makedirs(self._namespace_path(namespace))
+        return namespace
+
+    def put_bytes(self, namespace, data, ext="png"):
+        """Store ``data`` in ``namespace`` and return its content-addressed name."""
+        name = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+        path = os.path.join(self._namespace_path(namespace), name)
+        if not os.path.exists(path):
+            os.makedirs(self._namespace_path(namespace), exist_ok=True)
+            tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return name
+
+    def put_file(self, namespace, source, ext="png"):
+        with open(source, "rb") as f:
+            return self.put_bytes(namespace, f.read(), ext)
+
+    def path(self, namespace, name):
+        """Path of a stored file, or None for unknown/evicted or malformed names."""
+        if not (_NAMESPACE_RE.match(namespace) and _NAME_RE.match(name)):
+            return None
+        path = os.path.join(self._namespace_path(namespace), name)
+        if not os.path.isfile(path):
+            return None
+        try:
+            os.utime(self._namespace_path(namespace))  # reading keeps the scan alive
+        except OSError:
+            pass
+        return path
+
+    def resolve(self, artifact):
+        """Path for ``"<namespace>/<name>"`` as used in image URLs, or None."""
+        namespace, _, name = artifact.partition("/")
+        return self.path(namespace, name)
+
+    def url(self, namespace, name):
+        return f"{BACKEND_URL}/images/{namespace}/{name}"
+
+    def _namespaces(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_dir() and _NAMESPACE_RE.match(entry.name):
+                size = 0
+                for f in os.scandir(entry.path):
+                    try:
+                        size += f.stat().st_size
+                    except OSError:
+                        pass
+                entries.append((entry.stat().st_mtime, entry.name, size))
+        entries.sort()
+        return entries
+
+    def sweep(self):
+        """Delete expired namespaces, then the oldest ones until under ``max_bytes``."""
+        with self._lock:
+            entries = self._namespaces()
+            total = sum(size for _, _, size in entries)
+            cutoff = time.time() - self.ttl
+            for mtime, namespace, size in entries:
+                if mtime >= cutoff and total <= self.max_bytes:
+                    break
+                shutil.rmtree(self._namespace_path(namespace), ignore_errors=True)
+                total -= size
+                self.evictions += 1
+
+    def start_sweeper(self):
+        # Started lazily so gunicorn --preload doesn't leave it in the master
+        with self._lock:
+            if self._sweeper is not None:
+                return
+            self._sweeper = threading.Thread(target=self._sweep_forever, name="artifact-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def _sweep_forever(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                log.warning("Artifact sweep failed: %s", e)
+            time.sleep(self.sweep_interval)
+
+    def stats(self):
+        with self._lock:
+            entries = self._namespaces()
+        return {
+            "namespaces": len(entries),
+            "size_bytes": sum(size for _, _, size in entries),
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "evictions": self.evictions,
+        }
+
+
+artifact_store = ArtifactStore(EXTRACT_FOLDER)
@@ -0,0 +1,218 @@
+import math
+import os
+
+import cv2
+import numpy as np
+from pyzbar.pyzbar import decode
+
+# Candidate regions are searched on a copy whose long side is at most this
+CODE_SEARCH_MAX_SIDE = int(os.environ.get("CODE_SEARCH_MAX_SIDE", 640))
+# Regions smaller than this (pixels of the search copy) can't hold a readable code
+CODE_MIN_REGION_SIDE = int(os.environ.get("CODE_MIN_REGION_SIDE", 12))
+# Past this many candidates decode the whole frame once instead
+CODE_MAX_REGIONS = int(os.environ.get("CODE_MAX_REGIONS", 32))
+# Wider (or taller) blobs than this are lines of text, not codes
+CODE_MAX_ASPECT = 6
+# Printed codes are two-tone: Otsu must explain most of a region's variance
+CODE_MIN_SEPARABILITY = 0.75
+# Crops are rescaled so their short side lands in this range before decoding
+CODE_DECODE_MIN_SIDE = 160
+CODE_DECODE_MAX_SIDE = 1200
+
+
+def find_code_regions(gray):
+    """Bounding boxes ``(x0, y0, x1, y1)`` of areas that could hold a QR code or barcode.
+
+    Codes are dense in strong gradients; on a downscaled copy the gradient
+    map is thresholded and closed into blobs, and each blob large enough to
+    be a code becomes a candidate. Boxes are in ``gray``'s pixel coordinates.
+    """
+    h, w = gray.shape[:2]
+    scale = min(1.0, CODE_SEARCH_MAX_SIDE / max(h, w))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+    # Stretch faint images so the fixed gradient threshold still sees their codes
+    small = cv2.normalize(small, None, 0, 255, cv2.NORM_MINMAX)
+
+    gx = cv2.convertScaleAbs(cv2.Sobel(small, cv2.CV_16S, 1, 0, ksize=3))
+    gy = cv2.convertScaleAbs(cv2.Sobel(small, cv2.CV_16S, 0, 1, ksize=3))
+    gradient = cv2.addWeighted(gx, 0.5, gy, 0.5, 0)
+    _, mask = cv2.threshold(gradient, 80, 255, cv2.THRESH_BINARY)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (7, 7)))
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    regions = []
+    for contour in contours:
+        x, y, cw, ch = cv2.boundingRect(contour)
+        if min(cw, ch) < CODE_MIN_REGION_SIDE or max(cw, ch) > CODE_MAX_ASPECT * min(cw, ch):
+            continue
+        # Codes are mostly ink inside their box; sparse outlines are not
+        if cv2.contourArea(contour) < 0.4 * cw * ch:
+            continue
+        if _separability(small[y:y + ch, x:x + cw]) < CODE_MIN_SEPARABILITY:
+            continue
+        pad = max(cw, ch) * 0.1 + 2
+        regions.append((
+            max(0, int((x - pad) / scale)),
+            max(0, int((y - pad) / scale)),
+            min(w, int(math.ceil((x + cw + pad) / scale))),
+            min(h, int(math.ceil((y + ch + pad) / scale))),
+        ))
+    regions = _merge_overlapping(regions)
+    regions.sort(key=lambda r: (r[1], r[0]))
+    return regions
+
+def _separability(region):
+    """Share of ``region``'s intensity variance explained by an Otsu split (1.0 = pure two-tone)."""
+    pixels = region.astype(np.float64)
+    total = pixels.var()
+    if total == 0:
+        return 0.0
+    threshold, _ = cv2.threshold(region, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    dark = pixels <= threshold
+    share = dark.mean()
+    if share in (0.0, 1.0):
+        return 0.0
+    gap = pixels[dark].mean() - pixels[~dark].mean()
+    return share * (1 - share) * gap * gap / total
+
+def _merge_overlapping(boxes):
+    """Union boxes that overlap, so fragments of one code are decoded together."""
+    merged = []
+    for box in boxes:
+        box = list(box)
+        changed = True
+        while changed:
+            changed = False
+            for other in merged:
+                if box[0] < other[2] and other[0] < box[2] and box[1] < other[3] and other[1] < box[3]:
+                    merged.remove(other)
+                    box = [min(box[0], other[0]), min(box[1], other[1]),
+                           max(box[2], other[2]), max(box[3], other[3])]
+                    changed = True
+                    break
+        merged.append(tuple(box))
+    return merged
+
+def _decode_scales(crop, retries=False):
+    """Scales to try for ``crop``: as-is first, then towards a decodable size.
+
+    With ``retries`` a couple of extra scales are added for decoders that
+    are sensitive to module size.
+    """
+    short_side = min(crop.shape[:2])
+    long_side = max(crop.shape[:2])
+    scales = [1.0]
+    if short_side < CODE_DECODE_MIN_SIDE:
+        scales.append(min(4.0, CODE_DECODE_MIN_SIDE / short_side))
+    elif long_side > CODE_DECODE_MAX_SIDE:
+        scales.append(CODE_DECODE_MAX_SIDE / long_side)
+    if retries:
+        scales += [s for s in (2.0, 0.5)
+                   if CODE_DECODE_MIN_SIDE / 2 <= short_side * s and long_side * s <= CODE_DECODE_MAX_SIDE]
+    return scales
+
+def _zbar_codes(crop):
+    for scale in _decode_scales(crop):
+        image = crop if scale == 1.0 else cv2.resize(
+            crop, None, fx=scale, fy=scale,
+            interpolation=cv2.INTER_CUBIC if scale > 1 else cv2.INTER_AREA)
+        _, binary = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        for variant in (image, binary):
+            found = decode(variant)
+            if found:
+                codes = []
+                for symbol in found:
+                    r = symbol.rect
+                    codes.append((symbol.type, symbol.data,
+                                  [r.left / scale, r.top / scale,
+                                   (r.left + r.width) / scale, (r.top + r.height) / scale]))
+                return codes
+    return []
+
+def _opencv_codes(crop):
+    detector = cv2.QRCodeDetector()
+    for scale in _decode_scales(crop, retries=True):
+        image = crop if scale == 1.0 else cv2.resize(
+            crop, None, fx=scale, fy=scale,
+            interpolation=cv2.INTER_CUBIC if scale > 1 else cv2.INTER_AREA)
+        try:
+            ok, texts, points, _ = detector.detectAndDecodeMulti(image)
+            if not (ok and any(texts)):
+                # The single-code decoder succeeds on some crops the multi one misses
+                text, quad, _ = detector.detectAndDecode(image)
+                ok, texts, points = bool(text), (text,), (None if quad is None else quad.reshape(1, -1, 2))
+        except cv2.error:
+            continue
+        if not ok or points is None:
+            continue
+        codes = []
+        for text, quad in zip(texts, points):
+            if text:
+                xs, ys = quad[:, 0] / scale, quad[:, 1] / scale
+                codes.append(("QRCODE", text.encode("utf-8"),
+                              [float(xs.min()), float(ys.min()), float(xs.max()), float(ys.max())]))
+        if codes:
+            return codes
+    return []
+
+def _decode_crop(gray, region):
+    x0, y0, x1, y1 = region
+    crop = np.ascontiguousarray(gray[y0:y1, x0:x1])
+    codes = _zbar_codes(crop)
+    if not codes and max(crop.shape) <= 2 * min(crop.shape):
+        # OpenCV only reads QR codes, which are square-ish
+        codes = _opencv_codes(crop)
+    return [(kind, data, [bx0 + x0, by0 + y0, bx1 + x0, by1 + y0])
+            for kind, data, (bx0, by0, bx1, by1) in codes]
+
+def _full_frame_codes(gray):
+    """One zbar and one OpenCV pass over the whole image, shrunk to ``CODE_DECODE_MAX_SIDE``."""
+    h, w = gray.shape[:2]
+    scale = min(1.0, CODE_DECODE_MAX_SIDE / max(h, w))
+    image = gray if scale == 1.0 else cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    codes = []
+    for symbol in decode(image):
+        r = symbol.rect
+        codes.append((symbol.type, symbol.data, [r.left, r.top, r.left + r.width, r.top + r.height]))
+    if not codes:
+        try:
+            ok, texts, points, _ = cv2.QRCodeDetector().detectAndDecodeMulti(image)
+        except cv2.error:
+            ok = False
+        if ok and points is not None:
+            for text, quad in zip(texts, points):
+                if text:
+                    xs, ys = quad[:, 0], quad[:, 1]
+                    codes.append(("QRCODE", text.encode("utf-8"),
+                                  [float(xs.min()), float(ys.min()), float(xs.max()), float(ys.max())]))
+    return [(kind, data, [v / scale for v in bbox]) for kind, data, bbox in codes]
+
+def _seen(codes, data, bbox):
+    cx, cy = (bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2
+    return any(d == data and b[0] <= cx <= b[2] and b[1] <= cy <= b[3] for _, d, b in codes)
+
+def detect_codes(gray):
+    """Decode every QR code / barcode in a grayscale image.
+
+    Returns ``[(type, data_bytes, [x0, y0, x1, y1])]`` with boxes in pixels
+    of ``gray``. Candidate regions from ``find_code_regions`` are decoded
+    one by one (zbar on the crop and its Otsu binarization at one or two
+    scales, then OpenCV's QR detector). When no
+    region decodes, e.g. a code on a noisy scan that the gradient mask
+    missed, the whole frame gets one zbar and one OpenCV pass.
+    """
+    h, w = gray.shape[:2]
+    regions = find_code_regions(gray)
+    whole_frame = len(regions) > CODE_MAX_REGIONS
+    if whole_frame:
+        regions = [(0, 0, w, h)]
+
+    codes = []
+    for region in regions:
+        for kind, data, bbox in _decode_crop(gray, region):
+            if not _seen(codes, data, bbox):
+                codes.append((kind, data, bbox))
+    if not codes and not whole_frame:
+        codes = _full_frame_codes(gray)
+    codes.sort(key=lambda code: (code[2][1], code[2][0]))
+    return codes
@@ -0,0 +1,196 @@
+"""Headless batch scanner: the /upload pipeline over directories of PDFs.
+
+    python batch.py ../../pdf_uploads archive/ --output results.jsonl --workers 4
+
+Every document becomes one JSON line in ``--output`` as soon as it is
+done. The output doubles as the checkpoint: rerunning the same command
+skips every content hash already recorded there without an error, so an
+interrupted backfill resumes where it stopped, and identical files
+(same SHA-256) are only scanned once.
+
+Documents are spread over a pool of spawned worker processes that each
+scan one PDF at a time. Workers are replaced after ``--max-tasks-per-child``
+documents and at most two documents per worker are in flight, which keeps
+memory per worker (and in the parent) bounded on long runs. A worker that
+dies (killed for memory, a crash in a native library) takes the pool with
+it: the documents in flight are recorded as failed, so a rerun retries
+them, and the batch goes on with a new pool. Point
+``OCR_SERVICE_ADDRESS`` at an ocr_service so workers don't each load
+EasyOCR.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import telemetry
+from cache import sha256_file
+
+BATCH_MAX_TASKS_PER_CHILD = int(os.environ.get("BATCH_MAX_TASKS_PER_CHILD", 50))
+
+
+def find_pdfs(paths, recursive=True):
+    """PDF files named by ``paths`` (files or directories), sorted, without repeats."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                found.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith(".pdf"))
+                if not recursive:
+                    break
+        elif path.lower().endswith(".pdf"):
+            found.append(path)
+    seen = set()
+    return [p for p in found if not (os.path.abspath(p) in seen or seen.add(os.path.abspath(p)))]
+
+def load_checkpoint(output):
+    """Content hashes already scanned successfully according to ``output``."""
+    done = set()
+    if not os.path.exists(output):
+        return done
+    with open(output, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by an interrupted run
+            if record.get("sha256") and not record.get("error"):
+                done.add(record["sha256"])
+    return done
+
+def _init_worker(quiet):
+    telemetry.setup_logging("WARNING" if quiet else None)
+    if quiet:
+        sys.stdout = open(os.devnull, "w")
+
+def scan_file(path, sha256, options):
+    """Worker entry point: scan one PDF serially and return its JSONL record."""
+    import scanner
+
+    started = time.time()
+    record = {"file": path, "sha256": sha256}
+    try:
+        report = scanner.scan_pdf(path, os.path.basename(path), parallel=False, **options)
+        record.update({
+            "pages": len(report),
+            "images": sum(len(page_info["images"]) for page_info in report),
+            "links": sum(scanner.count_page_links(page_info) for page_info in report),
+            "report": report,
+        })
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["elapsed"] = round(time.time() - started, 3)
+    return record
+
+def _new_pool(workers, quiet, max_tasks_per_child):
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(quiet,),
+        max_tasks_per_child=max_tasks_per_child,
+    )
+
+def run_batch(paths, output, workers=1, options=None, recursive=True, quiet=True,
+              max_tasks_per_child=BATCH_MAX_TASKS_PER_CHILD):
+    """Scan ``paths`` into the JSONL file ``output``; returns counts of what happened."""
+    options = options or {}
+    files = find_pdfs(paths, recursive)
+    done = load_checkpoint(output)
+    counts = {"found": len(files), "scanned": 0, "failed": 0, "skipped": 0}
+    print(f"📚 {len(files)} PDF(s) found, {len(done)} document(s) already in {output}")
+
+    def pending():
+        for path in files:
+            try:
+                sha256 = sha256_file(path)
+            except OSError as e:
+                print(f"💥 Can't read {path}: {e}")
+                counts["failed"] += 1
+                continue
+            if sha256 in done:
+                counts["skipped"] += 1
+                continue
+            done.add(sha256)  # identical copies later in the list are skipped too
+            yield path, sha256
+
+    started = time.time()
+    pool = _new_pool(workers, quiet, max_tasks_per_child)
+    jobs = pending()
+    in_flight = {}  # future -> (path, sha256)
+    with open(output, "a", encoding="utf-8") as out:
+        try:
+            while True:
+                # Keep the pool fed without queueing (and hashing) the whole archive up front
+                for path, sha256 in jobs:
+                    in_flight[pool.submit(scan_file, path, sha256, options)] = (path, sha256)
+                    if len(in_flight) >= 2 * workers:
+                        break
+                if not in_flight:
+                    break
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                if any(isinstance(future.exception(), BrokenProcessPool) for future in finished):
+                    # Every document still in flight went down with the pool
+                    finished = wait(in_flight).done
+                    pool.shutdown()
+                    pool = _new_pool(workers, quiet, max_tasks_per_child)
+                    print("💥 A worker died; restarting the pool")
+                for future in finished:
+                    path, sha256 = in_flight.pop(future)
+                    try:
+                        record = future.result()
+                    except BrokenProcessPool as e:
+                        record = {"file": path, "sha256": sha256, "error": f"BrokenProcessPool: {e}"}
+                    out.write(json.dumps(record) + "\n")
+                    out.flush()
+                    if record.get("error"):
+                        counts["failed"] += 1
+                        print(f"💥 {record['file']}: {record['error']}")
+                    else:
+                        counts["scanned"] += 1
+                        print(f"✅ {record['file']}: {record['pages']} page(s), {record['links']} link(s) "
+                              f"in {record['elapsed']:.1f}s")
+        finally:
+            pool.shutdown()
+
+    print(f"🎉 Batch done in {time.time() - started:.1f}s: {counts['scanned']} scanned, "
+          f"{counts['skipped']} skipped, {counts['failed']} failed")
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scan directories of PDFs into a JSONL file")
+    parser.add_argument("paths", nargs="+", help="PDF files or directories to scan")
+    parser.add_argument("--output", "-o", default="scan_results.jsonl",
+                        help="JSONL file to append to; also the resume checkpoint")
+    parser.add_argument("--workers", "-w", type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument("--max-tasks-per-child", type=int, default=BATCH_MAX_TASKS_PER_CHILD,
+                        help="documents a worker scans before it is replaced")
+    parser.add_argument("--no-recursive", action="store_true", help="don't descend into subdirectories")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the report and image caches")
+    parser.add_argument("--images", action="store_true",
+                        help="keep images servable through /images (off: only results are written)")
+    parser.add_argument("--no-text-layer", action="store_true", help="OCR even where the PDF has vector text")
+    parser.add_argument("--full-page", action="store_true", help="scan whole rendered pages tile by tile")
+    parser.add_argument("--verbose", "-v", action="store_true", help="show the scanner's per-page output")
+    args = parser.parse_args()
+    counts = run_batch(
+        args.paths,
+        args.output,
+        workers=max(1, args.workers),
+        options={
+            "use_cache": not args.no_cache,
+            "save_images": args.images,
+            "text_layer": not args.no_text_layer,
+            "full_page": args.full_page,
+        },
+        recursive=not args.no_recursive,
+        quiet=not args.verbose,
+        max_tasks_per_child=args.max_tasks_per_child,
+    )
+    sys.exit(1 if counts["failed"] else 0)
@@ -0,0 +1,294 @@
+"""Reproducible benchmarks for the scanning pipeline.
+
+    python benchmark.py                      # synthetic PDF + pdf_uploads/ corpus
+    python benchmark.py --save-baseline      # store the results as the baseline
+    python benchmark.py --check              # exit 1 if a stage regressed
+
+A synthetic PDF is generated with fitz from a fixed seed (``--pages``,
+``--links``, ``--images``, ``--qr-codes``, ``--text-images`` per page), so
+two runs measure the same input. Each stage runs in its own freshly
+spawned process, which makes its peak RSS meaningful, and reports
+throughput, p50/p95 latency per item and peak RSS:
+
+    scan_pdf                    whole synthetic document, as /upload scans it
+    corpus                      every PDF in the corpus directory
+    extract_qr_codes            each embedded image of the synthetic PDF
+    extract_text_and_urls       the same images through OCR triage and OCR
+    extract_pdf_links_for_area  link index build + every image-area query, per page
+
+``--check`` compares against the baseline file: latencies and peak RSS may
+grow, and throughput may drop, by the baseline's ``tolerance`` (a stage
+entry can carry its own). A missing baseline file, or a stage it has no
+entry for, fails the check too. The baseline is machine-specific, so it is
+not committed: record one with ``--save-baseline`` on the machine that runs
+``--check``. Caches are pointed at a temporary directory and
+bypassed, so results never depend on earlier runs.
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import math
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from config import BASE_DIR
+
+BENCH_BASELINE = os.path.join(BASE_DIR, "benchmark_baseline.json")
+BENCH_CORPUS = os.path.join(BASE_DIR, "..", "..", "pdf_uploads")
+BENCH_TOLERANCE = 0.25
+# Latency increases smaller than this never count as regressions (timer noise)
+BENCH_MIN_SLACK_MS = 1.0
+STAGES = ("scan_pdf", "corpus", "extract_qr_codes", "extract_text_and_urls", "extract_pdf_links_for_area")
+
+
+def make_synthetic_pdf(path, pages=10, links=8, images=2, qr_codes=1, text_images=1, seed=0):
+    """Write a PDF with the given number of URI links and images per page.
+
+    ``images`` are photo-like JPEGs, ``qr_codes`` PNGs of QR codes holding
+    URLs and ``text_images`` PNGs of rendered text containing URLs. Every
+    image is unique, so the duplicate-image shortcut doesn't hide work.
+    """
+    import cv2
+    import fitz
+    import numpy as np
+    from PIL import Image, ImageDraw, ImageFont
+
+    rng = np.random.default_rng(seed)
+    font = ImageFont.load_default(size=26)
+    encoder = cv2.QRCodeEncoder.create()
+
+    def encode(img, fmt, **kwargs):
+        out = io.BytesIO()
+        img.save(out, fmt, **kwargs)
+        return out.getvalue()
+
+    def photo(page_num, i):
+        h, w = 360, 480
+        y, x = np.mgrid[0:h, 0:w]
+        base = np.stack([x * 255 / w, y * 255 / h, (x + y + 40 * i + 10 * page_num) % 256], axis=-1)
+        noisy = np.clip(base + rng.normal(0, 18, base.shape), 0, 255).astype(np.uint8)
+        return encode(Image.fromarray(noisy), "JPEG", quality=85)
+
+    def qr_code(page_num, i):
+        modules = encoder.encode(f"https://example.com/qr/{seed}/{page_num}/{i}")
+        img = Image.fromarray(modules).resize((modules.shape[1] * 6, modules.shape[0] * 6), Image.NEAREST)
+        framed = Image.new("L", (img.width + 48, img.height + 48), 255)
+        framed.paste(img, (24, 24))
+        return encode(framed, "PNG")
+
+    def text_image(page_num, i):
+        img = Image.new("RGB", (520, 120), "white")
+        draw = ImageDraw.Draw(img)
+        draw.text((16, 14), f"Visit www.example.org/p{page_num}/t{i}", fill="black", font=font)
+        draw.text((16, 62), f"or call us, reference {seed}-{page_num}-{i}", fill=(40, 40, 40), font=font)
+        return encode(img, "PNG")
+
+    doc = fitz.open()
+    for page_num in range(1, pages + 1):
+        page = doc.new_page(width=612, height=792)
+        for i in range(links):
+            # Two columns of text links at the top of the page
+            x0, y0 = 40 + (i // 10) * 280, 40 + (i % 10) * 22
+            rect = fitz.Rect(x0, y0, x0 + 260, y0 + 16)
+            uri = f"https://example.com/{seed}/p{page_num}/link{i}"
+            page.insert_text((rect.x0 + 2, rect.y1 - 4), uri, fontsize=9)
+            page.insert_link({"kind": fitz.LINK_URI, "from": rect, "uri": uri})
+        streams = ([photo(page_num, i) for i in range(images)]
+                   + [qr_code(page_num, i) for i in range(qr_codes)]
+                   + [text_image(page_num, i) for i in range(text_images)])
+        for slot, stream in enumerate(streams):
+            # A 3 x 3 grid below the links; extra images overlap earlier slots
+            col, row = slot % 3, (slot // 3) % 3
+            rect = fitz.Rect(40 + col * 180, 280 + row * 165, 200 + col * 180, 420 + row * 165)
+            page.insert_image(rect, stream=stream, keep_proportion=True)
+            if slot % 2 == 0:
+                # Some images are clickable too
+                page.insert_link({"kind": fitz.LINK_URI, "from": rect,
+                                  "uri": f"https://example.com/{seed}/p{page_num}/image{slot}"})
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+    return path
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = max(0, math.ceil(q / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+def _embedded_images(path):
+    import fitz
+    from extraction import EmbeddedImage
+    from scanner import OCR_PIXEL_BUDGET
+
+    pdf = fitz.open(path)
+    try:
+        return [EmbeddedImage.from_fitz(pdf, img[0]).decode(OCR_PIXEL_BUDGET)
+                for page in pdf for img in page.get_images(full=True)]
+    finally:
+        pdf.close()
+
+def _stage_items(stage, synthetic, corpus):
+    """``(unit, [(pages, callable)])`` for one stage; each callable is one timed item."""
+    import fitz
+    import scanner
+    from links import LinkIndex
+
+    scan = dict(parallel=False, use_cache=False, save_images=False)
+    if stage == "scan_pdf":
+        pages = len(fitz.open(synthetic))
+        return "page", [(pages, lambda: scanner.scan_pdf(synthetic, "synthetic.pdf", **scan))]
+    if stage == "corpus":
+        items = []
+        for path in corpus:
+            with fitz.open(path) as pdf:
+                pages = len(pdf)
+            items.append((pages, lambda path=path: scanner.scan_pdf(path, os.path.basename(path), **scan)))
+        return "page", items
+    if stage in ("extract_qr_codes", "extract_text_and_urls"):
+        func = getattr(scanner, stage)
+        return "image", [(0, lambda image=image: func(image)) for image in _embedded_images(synthetic)]
+    if stage == "extract_pdf_links_for_area":
+        pdf = fitz.open(synthetic)
+
+        def links_for_page(page):
+            index = LinkIndex.for_page(page)
+            for slice_index, img in enumerate(page.get_images(full=True)):
+                for rect in page.get_image_rects(img[0]):
+                    scanner.extract_pdf_links_for_area(index, [rect.x0, rect.y0, rect.x1, rect.y1], slice_index)
+
+        return "page", [(1, lambda page=page: links_for_page(page)) for page in pdf]
+    raise ValueError(f"Unknown stage {stage!r}")
+
+def run_stage(stage, synthetic, corpus, repeat):
+    """Worker entry point: time every item of ``stage`` ``repeat`` times after one warm-up pass."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        unit, items = _stage_items(stage, synthetic, corpus)
+        if items:
+            items[0][1]()  # warm-up: model loading and first-call costs aren't measured
+        latencies = []
+        pages = 0
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for item_pages, func in items:
+                t = time.perf_counter()
+                func()
+                latencies.append(time.perf_counter() - t)
+                pages += item_pages
+        elapsed = time.perf_counter() - started
+    count = pages if unit == "page" else len(latencies)
+    return {
+        "unit": unit,
+        "items": len(latencies),
+        "per_sec": round(count / elapsed, 3) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+def run_benchmarks(stages, synthetic, corpus, repeat):
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for stage in stages:
+        if stage == "corpus" and not corpus:
+            print("⏭️  corpus: no PDFs found, skipped")
+            continue
+        # A fresh process per stage, so peak RSS belongs to that stage alone
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results[stage] = pool.submit(run_stage, stage, synthetic, corpus, repeat).result()
+        r = results[stage]
+        print(f"⏱️  {stage:<28} {r['per_sec']:>9.2f} {r['unit']}s/s  p50 {r['p50_ms']:>9.2f} ms  "
+              f"p95 {r['p95_ms']:>9.2f} ms  peak RSS {r['peak_rss_mb']:>7.1f} MB")
+    return results
+
+def compare(results, baseline, tolerance=None):
+    """Regressions of ``results`` against ``baseline`` as human-readable strings."""
+    failures = []
+    default = baseline.get("tolerance", BENCH_TOLERANCE) if tolerance is None else tolerance
+    for stage, current in results.items():
+        base = baseline.get("stages", {}).get(stage)
+        if base is None:
+            failures.append(f"{stage}: not in the baseline; record it with --save-baseline")
+            continue
+        tol = base.get("tolerance", default)
+        for key in ("p50_ms", "p95_ms"):
+            limit = max(base[key] * (1 + tol), base[key] + BENCH_MIN_SLACK_MS)
+            if current[key] > limit:
+                failures.append(f"{stage}: {key} {current[key]} > {limit:.3f} (baseline {base[key]})")
+        limit = base["peak_rss_mb"] * (1 + tol)
+        if current["peak_rss_mb"] > limit:
+            failures.append(f"{stage}: peak_rss_mb {current['peak_rss_mb']} > {limit:.1f} "
+                            f"(baseline {base['peak_rss_mb']})")
+        limit = base["per_sec"] * (1 - tol)
+        if current["per_sec"] < limit:
+            failures.append(f"{stage}: per_sec {current['per_sec']} < {limit:.3f} (baseline {base['per_sec']})")
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scanning pipeline stage by stage")
+    parser.add_argument("--pages", type=int, default=10, help="synthetic PDF pages")
+    parser.add_argument("--links", type=int, default=8, help="URI links per page")
+    parser.add_argument("--images", type=int, default=2, help="photo-like JPEGs per page")
+    parser.add_argument("--qr-codes", type=int, default=1, help="QR code images per page")
+    parser.add_argument("--text-images", type=int, default=1, help="images of text with URLs per page")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="timed passes over each stage's items")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma-separated stages to run")
+    parser.add_argument("--corpus", default=BENCH_CORPUS, help="directory of real PDFs for the corpus stage")
+    parser.add_argument("--baseline", default=BENCH_BASELINE, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--check", action="store_true", help="exit 1 when a stage regressed past the baseline")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help=f"allowed relative regression (default: the baseline's, else {BENCH_TOLERANCE})")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+    if args.check and not args.save_baseline and not os.path.exists(args.baseline):
+        # A check with nothing to compare against must not pass
+        print(f"❌ No baseline at {args.baseline}; run with --save-baseline first")
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory(prefix="hidden-bench-") as tmp:
+        # Spawned stage workers inherit this, so no stage touches the real caches
+        os.environ["CACHE_DIR"] = os.path.join(tmp, "cache")
+        synthetic = make_synthetic_pdf(os.path.join(tmp, "synthetic.pdf"), args.pages, args.links,
+                                       args.images, args.qr_codes, args.text_images, args.seed)
+        corpus = sorted(glob.glob(os.path.join(args.corpus, "*.pdf")))
+        params = {k: getattr(args, k) for k in ("pages", "links", "images", "qr_codes", "text_images",
+                                                "seed", "repeat")}
+        print(f"🧪 Synthetic PDF: {params}; corpus: {len(corpus)} PDF(s)")
+        results = run_benchmarks(stages, synthetic, corpus, args.repeat)
+
+    report = {"params": params, "stages": results}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    failed = False
+    if args.save_baseline:
+        baseline = {"tolerance": args.tolerance if args.tolerance is not None else BENCH_TOLERANCE, **report}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"💾 Baseline written to {args.baseline}")
+    elif args.check:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("params") != params:
+            print(f"⚠️  Baseline was recorded with {baseline.get('params')}; comparing anyway")
+        failures = compare(results, baseline, args.tolerance)
+        for failure in failures:
+            print(f"❌ {failure}")
+        failed = bool(failures)
+        print("✅ No regressions" if not failed else f"💥 {len(failures)} regression(s)")
+    sys.exit(1 if failed else 0)
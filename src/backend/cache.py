@@ -0,0 +1,146 @@
+import collections
+import errno
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+
+log = logging.getLogger(__name__)
+
+
+def sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+def sha256_file(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """Content-addressed on-disk store evicted least-recently-used by total size.
+
+    Each key is a directory holding ``value.json`` plus optional attached
+    files. Recency is tracked through the entry's mtime, so the LRU order
+    survives restarts and is shared (loosely) between processes.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._index = None  # key -> size in bytes, oldest first
+        self._size = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _entry_size(self, path):
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        entries = []
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.is_dir() and not entry.name.startswith("."):
+                    entries.append((entry.stat().st_mtime, entry.name, self._entry_size(entry.path)))
+        entries.sort()
+        self._index = collections.OrderedDict((key, size) for _, key, size in entries)
+        self._size = sum(self._index.values())
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(os.path.join(path, "value.json"), "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            self._load_index()
+            if key in self._index:
+                self._index.move_to_end(key)
+        return value
+
+    def attachment(self, key, name):
+        """Path of a file stored alongside ``key`` (it may have been evicted since)."""
+        return os.path.join(self._path(key), name)
+
+    def put(self, key, value, attachments=None):
+        """Store ``value`` under ``key`` with ``{name: source_path or bytes}`` attachments."""
+        path = self._path(key)
+        tmp = os.path.join(self.directory, key[:2], f".{key}.{uuid.uuid4().hex}")
+        try:
+            os.makedirs(tmp)
+            with open(os.path.join(tmp, "value.json"), "w", encoding="utf-8") as f:
+                json.dump(value, f)
+            for name, source in (attachments or {}).items():
+                if isinstance(source, bytes):
+                    with open(os.path.join(tmp, name), "wb") as f:
+                        f.write(source)
+                else:
+                    shutil.copyfile(source, os.path.join(tmp, name))
+            shutil.rmtree(path, ignore_errors=True)
+            try:
+                os.rename(tmp, path)
+            except OSError as e:
+                if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                    raise
+                # Another process stored the same key between the rmtree and
+                # the rename; its copy is as good as ours
+                log.debug("Cache entry %s written concurrently", key[:12])
+                shutil.rmtree(tmp, ignore_errors=True)
+        except OSError as e:
+            log.warning("Cache write failed for %s: %s", key[:12], e)
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        size = self._entry_size(path)
+        with self._lock:
+            self._load_index()
+            self._size += size - self._index.pop(key, 0)
+            self._index[key] = size
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._index) > 1:
+            key, size = self._index.popitem(last=False)
+            shutil.rmtree(self._path(key), ignore_errors=True)
+            self._size -= size
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            self._load_index()
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._index),
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            }
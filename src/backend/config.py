@@ -0,0 +1,11 @@
+import os
+
+# Shared paths and URLs; kept free of heavy imports so server.py starts fast
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Uploads in flight and the artifact store's root; next to the code by default
+UPLOAD_FOLDER = os.environ.get("UPLOAD_FOLDER", os.path.join(BASE_DIR, "pdf_uploads"))
+EXTRACT_FOLDER = os.environ.get("EXTRACT_FOLDER", os.path.join(BASE_DIR, "extracted_images"))
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(EXTRACT_FOLDER, exist_ok=True)
+
+BACKEND_URL = "https://hidden-backend-1.onrender.com"
@@ -1,6 +1,8 @@
 import os
 import subprocess
-from pikepdf import Pdf, PdfImage
+from pikepdf import Pdf
+
+from extraction import EmbeddedImage
 
 def analyze_pdf(pdf_path, output_dir="hidden_extracted"):
     os.makedirs(output_dir, exist_ok=True)
@@ -13,9 +15,11 @@ def analyze_pdf(pdf_path, output_dir="hidden_extracted"):
             continue
 
         for name, obj in xobjects.items():
-            img = PdfImage(obj)
-            out_name = os.path.join(output_dir, f"page{i}_{name[1:]}.bin")
-            img.extract_to(fileprefix=out_name.replace('.bin', ''))
+            # Same extraction as the scanner: native bytes where browsers can show them
+            img = EmbeddedImage.from_pikepdf(obj)
+            out_name = os.path.join(output_dir, f"page{i}_{name[1:]}.{img.ext}")
+            with open(out_name, "wb") as f:
+                f.write(img.data)
             extracted_files.append(out_name)
             print(f"Extracted: {out_name}")
 
@@ -0,0 +1,76 @@
+"""Embedded-image extraction shared by the scanner (PyMuPDF) and demo.py (pikepdf).
+
+Images keep the encoding they have inside the PDF whenever browsers can
+show it, so a JPEG is stored as the JPEG stream, not as a PNG several
+times its size. Other encodings (JPEG 2000, JBIG2, TIFF...) are decoded
+once and stored as PNG. Either way the pixels are decoded at most once,
+for analysis.
+"""
+import io
+import math
+
+from PIL import Image
+
+from images import ImageBuffer
+
+# Encodings stored as-is, and the extension they are stored (and served) under
+WEB_FORMATS = {
+    "jpeg": "jpg",
+    "jpg": "jpg",
+    "png": "png",
+    "gif": "gif",
+    "webp": "webp",
+}
+
+
+class EmbeddedImage:
+    """Encoded bytes of one embedded image plus lazily decoded pixels.
+
+    ``data``/``ext`` are what gets stored and served; ``decode``
+    returns the ``ImageBuffer`` used for QR/OCR and reuses any decode the
+    transcoding step already did.
+    """
+
+    def __init__(self, data, ext):
+        ext = ext.lower().lstrip(".")
+        self._pil = None
+        if ext in WEB_FORMATS:
+            self.data = data
+        else:
+            self._pil = Image.open(io.BytesIO(data))
+            self._pil.load()
+            png = io.BytesIO()
+            self._pil.save(png, "PNG")
+            self.data = png.getvalue()
+            ext = "png"
+        self.ext = WEB_FORMATS[ext]
+
+    @classmethod
+    def from_fitz(cls, pdf, xref):
+        """Extract ``xref`` from a PyMuPDF document (JPEG/JPX streams come out untouched)."""
+        extracted = pdf.extract_image(xref)
+        return cls(extracted["image"], extracted["ext"])
+
+    @classmethod
+    def from_pikepdf(cls, obj):
+        """Extract an image XObject through pikepdf's ``PdfImage``."""
+        from pikepdf import PdfImage
+
+        stream = io.BytesIO()
+        ext = PdfImage(obj).extract_to(stream=stream)
+        return cls(stream.getvalue(), ext)
+
+    def decode(self, max_pixels=None):
+        """Pixels for analysis, at most ``max_pixels`` of them.
+
+        JPEGs are decoded straight at a reduced scale (PIL's ``draft``) when
+        the full resolution would only be thrown away.
+        """
+        img = self._pil
+        if img is None:
+            img = Image.open(io.BytesIO(self.data))
+            w, h = img.size
+            if max_pixels and w * h > max_pixels:
+                f = math.sqrt(max_pixels / (w * h))
+                img.draft(None, (max(1, int(w * f)), max(1, int(h * f))))
+        return ImageBuffer.from_pil(img).limit_pixels(max_pixels)
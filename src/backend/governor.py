@@ -0,0 +1,198 @@
+"""Memory admission control for scans.
+
+Each scan's peak memory is estimated before it starts (see
+scanner.estimate_scan_memory) and ``governor.admit`` holds it back until
+the scans already running leave room for it in the budget. Scans are let
+in first come, first served, so a big one is not starved by a stream of
+small ones; a scan estimated above the whole budget is refused outright
+(``OverBudget``), since it would not fit even on an idle server.
+
+While anything is admitted a sampler thread reads the resident memory of
+this process and its live children (the page-scanning pool), so every
+scan can report the peak seen while it ran. Concurrent scans share that
+peak; ``rss_growth_mb`` over the level at admission is the closer
+per-scan figure. The budget is per server process, not per host.
+
+Memory is read straight from /proc, with no psutil dependency; where
+/proc is missing admission still works and the peak figures are None.
+"""
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+class OverBudget(Exception):
+    """Raised for a scan estimated to need more memory than the whole budget."""
+
+
+class AdmissionTimeout(Exception):
+    """Raised when room for a scan didn't free up in time."""
+
+
+def _child_pids():
+    # multiprocessing.active_children() reaps as it goes, so it isn't safe
+    # from a sampler thread; /proc lists every thread's children instead
+    pids = []
+    try:
+        for tid in os.listdir("/proc/self/task"):
+            with open(f"/proc/self/task/{tid}/children") as f:
+                pids.extend(f.read().split())
+    except OSError:
+        pass
+    return pids
+
+def process_memory():
+    """Resident bytes of this process and its child processes, or None where /proc is missing."""
+    pids = ["self"] + _child_pids()
+    total = None
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                resident = int(f.read().split()[1]) * _PAGE_SIZE
+        except (OSError, ValueError, IndexError):
+            continue
+        total = (total or 0) + resident
+    return total
+
+
+class Admission:
+    """One admitted scan: its share of the budget and the memory seen while it ran."""
+
+    def __init__(self, governor, name, estimate, waited, rss):
+        self.governor = governor
+        self.name = name
+        self.estimate = estimate
+        self.waited = waited
+        self.start_rss = rss
+        self.peak_rss = rss
+        self.closed = False
+
+    def observe(self, rss):
+        if rss is not None and (self.peak_rss is None or rss > self.peak_rss):
+            self.peak_rss = rss
+
+    def usage(self):
+        """``{"estimated_mb", "peak_rss_mb", "rss_growth_mb", "waited_seconds"}``; RSS is None if unknown."""
+        growth = None
+        if self.peak_rss is not None and self.start_rss is not None:
+            growth = round((self.peak_rss - self.start_rss) / MB, 1)
+        return {
+            "estimated_mb": round(self.estimate / MB, 1),
+            "peak_rss_mb": round(self.peak_rss / MB, 1) if self.peak_rss is not None else None,
+            "rss_growth_mb": growth,
+            "waited_seconds": round(self.waited, 3),
+        }
+
+    def close(self):
+        """Give the scan's share back; safe to call more than once."""
+        self.governor._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ResourceGovernor:
+    """Admits scans while the sum of their memory estimates fits ``budget`` bytes (0: no limit)."""
+
+    def __init__(self, budget, sample_interval=0.1):
+        self.budget = budget
+        self.sample_interval = sample_interval
+        self.in_use = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.peak_scan_rss = 0
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._active = set()
+        self._sampler = None
+
+    def admit(self, name, estimate, timeout=None):
+        """Wait for room for ``estimate`` bytes and return the ``Admission``.
+
+        Raises OverBudget at once if it can never fit, or AdmissionTimeout
+        after ``timeout`` seconds (None waits as long as it takes).
+        """
+        if self.budget and estimate > self.budget:
+            with self._cond:
+                self.rejected += 1
+            raise OverBudget(f"{name} needs about {estimate / MB:.0f}MB to scan, "
+                             f"more than the {self.budget / MB:.0f}MB scan memory budget")
+        started = time.monotonic()
+        ticket = object()
+        with self._cond:
+            self._waiting.append(ticket)
+            try:
+                while self._waiting[0] is not ticket or not self._fits(estimate):
+                    remaining = None if timeout is None else started + timeout - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        self.timeouts += 1
+                        raise AdmissionTimeout(f"No room to scan {name} within {timeout:g}s; "
+                                               f"{self.in_use / MB:.0f}MB of {self.budget / MB:.0f}MB in use")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting.remove(ticket)
+                self._cond.notify_all()
+            admission = Admission(self, name, estimate, time.monotonic() - started, process_memory())
+            self.in_use += estimate
+            self._active.add(admission)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name="memory-sampler", daemon=True)
+                self._sampler.start()
+        if admission.waited > 1:
+            log.info("%s waited %.1fs for scan memory", name, admission.waited)
+        return admission
+
+    def _fits(self, estimate):
+        # An idle server takes any scan that passed the OverBudget check
+        return not self.budget or not self._active or self.in_use + estimate <= self.budget
+
+    def _release(self, admission):
+        with self._cond:
+            if admission.closed:
+                return
+            admission.closed = True
+            admission.observe(process_memory())
+            self._active.discard(admission)
+            self.in_use -= admission.estimate
+            if admission.peak_rss is not None:
+                self.peak_scan_rss = max(self.peak_scan_rss, admission.peak_rss)
+            self._cond.notify_all()
+        usage = admission.usage()
+        log.info("Scan memory for %s: estimated %sMB, peak RSS %sMB, %sMB above its start",
+                 admission.name, usage["estimated_mb"], usage["peak_rss_mb"], usage["rss_growth_mb"])
+
+    def _sample(self):
+        while True:
+            rss = process_memory()
+            with self._cond:
+                if not self._active:
+                    self._sampler = None
+                    return
+                for admission in self._active:
+                    admission.observe(rss)
+            time.sleep(self.sample_interval)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "budget_bytes": self.budget,
+                "admitted_bytes": self.in_use,
+                "scans_admitted": len(self._active),
+                "scans_waiting": len(self._waiting),
+                "scans_rejected": self.rejected,
+                "admission_timeouts": self.timeouts,
+                "peak_scan_rss_bytes": self.peak_scan_rss,
+            }
@@ -0,0 +1,78 @@
+import io
+import math
+import numpy as np
+import cv2
+from PIL import Image
+
+
+class ImageBuffer:
+    """Decoded pixels of one crop or embedded image, kept in memory.
+
+    ``rgb`` is an HxWx3 uint8 array; ``gray`` is computed once on first use
+    and shared by the QR and OCR stages. Buffers built from a Pixmap are
+    views over ``Pixmap.samples`` and keep the pixmap alive.
+    """
+
+    def __init__(self, rgb=None, gray=None, owner=None):
+        self._rgb = rgb
+        self._gray = gray
+        self._owner = owner
+
+    @classmethod
+    def from_pixmap(cls, pix):
+        pixels = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+        if pix.n == 1:
+            return cls(gray=pixels[:, :, 0], owner=pix)
+        # Drop alpha without copying; RGB(A) samples are already in RGB order
+        return cls(rgb=pixels[:, :, :3], owner=pix)
+
+    @classmethod
+    def from_pil(cls, image):
+        if image.mode in ("L", "1"):
+            return cls(gray=np.asarray(image.convert("L")))
+        return cls(rgb=np.asarray(image.convert("RGB")))
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls.from_pil(Image.open(io.BytesIO(data)))
+
+    @classmethod
+    def from_path(cls, path):
+        return cls.from_pil(Image.open(path))
+
+    @property
+    def rgb(self):
+        if self._rgb is None:
+            self._rgb = cv2.cvtColor(self._gray, cv2.COLOR_GRAY2RGB)
+        return self._rgb
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            self._gray = cv2.cvtColor(np.ascontiguousarray(self._rgb), cv2.COLOR_RGB2GRAY)
+        return self._gray
+
+    @property
+    def shape(self):
+        pixels = self._rgb if self._rgb is not None else self._gray
+        return pixels.shape[:2]
+
+    def limit_pixels(self, max_pixels):
+        """This buffer, or an INTER_AREA-downscaled copy holding at most ``max_pixels``."""
+        h, w = self.shape
+        if not max_pixels or h * w <= max_pixels:
+            return self
+        scale = math.sqrt(max_pixels / (h * w))
+        size = (max(1, int(w * scale)), max(1, int(h * scale)))
+        if self._rgb is not None:
+            return ImageBuffer(rgb=cv2.resize(np.ascontiguousarray(self._rgb), size, interpolation=cv2.INTER_AREA))
+        return ImageBuffer(gray=cv2.resize(self._gray, size, interpolation=cv2.INTER_AREA))
+
+
+def as_image_buffer(image):
+    """Accept an ImageBuffer, a numpy array (gray or RGB) or an image file path."""
+    if isinstance(image, ImageBuffer):
+        return image
+    if isinstance(image, np.ndarray):
+        return ImageBuffer(gray=image) if image.ndim == 2 else ImageBuffer(rgb=image[:, :, :3])
+    return ImageBuffer.from_path(image)
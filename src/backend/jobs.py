@@ -0,0 +1,127 @@
+import collections
+import logging
+import threading
+import queue
+import time
+import uuid
+
+
+log = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Raised when the job queue has no room for another scan."""
+
+
+class JobQueue:
+    """Bounded queue of background scans served by a fixed pool of worker threads.
+
+    Jobs are submitted as ``fn(*args, progress=callback, **kwargs)``; the
+    callback receives ``(done, total)`` and is exposed through ``get``.
+    ``fn`` is also passed ``usage``, a callback taking a dict of resource
+    figures (such as peak memory) shown as the job's ``usage``.
+    """
+
+    def __init__(self, workers=2, max_queued=8, keep_finished=200):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.keep_finished = keep_finished
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = {}
+        self._finished = collections.deque()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _start_workers(self):
+        # Started on first submit so gunicorn --preload doesn't leave the
+        # threads behind in the master process.
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"scan-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, fn, *args, **kwargs):
+        self._start_workers()
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "progress": {"done": 0, "total": None},
+            "usage": None,
+            "result": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        with self._lock:
+            try:
+                self._queue.put_nowait((job_id, fn, args, kwargs))
+            except queue.Full:
+                raise QueueFull(f"Scan queue is full ({self.max_queued} jobs waiting)")
+            self._jobs[job_id] = job
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            snapshot = dict(job)
+            snapshot["progress"] = dict(job["progress"])
+        snapshot["queue_position"] = self._position(job_id) if snapshot["status"] == "queued" else None
+        return snapshot
+
+    def stats(self):
+        with self._lock:
+            counts = collections.Counter(job["status"] for job in self._jobs.values())
+        return {
+            "workers": self.workers,
+            "max_queued": self.max_queued,
+            "queued": self._queue.qsize(),
+            "jobs": dict(counts),
+        }
+
+    def _position(self, job_id):
+        with self._queue.mutex:
+            for i, item in enumerate(self._queue.queue):
+                if item[0] == job_id:
+                    return i
+        return None
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+
+    def _run(self):
+        while True:
+            job_id, fn, args, kwargs = self._queue.get()
+            self._update(job_id, status="running", started_at=time.time())
+
+            def progress(done, total, _job_id=job_id):
+                self._update(_job_id, progress={"done": done, "total": total})
+
+            def usage(figures, _job_id=job_id):
+                self._update(_job_id, usage=dict(figures))
+
+            try:
+                result = fn(*args, progress=progress, usage=usage, **kwargs)
+                self._update(job_id, status="done", result=result, finished_at=time.time())
+            except Exception as e:
+                log.exception("Job %s failed: %s", job_id, e)
+                self._update(job_id, status="failed", error=str(e), finished_at=time.time())
+            finally:
+                self._queue.task_done()
+                self._retire(job_id)
+
+    def _retire(self, job_id):
+        # Keep only the most recent finished jobs so results don't pile up in memory.
+        with self._lock:
+            self._finished.append(job_id)
+            while len(self._finished) > self.keep_finished:
+                self._jobs.pop(self._finished.popleft(), None)
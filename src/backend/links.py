@@ -0,0 +1,73 @@
+import math
+import os
+
+# Grid cell size in PDF points; a typical link or image spans a handful of cells
+LINK_GRID_CELL = float(os.environ.get("LINK_GRID_CELL", 72))
+
+
+def overlaps(a, b):
+    """True when two [x0, y0, x1, y1] boxes share interior area (touching edges don't count)."""
+    return not (a[2] <= b[0] or a[0] >= b[2] or a[3] <= b[1] or a[1] >= b[3])
+
+
+class LinkIndex:
+    """URI link annotations of one page, bucketed on a uniform grid.
+
+    Built once per page from ``page.get_links()`` so every image on the
+    page can ask "which URI links intersect this rect" without re-parsing
+    the annotations or scanning every link.
+    """
+
+    def __init__(self, link_dicts, cell_size=LINK_GRID_CELL):
+        self.links = link_dicts
+        self.cell_size = cell_size
+        self.uri_links = []
+        self._grid = {}
+        self._unbucketed = []  # links too large (or malformed) to spread over cells
+        for i, ld in enumerate(link_dicts):
+            rect = ld.get("from")
+            uri = ld.get("uri")
+            if not (rect and uri and ld.get("kind") == 2):
+                continue
+            record = {
+                "index": i,
+                "uri": uri,
+                "rect": rect,
+                "bbox": [rect.x0, rect.y0, rect.x1, rect.y1],
+            }
+            position = len(self.uri_links)
+            self.uri_links.append(record)
+            cells = self._cells(record["bbox"])
+            if cells is None:
+                self._unbucketed.append(position)
+                continue
+            for cell in cells:
+                self._grid.setdefault(cell, []).append(position)
+
+    @classmethod
+    def for_page(cls, page, cell_size=LINK_GRID_CELL):
+        return cls(page.get_links(), cell_size)
+
+    def _cells(self, bbox, max_cells=1024):
+        """Grid cells covered by ``bbox``, or None if that would be unreasonably many."""
+        if not all(map(math.isfinite, bbox)):
+            return None
+        size = self.cell_size
+        cols = range(math.floor(bbox[0] / size), math.floor(bbox[2] / size) + 1)
+        rows = range(math.floor(bbox[1] / size), math.floor(bbox[3] / size) + 1)
+        if len(cols) * len(rows) > max_cells:
+            return None
+        return [(cx, cy) for cx in cols for cy in rows]
+
+    def query(self, area):
+        """URI link records overlapping ``area`` ([x0, y0, x1, y1]), in annotation order."""
+        cells = self._cells(area) if len(self.uri_links) > 4 else None
+        if cells is None:
+            # Few links (or a huge query area): a straight scan is cheaper
+            candidates = range(len(self.uri_links))
+        else:
+            candidates = set(self._unbucketed)
+            for cell in cells:
+                candidates.update(self._grid.get(cell, ()))
+            candidates = sorted(candidates)
+        return [self.uri_links[i] for i in candidates if overlaps(self.uri_links[i]["bbox"], area)]
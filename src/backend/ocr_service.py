@@ -0,0 +1,210 @@
+"""Shared EasyOCR model server.
+
+Run one (or a few) long-lived processes that hold the EasyOCR models::
+
+    python ocr_service.py --address /tmp/hidden-ocr.sock --threads 2
+
+and point the web workers at them with
+``OCR_SERVICE_ADDRESS=/tmp/hidden-ocr.sock`` (comma-separate several
+addresses to spread load). The scanner then uses ``OcrClient`` instead of
+loading its own ``easyocr.Reader``, so gunicorn workers stay small.
+
+Images travel over a ``multiprocessing.connection`` socket; anything larger
+than ``SHM_MIN_BYTES`` is handed over through shared memory instead of
+being pickled through the socket.
+
+Connections unpickle what they receive, so a ``host:port`` address needs a
+shared secret in ``OCR_SERVICE_AUTHKEY`` on both sides; the service won't
+listen on TCP without one.
+"""
+import argparse
+import itertools
+import logging
+import os
+import threading
+from multiprocessing import shared_memory
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+import telemetry
+
+# Required for TCP addresses; Unix sockets fall back to a fixed key and rely
+# on the socket file's permissions instead
+AUTHKEY = os.environ.get("OCR_SERVICE_AUTHKEY")
+UNIX_SOCKET_AUTHKEY = "hidden-image-tool"
+DEFAULT_ADDRESS = "/tmp/hidden-ocr.sock"
+SHM_MIN_BYTES = int(os.environ.get("OCR_SHM_MIN_BYTES", 256 * 1024))
+
+log = logging.getLogger(__name__)
+
+
+def parse_address(address):
+    """``host:port`` means TCP, anything else is a Unix socket path."""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and "/" not in address:
+        return (host or "127.0.0.1", int(port))
+    return address
+
+def authkey_for(address):
+    """Authkey for a parsed ``address``; raises ValueError for TCP without ``OCR_SERVICE_AUTHKEY``."""
+    if AUTHKEY:
+        return AUTHKEY.encode()
+    if isinstance(address, tuple):
+        raise ValueError(f"OCR_SERVICE_AUTHKEY must be set to use the OCR service over TCP "
+                         f"({address[0]}:{address[1]})")
+    return UNIX_SOCKET_AUTHKEY.encode()
+
+def _pack(image, blocks):
+    image = np.ascontiguousarray(image)
+    if image.nbytes < SHM_MIN_BYTES:
+        return ("array", image)
+    shm = shared_memory.SharedMemory(create=True, size=image.nbytes)
+    np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)[:] = image
+    blocks.append(shm)
+    return ("shm", shm.name, image.shape, image.dtype.str)
+
+def _unpack(payload, blocks):
+    if payload[0] == "array":
+        return payload[1]
+    _, name, shape, dtype = payload
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        # The client owns the block; stop this process's tracker from unlinking it
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    blocks.append(shm)
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+class OcrClient:
+    """Drop-in for the ``easyocr.Reader`` methods the scanner uses, backed by ocr_service."""
+
+    def __init__(self, addresses):
+        self.addresses = [parse_address(a.strip()) for a in addresses if a.strip()]
+        self.authkeys = [authkey_for(address) for address in self.addresses]
+        self._next = itertools.cycle(range(len(self.addresses)))
+        self._local = threading.local()
+
+    def _connection(self, index):
+        # One connection per thread per service: Connection objects aren't thread-safe
+        conns = getattr(self._local, "conns", None)
+        if conns is None:
+            conns = self._local.conns = {}
+        if index not in conns:
+            conns[index] = Client(self.addresses[index], authkey=self.authkeys[index])
+        return conns[index]
+
+    def _call(self, method, images, kwargs):
+        blocks = []
+        index = next(self._next)
+        try:
+            payloads = [_pack(image, blocks) for image in images]
+            for attempt in range(2):
+                try:
+                    conn = self._connection(index)
+                    conn.send((method, payloads, kwargs))
+                    status, result = conn.recv()
+                    break
+                except (EOFError, OSError):
+                    # Service restarted: drop the stale connection and retry once
+                    self._local.conns.pop(index, None)
+                    if attempt:
+                        raise
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+        if status != "ok":
+            raise RuntimeError(f"OCR service error: {result}")
+        return result
+
+    def readtext(self, image, **kwargs):
+        return self._call("readtext", [image], kwargs)[0]
+
+    def readtext_batched(self, images, **kwargs):
+        return self._call("readtext_batched", list(images), kwargs)
+
+    def ping(self):
+        return self._call("ping", [], {})
+
+
+def _handle(conn, reader, lock):
+    with conn:
+        while True:
+            try:
+                method, payloads, kwargs = conn.recv()
+            except (EOFError, OSError):
+                return
+            blocks = []
+            try:
+                images = [_unpack(p, blocks) for p in payloads]
+                with lock:
+                    if method == "readtext":
+                        result = [reader.readtext(images[0], **kwargs)]
+                    elif method == "readtext_batched":
+                        result = reader.readtext_batched(images, **kwargs)
+                    elif method == "ping":
+                        result = {"pid": os.getpid()}
+                    else:
+                        raise ValueError(f"Unknown method {method!r}")
+                reply = ("ok", result)
+            except Exception as e:
+                log.exception("OCR request %s failed", method)
+                reply = ("error", str(e))
+            finally:
+                images = None
+                for shm in blocks:
+                    shm.close()
+            try:
+                conn.send(reply)
+            except (EOFError, OSError):
+                return
+
+def serve(address, threads=None, gpu=False):
+    """Load EasyOCR and answer requests on ``address`` until killed.
+
+    Raises ValueError before loading anything when ``address`` is TCP and
+    ``OCR_SERVICE_AUTHKEY`` is not set.
+    """
+    address = parse_address(address)
+    authkey = authkey_for(address)
+
+    import torch
+    import easyocr
+
+    if threads:
+        # Keep torch from spreading every request over all cores
+        torch.set_num_threads(threads)
+    log.info("Initializing EasyOCR (torch threads: %d)...", torch.get_num_threads())
+    reader = easyocr.Reader(['en'], gpu=gpu)
+    lock = threading.Lock()
+
+    if isinstance(address, str) and os.path.exists(address):
+        os.remove(address)
+    with Listener(address, authkey=authkey) as listener:
+        log.info("OCR service ready on %s", address)
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                log.warning("OCR service accept failed: %s", e)
+                continue
+            threading.Thread(target=_handle, args=(conn, reader, lock), daemon=True).start()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared EasyOCR model server")
+    parser.add_argument("--address", default=os.environ.get("OCR_SERVICE_ADDRESS", DEFAULT_ADDRESS).split(",")[0],
+                        help="Unix socket path or host:port to listen on")
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("OCR_TORCH_THREADS", 0)) or None,
+                        help="torch intra-op threads (default: torch's own choice)")
+    parser.add_argument("--gpu", action="store_true", help="run EasyOCR on the GPU")
+    args = parser.parse_args()
+    try:
+        authkey_for(parse_address(args.address))
+    except ValueError as e:
+        parser.error(str(e))
+    telemetry.setup_logging()
+    serve(args.address, threads=args.threads, gpu=args.gpu)
@@ -0,0 +1,55 @@
+import re
+
+# "1-5,8,12-": single pages and ranges, open-ended at the end
+_RANGE_RE = re.compile(r"^(\d+)(?:(-)(\d*))?$")
+
+
+class PageRangeError(ValueError):
+    """Raised when page ranges select none of a document's pages."""
+
+
+def parse_page_spans(spec):
+    """``(first, last)`` pairs of ``spec`` ("1-5,8,12-"), ``last`` None for an open range.
+
+    Only checks the syntax, so it is safe on untrusted input before the page
+    count is known. Raises ValueError for anything that isn't a list of
+    pages and ranges.
+    """
+    spans = []
+    for part in spec.replace(" ", "").split(","):
+        match = _RANGE_RE.match(part)
+        if not match:
+            raise ValueError(f"Bad page range {part!r}; use pages and ranges like 1-5,8,12-")
+        first = int(match.group(1))
+        last = first
+        if match.group(2):
+            last = int(match.group(3)) if match.group(3) else None
+        if first < 1 or (last is not None and last < first):
+            raise ValueError(f"Bad page range {part!r}")
+        spans.append((first, last))
+    return spans
+
+def parse_page_ranges(spec, page_count):
+    """Page numbers of a ``page_count``-page document selected by ``spec``, sorted and without repeats.
+
+    Ranges are clamped to the document before they are expanded, so pages
+    past the end are dropped and cost nothing. Raises ValueError like
+    ``parse_page_spans``.
+    """
+    pages = set()
+    for first, last in parse_page_spans(spec):
+        last = page_count if last is None else min(last, page_count)
+        pages.update(range(first, last + 1))
+    return sorted(pages)
+
+def format_page_ranges(pages):
+    """The shortest spec for ``pages``, e.g. [1, 2, 3, 8] -> "1-3,8"; "" when empty."""
+    parts = []
+    pages = sorted(set(pages))
+    start = 0
+    for i in range(1, len(pages) + 1):
+        if i == len(pages) or pages[i] != pages[i - 1] + 1:
+            first, last = pages[start], pages[i - 1]
+            parts.append(str(first) if first == last else f"{first}-{last}")
+            start = i
+    return ",".join(parts)
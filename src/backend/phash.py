@@ -0,0 +1,208 @@
+"""Perceptual-hash index: find images that look like one analysed before.
+
+The same logo, store badge or QR sticker turns up in many PDFs with
+different bytes (re-encoded, rescaled), so the exact-hash image cache
+misses it. Analysed images are recorded here under their 64-bit dHash
+(scanner.py records only those in which OCR found no text, as look-alike
+banners can carry different URLs); a new image looks up entries within a
+few bits and the caller confirms a candidate with
+``ImageSignature.difference`` on small thumbnails before reusing its
+results. The hash alone is too coarse for that: two banners
+differing by one word of text usually hash within 2-3 bits of each other.
+
+The index is an append-only file of fixed-size records, read into numpy
+arrays, so a lookup is one vectorised XOR + popcount over all entries
+(about a millisecond per million). Reusing an entry appends it again,
+which makes file order the recency order; once the file holds a quarter
+more records than ``max_entries`` it is rewritten with the newest
+``max_entries`` distinct keys. Other processes' appends are picked up on
+the next lookup, so the page workers and the server share it (loosely,
+like DiskCache).
+"""
+import logging
+import os
+import threading
+import uuid
+
+import cv2
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+THUMB_SIDE = 192
+THUMB_BLOCK = 8
+# Candidates whose width/height ratio differs by more than this are skipped
+ASPECT_TOLERANCE = 0.05
+
+_RECORD = np.dtype([("hash", "<u8"), ("aspect", "<f4"), ("key", "V32")])
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:
+    _POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(values):
+        return _POPCOUNT8[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def dhash(gray):
+    """64-bit difference hash: signs of the horizontal gradients on a 9x8 grid."""
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = np.packbits(small[:, 1:] > small[:, :-1])
+    return int.from_bytes(bits.tobytes(), "big")
+
+
+class ImageSignature:
+    """dHash, aspect ratio and grey thumbnail (longest side ``THUMB_SIDE``) of one image."""
+
+    def __init__(self, hash, aspect, thumb):
+        self.hash = hash
+        self.aspect = aspect
+        self.thumb = thumb
+
+    @classmethod
+    def from_image(cls, image):
+        gray = image.gray
+        h, w = gray.shape
+        scale = min(1.0, THUMB_SIDE / max(h, w))
+        thumb = cv2.resize(gray, (max(1, round(w * scale)), max(1, round(h * scale))),
+                           interpolation=cv2.INTER_AREA)
+        return cls(dhash(gray), w / h, thumb)
+
+    def encode_thumbnail(self):
+        return cv2.imencode(".png", self.thumb)[1].tobytes()
+
+    def difference(self, thumb):
+        """Largest mean grey-level difference over ``THUMB_BLOCK``-pixel blocks.
+
+        Re-encoding or rescaling stays within a few levels everywhere; a
+        changed word or QR module makes at least one block differ a lot.
+        """
+        ours = self.thumb
+        if thumb.shape != ours.shape:
+            thumb = cv2.resize(thumb, (ours.shape[1], ours.shape[0]), interpolation=cv2.INTER_AREA)
+        diff = cv2.absdiff(cv2.GaussianBlur(ours, (3, 3), 0), cv2.GaussianBlur(thumb, (3, 3), 0))
+        block = min(THUMB_BLOCK, *diff.shape)
+        return float(cv2.blur(diff.astype(np.float32), (block, block)).max())
+
+
+class PerceptualIndex:
+    """Bounded, persistent dHash -> image key index with Hamming-distance lookup."""
+
+    def __init__(self, directory, max_entries):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.path = os.path.join(directory, "index.bin")
+        self.lookups = 0
+        self.matches = 0
+        self._lock = threading.Lock()
+        self._file_id = None  # (inode, bytes read) of the index file
+        self._count = 0
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._aspects = np.empty(0, dtype=np.float32)
+        self._keys = np.empty(0, dtype="V32")
+        os.makedirs(directory, exist_ok=True)
+
+    def _append(self, records):
+        needed = self._count + len(records)
+        if needed > len(self._hashes):
+            capacity = max(1024, needed, 2 * len(self._hashes))
+            self._hashes = np.resize(self._hashes, capacity)
+            self._aspects = np.resize(self._aspects, capacity)
+            self._keys = np.resize(self._keys, capacity)
+        end = self._count + len(records)
+        self._hashes[self._count:end] = records["hash"]
+        self._aspects[self._count:end] = records["aspect"]
+        self._keys[self._count:end] = records["key"]
+        self._count = end
+
+    def _refresh(self):
+        """Read records appended since the last call (by any process); reload after a rewrite."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return
+        inode, offset = self._file_id or (None, 0)
+        if inode != st.st_ino or st.st_size < offset:
+            self._count, offset = 0, 0
+        available = (st.st_size - offset) // _RECORD.itemsize
+        if available:
+            records = np.fromfile(self.path, dtype=_RECORD, count=available, offset=offset)
+            self._append(records)
+            offset += len(records) * _RECORD.itemsize
+        self._file_id = (st.st_ino, offset)
+        if self._count > self.max_entries * 1.25:
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the file with the newest ``max_entries`` distinct keys."""
+        keys = self._keys[:self._count]
+        # np.unique keeps the first occurrence, so search newest-first
+        _, newest = np.unique(keys[::-1], return_index=True)
+        keep = np.sort(self._count - 1 - newest)[-self.max_entries:]
+        records = np.empty(len(keep), dtype=_RECORD)
+        records["hash"] = self._hashes[keep]
+        records["aspect"] = self._aspects[keep]
+        records["key"] = keys[keep]
+        tmp = os.path.join(self.directory, f".index.{uuid.uuid4().hex}")
+        try:
+            records.tofile(tmp)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            log.warning("Rewriting %s failed: %s", self.path, e)
+            return
+        log.info("Perceptual index compacted: %d -> %d entries", self._count, len(records))
+        self._count = 0
+        self._append(records)
+        self._file_id = (os.stat(self.path).st_ino, len(records) * _RECORD.itemsize)
+
+    def _write(self, hash, aspect, key):
+        record = np.array([(hash, aspect, bytes.fromhex(key))], dtype=_RECORD)
+        try:
+            with open(self.path, "ab") as f:
+                f.write(record.tobytes())
+        except OSError as e:
+            log.warning("Perceptual index write failed for %s: %s", key[:12], e)
+
+    def find(self, signature, max_distance, limit=3):
+        """Keys of up to ``limit`` entries within ``max_distance`` bits, closest (then newest) first."""
+        with self._lock:
+            self._refresh()
+            self.lookups += 1
+            if not self._count:
+                return []
+            distances = _popcount(self._hashes[:self._count] ^ np.uint64(signature.hash))
+            near = np.flatnonzero(distances <= max_distance)
+            if len(near):
+                ratio = np.abs(np.log(self._aspects[near] / signature.aspect))
+                near = near[ratio <= ASPECT_TOLERANCE]
+            order = near[np.lexsort((-near, distances[near]))]
+            keys = []
+            for position in order:
+                key = self._keys[position].tobytes().hex()
+                if key not in keys:
+                    keys.append(key)
+                    if len(keys) == limit:
+                        break
+            return keys
+
+    def add(self, signature, key):
+        with self._lock:
+            self._write(signature.hash, signature.aspect, key)
+
+    def touch(self, signature, key):
+        """Record a reuse of ``key``; recently reused entries survive compaction."""
+        with self._lock:
+            self.matches += 1
+            self._write(signature.hash, signature.aspect, key)
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            return {
+                "records": self._count,
+                "max_entries": self.max_entries,
+                "lookups": self.lookups,
+                "matches": self.matches,
+                "match_rate": round(self.matches / self.lookups, 3) if self.lookups else None,
+            }
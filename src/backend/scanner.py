@@ -0,0 +1,1858 @@
+import os
+import collections
+import fitz  # PyMuPDF
+from PIL import Image
+import numpy as np
+import re
+import io
+import cv2
+import math
+import time
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from cache import DiskCache, sha256_bytes, sha256_file
+from images import ImageBuffer, as_image_buffer
+from ocr_service import OcrClient
+from config import BACKEND_URL, BASE_DIR
+from artifacts import artifact_store
+from links import LinkIndex
+from barcodes import detect_codes
+from extraction import EmbeddedImage
+from phash import ImageSignature, PerceptualIndex
+from pageranges import PageRangeError, format_page_ranges, parse_page_ranges
+from telemetry import count, timer
+import telemetry
+
+log = logging.getLogger(__name__)
+
+# Page-parallel scanning: worker processes each open their own fitz document
+SCAN_PROCESSES = int(os.environ.get("SCAN_PROCESSES", 1))
+PARALLEL_MIN_PAGES = int(os.environ.get("PARALLEL_MIN_PAGES", 4))
+_process_pool = None
+
+# Batch scans interleave BATCH_CHUNK_PAGES-page chunks of every document, so a
+# long document holds the workers for one chunk at a time, not for its length
+BATCH_CHUNK_PAGES = int(os.environ.get("BATCH_CHUNK_PAGES", 4))
+
+# Batched OCR: crops are grouped into size buckets of OCR_BUCKET_STEP pixels.
+# Crops waiting for OCR across pages are OCR'd early once they hold
+# OCR_PENDING_PIXELS, so a long document never keeps all its pixels at once.
+OCR_BATCH_SIZE = int(os.environ.get("OCR_BATCH_SIZE", 8))
+OCR_BUCKET_STEP = int(os.environ.get("OCR_BUCKET_STEP", 64))
+OCR_PENDING_PIXELS = int(os.environ.get("OCR_PENDING_PIXELS", 32_000_000))
+
+# OCR triage: a cheap edge-density check decides whether an image is worth
+# OCR at all, and whether the enhanced (upscaled, thresholded) retry is.
+# Densities are measured per OCR_TRIAGE_TILE-pixel tile of a copy shrunk to
+# OCR_TRIAGE_MAX_SIDE, and the busiest tile counts, so one line of text on a
+# big banner is not averaged away. Set OCR_TRIAGE=0 to OCR everything, e.g.
+# when measuring recall.
+OCR_TRIAGE = os.environ.get("OCR_TRIAGE", "1") != "0"
+OCR_MIN_SIDE = int(os.environ.get("OCR_MIN_SIDE", 8))
+OCR_MIN_CONTRAST = float(os.environ.get("OCR_MIN_CONTRAST", 8))
+OCR_MIN_EDGE_DENSITY = float(os.environ.get("OCR_MIN_EDGE_DENSITY", 0.01))
+OCR_RETRY_MIN_EDGE_DENSITY = float(os.environ.get("OCR_RETRY_MIN_EDGE_DENSITY", 0.04))
+OCR_TRIAGE_MAX_SIDE = 1024
+OCR_TRIAGE_TILE = 64
+
+# Crop resolution: link areas are rendered so their short side (roughly the
+# height of the text inside) reaches RENDER_TARGET_PX, within
+# [RENDER_MIN_ZOOM, RENDER_MAX_ZOOM]. A rect's short side says little about
+# its text size once it is large, so zoom never drops below the fixed 2x the
+# crops were always rendered at. Nothing handed to QR/OCR, including
+# embedded images and the upscaled OCR retry, exceeds OCR_PIXEL_BUDGET pixels.
+RENDER_TARGET_PX = int(os.environ.get("RENDER_TARGET_PX", 96))
+RENDER_MIN_ZOOM = float(os.environ.get("RENDER_MIN_ZOOM", 2))
+RENDER_MAX_ZOOM = float(os.environ.get("RENDER_MAX_ZOOM", 4))
+OCR_PIXEL_BUDGET = int(os.environ.get("OCR_PIXEL_BUDGET", 4_000_000))
+
+# Full-page mode renders each page at FULL_PAGE_DPI (within OCR_PIXEL_BUDGET
+# times FULL_PAGE_BUDGET_FACTOR), cuts it into overlapping FULL_PAGE_TILE
+# squares and stops starting new tiles once FULL_PAGE_TIME_BUDGET seconds
+# have been spent on the page.
+FULL_PAGE_DPI = int(os.environ.get("FULL_PAGE_DPI", 200))
+FULL_PAGE_BUDGET_FACTOR = 4
+FULL_PAGE_TILE = int(os.environ.get("FULL_PAGE_TILE", 1024))
+FULL_PAGE_OVERLAP = int(os.environ.get("FULL_PAGE_OVERLAP", 160))
+FULL_PAGE_TIME_BUDGET = float(os.environ.get("FULL_PAGE_TIME_BUDGET", 30))
+FULL_PAGE_WORKERS = int(os.environ.get("FULL_PAGE_WORKERS", 4))
+
+# Memory estimates for admission control (estimate_scan_memory): a crop held
+# for QR/OCR costs SCAN_BYTES_PER_PIXEL (RGB plus grey), an image decoded at
+# full size before downscaling DECODE_BYTES_PER_PIXEL while that lasts, and
+# every scanning process SCAN_BASE_MB for the PDF, OCR buffers and report.
+SCAN_BYTES_PER_PIXEL = 4
+DECODE_BYTES_PER_PIXEL = 8
+SCAN_BASE_MB = int(os.environ.get("SCAN_BASE_MB", 64))
+
+# Per-scan options; scan_pdf accepts any of these as keyword arguments
+DEFAULT_SCAN_OPTIONS = {
+    "use_cache": True,    # look up the report and per-image caches
+    "save_images": True,  # give entries image URLs the client fetches from /images
+    "namespace": None,    # artifact namespace for embedded images (a new one per scan)
+    "document": None,     # PDF content hash naming lazily rendered images (set by scan_pdf)
+    "text_layer": True,   # read text/URLs from the PDF text layer before OCR
+    "full_page": False,   # render whole pages and scan them tile by tile
+    "pages": None,        # page selection such as "1-5,8,12-" (default: every page)
+    "max_pages": None,    # scan at most this many of the selected pages
+    "deadline": None,     # wall-clock budget in seconds; the scan stops cleanly when it runs out
+    "stop_at": None,      # time.time() at which the deadline runs out (set by scan_pdf)
+}
+
+# Two-level result cache: whole reports by PDF hash, QR/OCR results by image hash.
+# Bump CACHE_VERSION whenever the pipeline's output changes.
+CACHE_VERSION = 5
+CACHE_DIR = os.environ.get("CACHE_DIR", os.path.join(BASE_DIR, "cache"))
+report_cache = DiskCache(os.path.join(CACHE_DIR, f"reports-v{CACHE_VERSION}"),
+                         int(os.environ.get("REPORT_CACHE_MB", 512)) * 1024 * 1024)
+image_cache = DiskCache(os.path.join(CACHE_DIR, f"images-v{CACHE_VERSION}"),
+                        int(os.environ.get("IMAGE_CACHE_MB", 256)) * 1024 * 1024)
+
+# Near-duplicate reuse: an image that looks like one analysed before (the
+# same logo or badge re-encoded in another PDF) takes its QR/OCR results
+# from image_cache. Candidates within PHASH_MAX_DISTANCE bits of its dHash
+# must also match the stored thumbnail within PHASH_MAX_DIFF grey levels
+# (see phash.py); reused QR codes are decoded again and must agree. Only
+# images whose OCR found no text are indexed: look-alike banners can carry
+# different URLs (".../item/4821" vs ".../item/4827"), so text is only ever
+# reused on an exact content-hash match.
+PHASH_INDEX = os.environ.get("PHASH_INDEX", "1") != "0"
+PHASH_MAX_DISTANCE = int(os.environ.get("PHASH_MAX_DISTANCE", 6))
+PHASH_MAX_DIFF = float(os.environ.get("PHASH_MAX_DIFF", 16))
+PHASH_MIN_SIDE = 16
+phash_index = PerceptualIndex(os.path.join(CACHE_DIR, f"phash-v{CACHE_VERSION}"),
+                              int(os.environ.get("PHASH_INDEX_ENTRIES", 1_000_000)))
+
+# Lazy images: link areas and full-page renders are not encoded during the
+# scan. Their URLs name the PDF (by content hash), page, clip and zoom, and
+# are rendered on first request from the copy kept in document_cache; the
+# PNGs (and thumbnails, in THUMBNAIL_SIZES only) land in render_cache.
+document_cache = DiskCache(os.path.join(CACHE_DIR, "documents"),
+                           int(os.environ.get("DOCUMENT_CACHE_MB", 1024)) * 1024 * 1024)
+render_cache = DiskCache(os.path.join(CACHE_DIR, f"renders-v{CACHE_VERSION}"),
+                         int(os.environ.get("RENDER_CACHE_MB", 512)) * 1024 * 1024)
+THUMBNAIL_SIZES = (128, 256, 512)
+_RENDER_SPEC_RE = re.compile(r"^p(\d+)_(-?\d+\.\d+)_(-?\d+\.\d+)_(-?\d+\.\d+)_(-?\d+\.\d+)_z(\d+\.\d+)\.png$")
+_PDF_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# OCR_SERVICE_ADDRESS points at running ocr_service processes that share one
+# copy of the models; without it every process loads its own EasyOCR reader.
+OCR_SERVICE_ADDRESS = os.environ.get("OCR_SERVICE_ADDRESS")
+OCR_TORCH_THREADS = int(os.environ.get("OCR_TORCH_THREADS", 0))
+
+_reader = None
+_reader_lock = threading.Lock()
+
+def get_reader():
+    """Build the OCR reader on first use; easyocr and torch are only imported here."""
+    global _reader
+    with _reader_lock:
+        if _reader is None:
+            if OCR_SERVICE_ADDRESS:
+                log.info("Using OCR service at %s", OCR_SERVICE_ADDRESS)
+                _reader = OcrClient(OCR_SERVICE_ADDRESS.split(","))
+            else:
+                import easyocr
+                if OCR_TORCH_THREADS:
+                    import torch
+                    torch.set_num_threads(OCR_TORCH_THREADS)
+                log.info("Initializing EasyOCR...")
+                _reader = easyocr.Reader(['en'], gpu=False)
+                log.info("EasyOCR ready!")
+        return _reader
+
+def render_zoom(rect):
+    """Zoom for rendering ``rect``: enough for its text, never beyond the pixel budget."""
+    short_side = max(min(rect.width, rect.height), 1)
+    zoom = min(max(RENDER_TARGET_PX / short_side, RENDER_MIN_ZOOM), RENDER_MAX_ZOOM)
+    budget_zoom = math.sqrt(OCR_PIXEL_BUDGET / max(rect.width * rect.height, 1))
+    return min(zoom, budget_zoom)
+
+def preprocess_image_for_ocr(image):
+    try:
+        gray = as_image_buffer(image).gray
+        # 2x upscale for small text, shrunk to fit the pixel budget
+        scale = min(2, math.sqrt(OCR_PIXEL_BUDGET / gray.size))
+        if scale > 1:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+        binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+        return binary
+    except Exception as e:
+        log.warning("Preprocessing failed: %s", e)
+        return None
+
+def extract_qr_codes(image):
+    """QR codes and barcodes in ``image``, each with its ``image_bbox``.
+
+    ``image_bbox`` is ``[x0, y0, x1, y1]`` as fractions of the image's width
+    and height, so it holds for the served image whatever resolution was analysed.
+    """
+    links = []
+    try:
+        gray = as_image_buffer(image).gray
+        h, w = gray.shape[:2]
+        with timer("qr"):
+            codes = detect_codes(gray)
+        for kind, data, (x0, y0, x1, y1) in codes:
+            try:
+                content = data.decode("utf-8").strip()
+                if content:
+                    links.append({
+                        "type": f"{kind}",
+                        "content": content,
+                        "description": f"{kind} detected",
+                        "image_bbox": [round(x0 / w, 4), round(y0 / h, 4), round(x1 / w, 4), round(y1 / h, 4)]
+                    })
+                    log.debug("Found %s: %.50s", kind, content)
+            except Exception as e:
+                log.warning("Decoding QR: %s", e)
+    except Exception as e:
+        log.warning("QR extraction: %s", e)
+    return links
+
+URL_PATTERN = r'https?://[^\s<>"{}|\\^`\[\]]+'
+WWW_PATTERN = r'www\.[a-zA-Z0-9][a-zA-Z0-9-]+\.[a-zA-Z]{2,}'
+
+def clean_url(u):
+    return u.strip().rstrip('.,;:!?)"]\'')
+
+def collect_ocr_links(ocr_results, links, all_text, enhanced=False):
+    """Append URLs and text from one EasyOCR pass to ``links`` / ``all_text``."""
+    for bbox, text, confidence in ocr_results:
+        text = text.strip()
+        if text and confidence > 0.3:
+            all_text.append(text)
+            log.debug("OCR%s: %r (confidence: %.2f)", " (enhanced)" if enhanced else "", text, confidence)
+
+            for url in re.findall(URL_PATTERN, text, re.IGNORECASE):
+                url = clean_url(url)
+                if len(url) > 10:
+                    links.append({
+                        "type": "url",
+                        "content": url,
+                        "description": "URL found (enhanced scan)" if enhanced else "URL found in image text",
+                        "confidence": round(confidence, 2)
+                    })
+                    log.debug("Found URL%s: %s", " (enhanced)" if enhanced else "", url)
+            
+            if enhanced:
+                continue
+            for url in re.findall(WWW_PATTERN, text, re.IGNORECASE):
+                url = clean_url(url)
+                full_url = f"https://{url}"
+                links.append({
+                    "type": "url",
+                    "content": full_url,
+                    "description": "URL found in image text",
+                    "confidence": round(confidence, 2)
+                })
+                log.debug("Found www URL: %s", full_url)
+
+def finalize_ocr_links(links, all_text):
+    """Fall back to plain text when no URL was found, then dedupe by content."""
+    if not links and all_text:
+        combined = " ".join(all_text[:3])
+        links.append({
+            "type": "text",
+            "content": combined[:250],
+            "description": "Text detected (no URLs found)"
+        })
+        log.debug("No URLs found, returning text content: %s", combined)
+    
+    seen = set()
+    unique_links = []
+    for link in links:
+        if link["content"] not in seen:
+            seen.add(link["content"])
+            unique_links.append(link)
+    return unique_links
+
+def ocr_triage(image):
+    """Decide cheaply whether OCR is worth running on ``image``.
+
+    Works on a downscaled copy of the shared gray buffer, split into tiles:
+    an image is worth OCR if any tile has both contrast and Canny edges, so
+    a single line of text on a large flat banner still counts. Images that
+    are tiny or nowhere textured are unlikely to hold text.
+    Returns ``(run_ocr, allow_retry, edge_density)``, the density being
+    that of the busiest tile.
+    """
+    if not OCR_TRIAGE:
+        return True, True, None
+    gray = as_image_buffer(image).gray
+    h, w = gray.shape[:2]
+    if min(h, w) < OCR_MIN_SIDE:
+        return False, False, 0.0
+    scale = OCR_TRIAGE_MAX_SIDE / max(h, w)
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    if gray.std() == 0:
+        return False, False, 0.0
+    edges = cv2.Canny(gray, 100, 200)
+    tiles = tile_view(edges > 0)
+    contrast = tile_view(gray.astype(np.float32)).std(axis=(1, 3))
+    density = tiles.mean(axis=(1, 3))
+    density[contrast < OCR_MIN_CONTRAST] = 0
+    density = float(density.max())
+    return density >= OCR_MIN_EDGE_DENSITY, density >= OCR_RETRY_MIN_EDGE_DENSITY, density
+
+def tile_view(array):
+    """``array`` cut into OCR_TRIAGE_TILE squares, as ``(rows, tile, cols, tile)``.
+
+    A remainder narrower than a tile is covered by one more tile shifted
+    back inside the image, overlapping its neighbour.
+    """
+    h, w = array.shape[:2]
+    th, tw = min(OCR_TRIAGE_TILE, h), min(OCR_TRIAGE_TILE, w)
+    rows, cols = h // th, w // tw
+    if h % th:
+        array = np.concatenate([array[:rows * th], array[h - th:]], axis=0)
+        rows += 1
+    if w % tw:
+        array = np.concatenate([array[:, :cols * tw], array[:, w - tw:]], axis=1)
+        cols += 1
+    return array.reshape(rows, th, cols, tw)
+
+def page_words(page):
+    """Words of the page's text layer as ``(x0, y0, x1, y1, text, block, line, word)``."""
+    try:
+        return page.get_text("words", sort=True)
+    except Exception as e:
+        log.warning("Text layer extraction failed: %s", e)
+        return []
+
+def text_layer_links(words, area):
+    """URLs and text from text-layer ``words`` whose centre lies inside ``area``.
+
+    Returns links in the same shape as ``extract_text_and_urls``, or [] when
+    the area holds no vector text and OCR is needed.
+    """
+    lines = {}
+    for x0, y0, x1, y1, word, block_no, line_no, _ in words:
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        if area[0] <= cx <= area[2] and area[1] <= cy <= area[3]:
+            lines.setdefault((block_no, line_no), []).append(word)
+    if not lines:
+        return []
+
+    links = []
+    all_text = []
+    for line_words in lines.values():
+        text = " ".join(line_words).strip()
+        if not text:
+            continue
+        all_text.append(text)
+        for url in re.findall(URL_PATTERN, text, re.IGNORECASE):
+            url = clean_url(url)
+            if len(url) > 10:
+                links.append({"type": "url", "content": url, "description": "URL found in PDF text"})
+        for url in re.findall(WWW_PATTERN, text, re.IGNORECASE):
+            links.append({"type": "url", "content": f"https://{clean_url(url)}",
+                          "description": "URL found in PDF text"})
+    if not links and all_text:
+        links.append({
+            "type": "text",
+            "content": " ".join(all_text[:3])[:250],
+            "description": "Text found in PDF text layer"
+        })
+    log.debug("Text layer: %d line(s), %d link(s) in area", len(all_text), len(links))
+    return dedupe_links(links)
+
+def extract_text_and_urls(image):
+    links = []
+    all_text = []
+    try:
+        image = as_image_buffer(image)
+        run_ocr, allow_retry, density = ocr_triage(image)
+        if not run_ocr:
+            log.debug("Skipping OCR: unlikely to contain text (edge density %.3f)", density)
+            count("ocr_skipped")
+            return []
+        reader = get_reader()
+        img_array = image.rgb
+        with timer("ocr"):
+            ocr_results = reader.readtext(img_array, detail=1, paragraph=False)
+        count("ocr_images")
+        log.debug("Found %d text blocks", len(ocr_results))
+        collect_ocr_links(ocr_results, links, all_text)
+        
+        if not links and not all_text and allow_retry:
+            log.debug("No text found, trying preprocessed image...")
+            with timer("ocr_enhanced"):
+                preprocessed = preprocess_image_for_ocr(image)
+                if preprocessed is not None:
+                    ocr_results = reader.readtext(preprocessed, detail=1, paragraph=False)
+            if preprocessed is not None:
+                log.debug("Preprocessed OCR found %d text blocks", len(ocr_results))
+                collect_ocr_links(ocr_results, links, all_text, enhanced=True)
+        
+        return finalize_ocr_links(links, all_text)
+    except Exception:
+        log.exception("OCR extraction failed")
+        return None  # not "no text": see readtext_batched
+
+def _ocr_bucket(img):
+    # Crops are padded up to a shared size so readtext_batched can stack them
+    h, w = img.shape[:2]
+    step = OCR_BUCKET_STEP
+    return (img.ndim, math.ceil(h / step) * step, math.ceil(w / step) * step)
+
+def _pad_to(img, height, width):
+    h, w = img.shape[:2]
+    if (h, w) == (height, width):
+        return img
+    pad = ((0, height - h), (0, width - w)) + ((0, 0),) * (img.ndim - 2)
+    return np.pad(img, pad, mode="constant", constant_values=255)
+
+def readtext_batched(images):
+    """Run EasyOCR over many images, grouped by size, returning results in input order.
+
+    An image whose OCR failed (every image, when the reader can't be loaded)
+    gets None rather than [], so callers can tell "no text" from "not read"
+    and don't cache the latter.
+    """
+    try:
+        reader = get_reader()
+    except Exception as e:
+        log.error("OCR reader unavailable: %s", e)
+        return [None for _ in images]
+    results = [[] for _ in images]
+    groups = {}
+    for idx, img in enumerate(images):
+        groups.setdefault(_ocr_bucket(img), []).append(idx)
+
+    for (_, height, width), indexes in groups.items():
+        for start in range(0, len(indexes), OCR_BATCH_SIZE):
+            batch = indexes[start:start + OCR_BATCH_SIZE]
+            try:
+                if len(batch) == 1:
+                    # A lone crop goes through readtext unpadded, exactly as before
+                    out = [reader.readtext(images[batch[0]], detail=1, paragraph=False)]
+                else:
+                    padded = [_pad_to(images[i], height, width) for i in batch]
+                    out = reader.readtext_batched(padded, detail=1, paragraph=False, batch_size=len(batch))
+                for i, ocr_results in zip(batch, out):
+                    results[i] = ocr_results
+            except Exception as e:
+                log.warning("Batched OCR failed (%d images at %dx%d): %s", len(batch), width, height, e)
+                for i in batch:
+                    try:
+                        results[i] = reader.readtext(images[i], detail=1, paragraph=False)
+                    except Exception as e:
+                        log.warning("OCR extraction: %s", e)
+                        results[i] = None
+    return results
+
+def extract_text_and_urls_batch(images, stats=None, read=None):
+    """Batched equivalent of ``extract_text_and_urls`` for a list of images.
+
+    Images rejected by ``ocr_triage`` are not OCR'd; ``stats`` (a dict), if
+    given, is incremented with ``ocr_images``, ``ocr_skipped`` and ``retry_skipped``,
+    and ``read`` (a set), if given, collects the indexes of the images sent to OCR.
+    Images that couldn't be loaded or OCR'd get None instead of a link list.
+    """
+    stats = stats if stats is not None else {}
+    if not images:
+        return []
+    buffers = []
+    for image in images:
+        try:
+            buffers.append(as_image_buffer(image))
+        except Exception as e:
+            log.warning("OCR extraction: %s", e)
+            buffers.append(None)
+
+    loaded = []
+    allow_retry = set()
+    for i, buf in enumerate(buffers):
+        if buf is None:
+            continue
+        try:
+            run_ocr, retry_ok, _ = ocr_triage(buf)
+        except Exception as e:
+            log.warning("OCR triage failed, running OCR anyway: %s", e)
+            run_ocr, retry_ok = True, True
+        if run_ocr:
+            loaded.append(i)
+            if retry_ok:
+                allow_retry.add(i)
+    skipped = sum(buf is not None for buf in buffers) - len(loaded)
+    if read is not None:
+        read.update(loaded)
+    stats["ocr_images"] = stats.get("ocr_images", 0) + len(loaded)
+    stats["ocr_skipped"] = stats.get("ocr_skipped", 0) + skipped
+    log.debug("Running batched OCR on %d images (%d skipped by triage)", len(loaded), skipped)
+    with timer("ocr"):
+        first_pass = dict(zip(loaded, readtext_batched([buffers[i].rgb for i in loaded])))
+
+    links = [[] for _ in images]
+    all_text = [[] for _ in images]
+    failed = {i for i, buf in enumerate(buffers) if buf is None}
+    for i, ocr_results in first_pass.items():
+        if ocr_results is None:
+            failed.add(i)
+        else:
+            collect_ocr_links(ocr_results, links[i], all_text[i])
+
+    # Enhanced retry only for images where the first pass found nothing
+    retry = []
+    started = time.perf_counter()
+    for i in loaded:
+        if i not in failed and not links[i] and not all_text[i]:
+            if i not in allow_retry:
+                stats["retry_skipped"] = stats.get("retry_skipped", 0) + 1
+                continue
+            preprocessed = preprocess_image_for_ocr(buffers[i])
+            if preprocessed is not None:
+                retry.append((i, preprocessed))
+    if retry:
+        log.debug("No text found in %d images, trying preprocessed images", len(retry))
+        second_pass = readtext_batched([img for _, img in retry])
+        telemetry.add_time("ocr_enhanced", time.perf_counter() - started)
+        for (i, _), ocr_results in zip(retry, second_pass):
+            if ocr_results is None:
+                failed.add(i)
+            else:
+                collect_ocr_links(ocr_results, links[i], all_text[i], enhanced=True)
+
+    return [None if i in failed else finalize_ocr_links(links[i], all_text[i]) if i in first_pass else []
+            for i in range(len(images))]
+
+def extract_pdf_links_for_area(link_index, image_area, slice_index):
+    """PDF structural links overlapping ``image_area``, looked up in the page's LinkIndex."""
+    links = []
+    with timer("link_match"):
+        for record in link_index.query(image_area):
+            links.append({
+                "content": record["uri"],
+                "type": "pdf_structural",
+                "bbox": record["bbox"],
+                "description": "PDF structural link"
+            })
+    log.debug("Found %d matching links for slice %s (%d URI links on page)",
+              len(links), slice_index, len(link_index.uri_links))
+    return links
+
+def dedupe_links(links):
+    seen = set()
+    unique_links = []
+    for link in links:
+        content = link["content"]
+        if content not in seen:
+            seen.add(content)
+            unique_links.append(link)
+    return unique_links
+
+def set_entry_links(entry, links):
+    unique_links = dedupe_links(links)
+    entry["extracted_links"] = unique_links
+    entry["clickable_links_found"] = len(unique_links) > 0
+    return unique_links
+
+def pixmap_key(pix):
+    """Content hash of a rendered crop: its raw samples plus geometry."""
+    digest = hashlib.sha256(f"{pix.width}x{pix.height}x{pix.n}:".encode())
+    digest.update(pix.samples_mv)
+    return digest.hexdigest()
+
+def image_signature(image):
+    """Perceptual signature for the near-duplicate index, or None when it doesn't apply."""
+    if not PHASH_INDEX or min(image.shape) < PHASH_MIN_SIDE:
+        return None
+    return ImageSignature.from_image(image)
+
+def find_similar_analysis(signature):
+    """Cached results of an earlier text-free image that looks like ``signature``'s, or None."""
+    for key in phash_index.find(signature, PHASH_MAX_DISTANCE):
+        thumb = cv2.imread(image_cache.attachment(key, "thumb.png"), cv2.IMREAD_GRAYSCALE)
+        if thumb is None or signature.difference(thumb) > PHASH_MAX_DIFF:
+            continue
+        cached = image_cache.get(key)
+        if cached is not None and not cached["ocr"]:
+            return key, cached
+    return None
+
+def analyze_image(entry, image, image_key, pending_ocr, use_cache=True, run_ocr=True):
+    """Add QR results to ``entry``, queue it for OCR and return the shared analysis record."""
+    cached = image_cache.get(image_key) if use_cache else None
+    if cached is not None:
+        log.debug("Image cache hit for %s", entry["filename"])
+        count("image_cache_hits")
+        set_entry_links(entry, entry["extracted_links"] + cached["qr"] + cached["ocr"])
+        return {"entries": [entry], "image": None, "image_key": image_key,
+                "qr": cached["qr"], "ocr": cached["ocr"], "signature": None}
+    signature = image_signature(image) if use_cache and run_ocr else None
+    similar = find_similar_analysis(signature) if signature is not None else None
+    qr_links = None
+    if similar is not None:
+        similar_key, cached = similar
+        # Distinct QR codes can look alike at thumbnail size; their payloads must agree
+        if cached["qr"]:
+            qr_links = extract_qr_codes(image)
+        if not cached["qr"] or {link["content"] for link in qr_links} == {link["content"] for link in cached["qr"]}:
+            log.debug("Near-duplicate of %s: %s", similar_key[:12], entry["filename"])
+            count("similar_image_hits")
+            phash_index.touch(signature, similar_key)
+            image_cache.put(image_key, cached)
+            set_entry_links(entry, entry["extracted_links"] + cached["qr"] + cached["ocr"])
+            return {"entries": [entry], "image": None, "image_key": image_key,
+                    "qr": cached["qr"], "ocr": cached["ocr"], "signature": None}
+    if qr_links is None:
+        qr_links = extract_qr_codes(image)
+    set_entry_links(entry, entry["extracted_links"] + qr_links)
+    if not run_ocr:
+        # Text came from the PDF text layer: not queued or cached, and not shared with a placement needing OCR
+        return {"entries": [entry], "image": None, "image_key": image_key, "qr": qr_links, "ocr": [],
+                "signature": None, "text_layer_only": True}
+    analysis = {"entries": [entry], "image": image, "image_key": image_key, "qr": qr_links, "ocr": None,
+                "signature": signature, "cache": use_cache}
+    pending_ocr.append(analysis)
+    return analysis
+
+def attach_analysis(entry, analysis):
+    """Reuse an earlier analysis of the same image for another placement."""
+    set_entry_links(entry, entry["extracted_links"] + analysis["qr"] + (analysis["ocr"] or []))
+    if analysis["ocr"] is None:
+        analysis["entries"].append(entry)
+    elif analysis.get("ocr_error"):
+        entry["ocr_error"] = analysis["ocr_error"]
+
+def run_pending_ocr(pending_ocr, stats=None, stop_at=None):
+    """Batch-OCR every deferred crop and merge its findings into its image entries.
+
+    Triage counts are added to ``stats`` (see ``extract_text_and_urls_batch``)
+    and each analysis OCR actually ran on is marked ``ocr_read``.
+    With a ``stop_at`` deadline crops go ``OCR_BATCH_SIZE`` at a time, and
+    those still waiting when it passes keep only their QR results: their
+    entries are marked ``"truncated": true`` and nothing is cached for them.
+    Crops whose OCR failed aren't cached either; their entries get an
+    ``ocr_error`` that ``note_ocr_errors`` moves into the page's ``errors``.
+    """
+    step = OCR_BATCH_SIZE if stop_at is not None else max(1, len(pending_ocr))
+    for start in range(0, len(pending_ocr), step):
+        if stop_at is not None and time.time() >= stop_at:
+            for analysis in pending_ocr[start:]:
+                analysis["ocr"] = []
+                analysis["image"] = analysis["signature"] = None
+                for entry in analysis["entries"]:
+                    entry["truncated"] = True
+            break
+        batch = pending_ocr[start:start + step]
+        read = set()
+        ocr_links = extract_text_and_urls_batch([analysis["image"] for analysis in batch], stats, read)
+        for index, (analysis, found) in enumerate(zip(batch, ocr_links)):
+            analysis["ocr_read"] = index in read
+            signature = analysis["signature"]
+            if found is None:
+                analysis["ocr_error"] = "OCR failed"
+                analysis["ocr"] = []
+                analysis["image"] = analysis["signature"] = None
+                for entry in analysis["entries"]:
+                    entry["ocr_error"] = analysis["ocr_error"]
+                continue
+            if analysis["cache"]:
+                # Only text-free images are offered for near-duplicate reuse
+                indexed = signature is not None and not found
+                thumb = {"thumb.png": signature.encode_thumbnail()} if indexed else None
+                image_cache.put(analysis["image_key"], {"qr": analysis["qr"], "ocr": found}, thumb)
+                if indexed:
+                    phash_index.add(signature, analysis["image_key"])
+            analysis["ocr"] = found
+            analysis["image"] = analysis["signature"] = None  # release the pixels
+            for entry in analysis["entries"]:
+                unique_links = set_entry_links(entry, entry["extracted_links"] + found)
+                log.debug("%s: %d link(s)", entry["filename"], len(unique_links))
+    pending_ocr.clear()
+
+def note_ocr_errors(page_info):
+    """Move the ``ocr_error`` marks left by ``run_pending_ocr`` into ``page_info["errors"]``."""
+    for index, entry in enumerate(page_info["images"]):
+        error = entry.pop("ocr_error", None)
+        if error:
+            page_info.setdefault("errors", []).append({"source": "ocr", "index": index, "error": error})
+
+def page_tiles(width, height, tile=None, overlap=None):
+    """Overlapping ``(x0, y0, x1, y1)`` tiles covering a ``width`` x ``height`` image, row by row."""
+    tile = tile or FULL_PAGE_TILE
+    overlap = FULL_PAGE_OVERLAP if overlap is None else overlap
+    step = max(1, tile - overlap)
+
+    def starts(size):
+        if size <= tile:
+            return [0]
+        positions = list(range(0, size - tile, step))
+        return positions + [size - tile]
+
+    return [(x, y, min(x + tile, width), min(y + tile, height))
+            for y in starts(height) for x in starts(width)]
+
+def scan_full_page(page, page_num, source_name, options):
+    """Render ``page`` once and look for QR codes and URLs in overlapping tiles.
+
+    Meant for flattened or scanned PDFs whose links only exist as pixels.
+    QR detection runs on a thread pool and OCR in batches; every finding
+    carries a ``bbox`` in page coordinates. Tiles not started within
+    ``FULL_PAGE_TIME_BUDGET`` seconds, or by the scan's ``stop_at``, are
+    skipped and reported in the entry's ``full_page`` block; when
+    ``stop_at`` cut the page short the entry is also marked
+    ``"truncated": true``.
+    """
+    started = time.time()
+    deadline = started + FULL_PAGE_TIME_BUDGET
+    if options["stop_at"] is not None:
+        deadline = min(deadline, options["stop_at"])
+    area = page.rect
+    max_pixels = OCR_PIXEL_BUDGET * FULL_PAGE_BUDGET_FACTOR
+    zoom = min(FULL_PAGE_DPI / 72, math.sqrt(max_pixels / max(area.width * area.height, 1)))
+    with timer("render"):
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+    filename = f"{_base_name(source_name)}_page{page_num}_full.png"
+    url = render_url(options, page_num, area, zoom) if options["save_images"] else None
+    image = ImageBuffer.from_pixmap(pix)
+    tiles = page_tiles(pix.width, pix.height)
+    log.debug("Full-page scan: %d x %d px at %.0f dpi, %d tiles", pix.width, pix.height, zoom * 72, len(tiles))
+
+    def to_page(tile, box):
+        return [round(area.x0 + (tile[0] + box[0]) / zoom, 2), round(area.y0 + (tile[1] + box[1]) / zoom, 2),
+                round(area.x0 + (tile[0] + box[2]) / zoom, 2), round(area.y0 + (tile[1] + box[3]) / zoom, 2)]
+
+    def crop(tile, pixels):
+        x0, y0, x1, y1 = tile
+        return np.ascontiguousarray(pixels[y0:y1, x0:x1])
+
+    links = []
+    scanned = set()
+    failed_tiles = 0
+    timed_out = False
+
+    # QR codes: tiles in parallel, late tiles cancelled once the budget is spent
+    qr_started = time.perf_counter()
+    pool = ThreadPoolExecutor(max_workers=FULL_PAGE_WORKERS)
+    futures = {pool.submit(detect_codes, crop(tile, image.gray)): tile for tile in tiles}
+    try:
+        for future in as_completed(futures, timeout=max(0, deadline - time.time())):
+            tile = futures[future]
+            for kind, data, box in future.result():
+                content = data.decode("utf-8", "replace").strip()
+                if content:
+                    links.append({"type": f"{kind}", "content": content,
+                                  "description": f"{kind} detected", "bbox": to_page(tile, box)})
+    except FutureTimeout:
+        timed_out = True
+        log.warning("QR scan of page %d ran out of time after %.1fs", page_num, time.time() - started)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        telemetry.add_time("qr", time.perf_counter() - qr_started)
+    links.sort(key=lambda link: (link["bbox"][1], link["bbox"][0]))
+
+    # OCR: batches of tiles until the budget runs out; blank tiles are triaged away
+    texts = []
+    candidates = [tile for tile in tiles if ocr_triage(crop(tile, image.gray))[0]]
+    for start in range(0, len(candidates), OCR_BATCH_SIZE):
+        if time.time() >= deadline:
+            timed_out = True
+            log.warning("OCR of page %d ran out of time after %.1fs", page_num, time.time() - started)
+            break
+        batch = candidates[start:start + OCR_BATCH_SIZE]
+        with timer("ocr"):
+            batch_results = readtext_batched([crop(tile, image.rgb) for tile in batch])
+        for tile, ocr_results in zip(batch, batch_results):
+            if ocr_results is None:
+                failed_tiles += 1
+                continue
+            scanned.add(tile)
+            for quad, text, confidence in ocr_results:
+                found = []
+                collect_ocr_links([(quad, text, confidence)], found, texts)
+                xs, ys = [p[0] for p in quad], [p[1] for p in quad]
+                for link in found:
+                    link["bbox"] = to_page(tile, [min(xs), min(ys), max(xs), max(ys)])
+                links.extend(found)
+    unique_links = finalize_ocr_links(links, texts)
+
+    elapsed = time.time() - started
+    skipped = len(candidates) - len(scanned)
+    log.info("Full-page scan of page %d: %d link(s) in %.1fs%s", page_num, len(unique_links), elapsed,
+             f", {skipped} tile(s) left unscanned" if skipped else "")
+    entry = {
+        "filename": filename,
+        "url": url,
+        "image_area": [area.x0, area.y0, area.x1, area.y1],
+        "clickable_links_found": len(unique_links) > 0,
+        "extracted_links": unique_links,
+        "full_page": {
+            "tiles": len(tiles),
+            "tiles_ocr": len(scanned),
+            "tiles_skipped": skipped,
+            "elapsed": round(elapsed, 3),
+            "timed_out": timed_out,
+        },
+    }
+    if failed_tiles:
+        entry["ocr_error"] = f"OCR failed on {failed_tiles} tile(s)"
+    if timed_out and past_deadline(options):
+        entry["truncated"] = True
+    return entry
+
+def scan_options(**overrides):
+    """Merge keyword overrides into ``DEFAULT_SCAN_OPTIONS``; ``None`` keeps the default.
+
+    A scan that saves images gets a fresh artifact namespace unless one is
+    given, and a ``deadline`` starts counting here unless ``stop_at`` is set.
+    """
+    unknown = set(overrides) - set(DEFAULT_SCAN_OPTIONS)
+    if unknown:
+        raise TypeError(f"Unknown scan option(s): {', '.join(sorted(unknown))}")
+    options = dict(DEFAULT_SCAN_OPTIONS)
+    options.update({k: v for k, v in overrides.items() if v is not None})
+    if options["save_images"] and not options["namespace"]:
+        options["namespace"] = artifact_store.new_namespace()
+    if options["deadline"] is not None and options["stop_at"] is None:
+        options["stop_at"] = time.time() + options["deadline"]
+    return options
+
+def save_artifact(options, data, ext="png"):
+    """Store encoded image ``data`` in the scan's artifact namespace and return its URL."""
+    namespace = options["namespace"]
+    return artifact_store.url(namespace, artifact_store.put_bytes(namespace, data, ext))
+
+def keep_document(pdf_hash, filepath):
+    """Retain a copy of the PDF so its lazy images can be rendered after the upload is gone."""
+    if document_cache.get(pdf_hash) is None:
+        document_cache.put(pdf_hash, {"size": os.path.getsize(filepath)}, {"document.pdf": filepath})
+
+def render_url(options, page_num, clip, zoom):
+    """Stable URL for ``clip`` of page ``page_num`` at ``zoom``; nothing is rendered until it is fetched."""
+    spec = f"p{page_num}_{clip.x0:.2f}_{clip.y0:.2f}_{clip.x1:.2f}_{clip.y1:.2f}_z{zoom:.4f}.png"
+    return f"{BACKEND_URL}/images/r/{options['document']}/{spec}"
+
+def _is_render_url(url):
+    return "/images/r/" in url
+
+def _render_cache_path(key):
+    if render_cache.get(key) is None:
+        return None
+    path = render_cache.attachment(key, "image.png")
+    return path if os.path.isfile(path) else None
+
+def render_image(pdf_hash, spec, size=None):
+    """``(path, etag)`` of a lazily referenced region, rendering it on first request.
+
+    Returns None for malformed specs or when the PDF has left ``document_cache``.
+    The zoom in the URL is capped by the full-page pixel budget, so a crafted
+    URL can't ask for more pixels than a scan would render.
+    """
+    match = _RENDER_SPEC_RE.match(spec)
+    if not (match and _PDF_HASH_RE.match(pdf_hash)):
+        return None
+    key = sha256_bytes(f"{pdf_hash}/{spec}/{size}".encode())
+    path = _render_cache_path(key)
+    if path:
+        return path, key
+    if document_cache.get(pdf_hash) is None:
+        return None
+
+    page_num = int(match.group(1))
+    x0, y0, x1, y1, zoom = map(float, match.groups()[1:])
+    clip = fitz.Rect(x0, y0, x1, y1)
+    if clip.is_empty:
+        return None
+    zoom = min(zoom, math.sqrt(OCR_PIXEL_BUDGET * FULL_PAGE_BUDGET_FACTOR / max(clip.width * clip.height, 1)))
+    if size:
+        # fitz rounds the clip outwards, which can add a pixel on each side
+        zoom = min(zoom, (size - 2) / max(clip.width, clip.height))
+    pdf = fitz.open(document_cache.attachment(pdf_hash, "document.pdf"))
+    try:
+        if not 1 <= page_num <= len(pdf):
+            return None
+        pix = pdf[page_num - 1].get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip)
+        data = pix.tobytes("png")
+    finally:
+        pdf.close()
+    render_cache.put(key, {"document": pdf_hash, "spec": spec, "size": size}, {"image.png": data})
+    log.info("Rendered %s of %s on request (%d x %d px)", spec, pdf_hash[:12], pix.width, pix.height)
+    path = _render_cache_path(key)
+    return (path, key) if path else None
+
+def thumbnail_image(path, etag, size):
+    """``(path, etag)`` of a PNG thumbnail of a stored image fitting a ``size`` box."""
+    key = sha256_bytes(f"{etag}/{size}".encode())
+    cached = _render_cache_path(key)
+    if cached:
+        return cached, key
+    img = Image.open(path)
+    img.draft("RGB", (size, size))
+    img.thumbnail((size, size))
+    if img.mode not in ("1", "L", "LA", "P", "RGB", "RGBA"):
+        img = img.convert("RGB")
+    png = io.BytesIO()
+    img.save(png, "PNG")
+    render_cache.put(key, {"source": etag, "size": size}, {"image.png": png.getvalue()})
+    cached = _render_cache_path(key)
+    return (cached, key) if cached else None
+
+def image_file(artifact, size=None):
+    """``(path, etag)`` for an /images path, or None if it is unknown or evicted.
+
+    ``<namespace>/<name>`` is a stored artifact; ``r/<pdf hash>/<spec>`` is
+    rendered on first request. ``size`` (one of ``THUMBNAIL_SIZES``) asks
+    for a thumbnail fitting a ``size`` x ``size`` box. The etag changes
+    whenever the bytes could, so responses can be cached as immutable.
+    """
+    if size is not None and size not in THUMBNAIL_SIZES:
+        raise ValueError(f"size must be one of {', '.join(map(str, THUMBNAIL_SIZES))}")
+    kind, _, rest = artifact.partition("/")
+    if kind == "r":
+        pdf_hash, _, spec = rest.partition("/")
+        return render_image(pdf_hash, spec, size)
+    path = artifact_store.resolve(artifact)
+    if path is None:
+        return None
+    etag = os.path.splitext(os.path.basename(path))[0]  # the content hash
+    if size is None:
+        return path, etag
+    return thumbnail_image(path, etag, size)
+
+def flush_pending_ocr(pending_ocr, stats):
+    """Run the waiting OCR early once the crops hold ``OCR_PENDING_PIXELS``; True if it ran."""
+    held = sum(analysis["image"].shape[0] * analysis["image"].shape[1] for analysis in pending_ocr)
+    if held < OCR_PENDING_PIXELS:
+        return False
+    log.debug("Running OCR early: %d crops hold %d pixels", len(pending_ocr), held)
+    run_pending_ocr(pending_ocr, stats)
+    return True
+
+def past_deadline(options):
+    return options["stop_at"] is not None and time.time() >= options["stop_at"]
+
+def add_page_error(page_info, source, index, error):
+    """Record a link area or image whose processing failed, so the report shows it's missing."""
+    page_info.setdefault("errors", []).append(
+        {"source": source, "index": index, "error": f"{type(error).__name__}: {error}"})
+
+def new_image_registry():
+    """Per-document map of embedded images already analysed, by xref and by content hash."""
+    return {"xref": {}, "content": {}}
+
+def reused_ocr_calls(registry):
+    """OCR calls saved by placements in ``registry`` that shared an image OCR actually ran on.
+
+    Placements of triage-skipped, cached or text-layer images saved none.
+    """
+    return sum(known["analysis"].get("shared", 0) for known in registry["content"].values()
+               if known["analysis"].get("ocr_read"))
+
+def ocr_calls_avoided(ocr_stats):
+    """Images not OCR'd: rejected by triage, or placements reusing another's OCR."""
+    return ocr_stats["ocr_skipped"] + ocr_stats["ocr_reused"]
+
+def scan_page(pdf, page_num, source_name, pending_ocr=None, options=None, registry=None):
+    """Scan one page's link areas and embedded images; returns ``(page_info, stats)``."""
+    options = options or scan_options()
+    save_images = options["save_images"]
+    if registry is None:
+        registry = new_image_registry()
+    page = pdf[page_num - 1]
+    total_images = 0
+    duplicate_images = 0
+    image_keys = []
+    # Crops wait in pending_ocr for the caller's batch; without a list they're OCR'd here
+    ocr_now = pending_ocr is None
+    if ocr_now:
+        pending_ocr = []
+    page_info = {"page": page_num, "images": []}
+    
+    # STEP 1: Index ALL PDF links once; every image on the page queries this
+    with timer("link_match"):
+        link_index = LinkIndex.for_page(page)
+    with timer("extract"):
+        words = page_words(page) if options["text_layer"] else []
+    text_layer_hits = 0
+    log.debug("Page %d: %d links, %d URI links", page_num, len(link_index.links), len(link_index.uri_links))
+    
+    # STEP 2: Process each URI link and create images from link areas
+    for link_idx, record in enumerate(link_index.uri_links):
+        if past_deadline(options):
+            page_info["truncated"] = True
+            break
+        rect = record["rect"]
+        uri = record["uri"]
+        
+        log.debug("URI link %d: %s at [%.1f, %.1f, %.1f, %.1f]", link_idx, uri, rect.x0, rect.y0, rect.x1, rect.y1)
+        
+        # Create image from link area
+        base_name = os.path.splitext(source_name)[0].replace(" ", "_")
+        filename = f"{base_name}_page{page_num}_link{link_idx}.png"
+        
+        try:
+            # Render the link area as high-quality image with padding
+            padding = 5
+            clip_rect = fitz.Rect(
+                max(0, rect.x0 - padding),
+                max(0, rect.y0 - padding),
+                min(page.rect.width, rect.x1 + padding),
+                min(page.rect.height, rect.y1 + padding)
+            )
+            # Vector text under the link makes rendering + OCR unnecessary
+            with timer("link_match"):
+                layer_links = text_layer_links(words, [clip_rect.x0, clip_rect.y0, clip_rect.x1, clip_rect.y1])
+
+            # Zoom chosen from the rect's size: small links are upscaled, big ones capped
+            zoom = render_zoom(clip_rect)
+            # The client's copy is rendered lazily, when (and if) it is fetched
+            url = render_url(options, page_num, clip_rect, zoom) if save_images else None
+            pix = None
+            if not layer_links:
+                mat = fitz.Matrix(zoom, zoom)
+                with timer("render"):
+                    pix = page.get_pixmap(matrix=mat, clip=clip_rect)
+                log.debug("Rendered link area %s: %d x %d px", filename, pix.width, pix.height)
+            total_images += 1
+            
+            # STEP 3: Create the PDF structural link entry (THIS IS WHAT WE NEED!)
+            pdf_link = {
+                "content": uri,
+                "type": "pdf_structural",
+                "bbox": [rect.x0, rect.y0, rect.x1, rect.y1],
+                "description": f"PDF structural link"
+            }
+            
+            # Add to page results - THIS IS WHAT GOES TO FRONTEND
+            # PDF structural link is MOST IMPORTANT, so it stays first
+            entry = {
+                "filename": filename,
+                "url": url,
+                "image_area": [rect.x0, rect.y0, rect.x1, rect.y1],
+                "clickable_links_found": True,
+                "extracted_links": [pdf_link]
+            }
+            page_info["images"].append(entry)
+
+            if layer_links:
+                text_layer_hits += 1
+                set_entry_links(entry, entry["extracted_links"] + layer_links)
+                continue
+
+            # Also scan for QR codes now; OCR runs batched once crops are collected
+            image = ImageBuffer.from_pixmap(pix)
+            analyze_image(entry, image, pixmap_key(pix), pending_ocr, options["use_cache"])
+            
+        except Exception as e:
+            log.exception("Processing link area %d on page %d failed", link_idx, page_num)
+            add_page_error(page_info, "link", link_idx, e)
+    
+    # STEP 4: Also process any actual embedded images (if they exist);
+    # in full-page mode the page render covers them
+    images = [] if options["full_page"] else page.get_images(full=True)
+    log.debug("Page %d: %d embedded images", page_num, len(images))
+    
+    for img_index, img in enumerate(images):
+        if past_deadline(options):
+            page_info["truncated"] = True
+            break
+        xref = img[0]
+        try:
+            # Same xref (or identical bytes under another xref) seen before in this document?
+            known = registry["xref"].get(xref)
+            if known is None:
+                with timer("extract"):
+                    embedded = EmbeddedImage.from_fitz(pdf, xref)
+                content_key = sha256_bytes(embedded.data)
+                known = registry["content"].get(content_key)
+                if known is not None:
+                    registry["xref"][xref] = known
+
+            if known is not None:
+                filename, url = known["filename"], known["url"]
+                duplicate_images += 1
+            else:
+                base_name = os.path.splitext(source_name)[0].replace(" ", "_")
+                filename = f"{base_name}_page{page_num}_img{img_index}.{embedded.ext}"
+
+                # Stored in its native encoding; QR and OCR only ever see a budget-sized decode
+                url = save_artifact(options, embedded.data, embedded.ext) if save_images else None
+                with timer("extract"):
+                    image = embedded.decode(OCR_PIXEL_BUDGET)
+                total_images += 1
+
+            image_rects = page.get_image_rects(xref)
+            image_area = [0, 0, 0, 0]
+            if image_rects:
+                rect = image_rects[0]
+                image_area = [rect.x0, rect.y0, rect.x1, rect.y1]
+
+            log.debug("Embedded image %d at %s%s", img_index, image_area,
+                      f" (duplicate of {filename})" if known is not None else "")
+
+            # Extract links from embedded image
+            pdf_links = extract_pdf_links_for_area(link_index, image_area, img_index)
+            with timer("link_match"):
+                layer_links = text_layer_links(words, image_area)
+            if layer_links:
+                text_layer_hits += 1
+            unique_links = dedupe_links(pdf_links + layer_links)
+
+            entry = {
+                "filename": filename,
+                "url": url,
+                "image_area": image_area,
+                "clickable_links_found": len(unique_links) > 0,
+                "extracted_links": unique_links
+            }
+            page_info["images"].append(entry)
+            duplicate = known is not None
+            if duplicate and (layer_links or not known["analysis"].get("text_layer_only")):
+                attach_analysis(entry, known["analysis"])
+                if not layer_links:
+                    # Would have been OCR'd on its own; see reused_ocr_calls
+                    known["analysis"]["shared"] = known["analysis"].get("shared", 0) + 1
+            elif duplicate:
+                # Vector text covered the first placement, so it was never OCR'd;
+                # this one has none: analyse it now and share that from here on
+                with timer("extract"):
+                    image = EmbeddedImage.from_fitz(pdf, xref).decode(OCR_PIXEL_BUDGET)
+                known["analysis"] = analyze_image(entry, image, known["key"], pending_ocr, options["use_cache"])
+            else:
+                analysis = analyze_image(entry, image, content_key, pending_ocr, options["use_cache"],
+                                         run_ocr=not layer_links)
+                known = {"filename": filename, "url": url, "analysis": analysis, "key": content_key}
+                registry["xref"][xref] = known
+                registry["content"][content_key] = known
+            image_keys.append((len(page_info["images"]) - 1, known["key"], duplicate))
+
+        except Exception as e:
+            log.exception("Processing embedded image %d on page %d failed", img_index, page_num)
+            add_page_error(page_info, "image", img_index, e)
+
+    if options["full_page"] and past_deadline(options):
+        page_info["truncated"] = True
+    elif options["full_page"]:
+        try:
+            entry = scan_full_page(page, page_num, source_name, options)
+            page_info["images"].append(entry)
+            total_images += 1
+            if entry.get("truncated"):
+                page_info["truncated"] = True
+        except Exception as e:
+            log.exception("Full-page scan of page %d failed", page_num)
+            add_page_error(page_info, "full_page", 0, e)
+
+    stats = {"images_created": total_images, "duplicate_images": duplicate_images,
+             "text_layer_hits": text_layer_hits, "image_keys": image_keys}
+    if ocr_now:
+        run_pending_ocr(pending_ocr, stats, options["stop_at"])
+        if any(entry.get("truncated") for entry in page_info["images"]):
+            page_info["truncated"] = True
+    note_ocr_errors(page_info)
+    return page_info, stats
+
+def _scan_page_chunk(filepath, source_name, page_numbers, options):
+    """Process-pool entry point: scan a run of pages with a private fitz handle.
+
+    Returns ``(results, ocr_stats, timings)``; OCR is batched over the
+    chunk (see ``flush_pending_ocr``) and ``timings`` is the chunk's telemetry breakdown for the parent
+    to merge. Under a deadline (``options["stop_at"]``) each page is OCR'd
+    before the next starts, and pages not started in time are left out.
+    """
+    with telemetry.collect() as breakdown:
+        pdf = fitz.open(filepath)
+        ocr_stats = {}
+        try:
+            pending_ocr = [] if options["stop_at"] is None else None
+            registry = new_image_registry()
+            results = []
+            for page_num in page_numbers:
+                if past_deadline(options):
+                    break
+                results.append(scan_page(pdf, page_num, source_name, pending_ocr, options, registry))
+                if pending_ocr is None:
+                    add_ocr_stats(ocr_stats, results[-1][1])
+                else:
+                    flush_pending_ocr(pending_ocr, ocr_stats)
+        finally:
+            pdf.close()
+        if pending_ocr is not None:
+            run_pending_ocr(pending_ocr, ocr_stats)
+        for page_info, _ in results:
+            note_ocr_errors(page_info)
+        ocr_stats["ocr_reused"] = reused_ocr_calls(registry)
+    return results, ocr_stats, breakdown.as_dict()
+
+def merge_duplicate_images(results, seen=None):
+    """Name images that recur across page chunks the way a serial scan does.
+
+    Each chunk has its own image registry, so the first placement a chunk
+    sees of an image keeps its own filename even when an earlier chunk had
+    the image already. ``results`` are ``(page_info, stats)`` in page order;
+    such placements take the earliest filename and count as duplicates
+    (their URL and links already match). ``seen`` carries the content key ->
+    filename map across calls; it is returned.
+    """
+    seen = {} if seen is None else seen
+    for page_info, stats in results:
+        for index, key, duplicate in stats.pop("image_keys", ()):
+            entry = page_info["images"][index]
+            first = seen.setdefault(key, entry["filename"])
+            if entry["filename"] != first:
+                entry["filename"] = first
+                if not duplicate:
+                    stats["images_created"] -= 1
+                    stats["duplicate_images"] += 1
+    return seen
+
+def _get_process_pool():
+    global _process_pool
+    if _process_pool is None:
+        # spawn rather than fork: the job workers are threads, and forking a
+        # threaded process that already holds torch state can deadlock.
+        _process_pool = ProcessPoolExecutor(
+            max_workers=SCAN_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=telemetry.setup_logging,
+            initargs=(logging.getLogger().level,),
+        )
+    return _process_pool
+
+def _page_chunks(pages, processes):
+    # A few chunks per process keeps the pool busy when pages differ in cost.
+    size = max(1, math.ceil(len(pages) / (processes * 4)))
+    return [pages[start:start + size] for start in range(0, len(pages), size)]
+
+def _submit_page_chunks(filepath, source_name, pages, options):
+    log.info("Scanning %d pages on %d processes", len(pages), SCAN_PROCESSES)
+    pool = _get_process_pool()
+    return [pool.submit(_scan_page_chunk, filepath, source_name, chunk, options)
+            for chunk in _page_chunks(pages, SCAN_PROCESSES)]
+
+def add_ocr_stats(total, stats):
+    for key in ("ocr_images", "ocr_skipped", "retry_skipped", "ocr_reused"):
+        total[key] = total.get(key, 0) + stats.get(key, 0)
+    return total
+
+def plan_pages(options, page_count):
+    """``(pages to scan, pages deferred by max_pages)`` from the ``pages`` and ``max_pages`` options.
+
+    Raises PageRangeError when ``pages`` selects none of the document's pages.
+    """
+    if options["pages"]:
+        selected = parse_page_ranges(options["pages"], page_count)
+        if not selected:
+            raise PageRangeError(f"Pages {options['pages']} are outside this {page_count}-page PDF")
+    else:
+        selected = list(range(1, page_count + 1))
+    if options["max_pages"] is not None:
+        return selected[:options["max_pages"]], selected[options["max_pages"]:]
+    return selected, []
+
+def page_memory(page, options):
+    """``(bytes of crops held until OCR, bytes of its largest full-size decode)`` for one page."""
+    if options["full_page"]:
+        area = page.rect.width * page.rect.height
+        zoom = min(FULL_PAGE_DPI / 72, math.sqrt(OCR_PIXEL_BUDGET * FULL_PAGE_BUDGET_FACTOR / max(area, 1)))
+        return area * zoom * zoom * SCAN_BYTES_PER_PIXEL, 0
+    held = 0
+    for record in LinkIndex.for_page(page).uri_links:
+        rect = record["rect"]
+        held += min(rect.width * rect.height * render_zoom(rect) ** 2, OCR_PIXEL_BUDGET) * SCAN_BYTES_PER_PIXEL
+    decode = 0
+    seen = set()
+    for xref, _, width, height, *rest in page.get_images(full=True):
+        if xref in seen:
+            continue
+        seen.add(xref)
+        held += min(width * height, OCR_PIXEL_BUDGET) * SCAN_BYTES_PER_PIXEL
+        # JPEGs are drafted at the reduced size; anything else decodes in full first
+        if width * height > OCR_PIXEL_BUDGET and rest[4] != "DCTDecode":
+            decode = max(decode, width * height * DECODE_BYTES_PER_PIXEL)
+    return held, decode
+
+def estimate_scan_memory(documents, batch=False, parallel=None, **options):
+    """Rough peak memory of scanning ``documents`` (``[(filepath, source_name), ...]``).
+
+    Reads only page sizes, link rects and image dimensions. Each scanning
+    process holds at most ``OCR_PENDING_PIXELS`` of crops plus the page in
+    hand; with ``parallel`` (chosen as ``scan_pdf`` or, with ``batch``,
+    ``scan_batch`` would) ``SCAN_PROCESSES`` of them run at once. PDFs that
+    can't be opened count as empty; the scan reports them. Returns
+    ``{"pages", "bytes", "largest_page_bytes"}``. Raises PageRangeError when
+    the ``pages`` option selects none of a single document's pages; a batch
+    reports that per document instead.
+    """
+    options = scan_options(**dict(options, save_images=False))  # no artifact namespace needed
+    pages = []  # (held, decode) per planned page
+    for filepath, source_name in documents:
+        try:
+            with fitz.open(filepath) as pdf:
+                planned, _ = plan_pages(options, len(pdf))
+                pages.extend(page_memory(pdf[page_num - 1], options) for page_num in planned)
+        except PageRangeError:
+            if not batch:
+                raise
+        except Exception as e:
+            log.debug("Can't estimate %s: %s", source_name, e)
+    if parallel is None:
+        parallel = SCAN_PROCESSES > 1 and (batch or len(pages) >= PARALLEL_MIN_PAGES)
+    processes = min(SCAN_PROCESSES, max(1, len(pages))) if parallel else 1
+    pending = min(OCR_PENDING_PIXELS * SCAN_BYTES_PER_PIXEL, sum(held for held, _ in pages))
+    largest = sorted((held + decode for held, decode in pages), reverse=True)
+    peak = processes * (SCAN_BASE_MB * 1024 * 1024 + pending) + sum(largest[:processes])
+    return {"pages": len(pages), "bytes": int(peak), "largest_page_bytes": int(largest[0]) if largest else 0}
+
+def scan_status(page_count, planned, deferred, pages):
+    """What a scan covered, from its ``page_info`` dicts (only ``page``, ``truncated`` and ``errors`` are read).
+
+    ``remaining_pages`` is the ``pages`` option that resumes the scan: pages
+    skipped by ``max_pages`` or the deadline, truncated ones and ones with
+    errors (a failed OCR is worth retrying). The scan is ``complete`` when
+    nothing remains.
+    """
+    scanned = [page_info["page"] for page_info in pages]
+    truncated = [page_info["page"] for page_info in pages if page_info.get("truncated")]
+    with_errors = [page_info["page"] for page_info in pages if page_info.get("errors")]
+    not_reached = sorted(set(planned) - set(scanned))
+    skipped = not_reached + list(deferred)
+    stopped_by = "deadline" if not_reached or truncated else "max_pages" if deferred else None
+    remaining = skipped + truncated + with_errors
+    return {
+        "complete": not remaining,
+        "stopped_by": stopped_by,
+        "total_pages": page_count,
+        "scanned_pages": format_page_ranges(scanned),
+        "truncated_pages": format_page_ranges(truncated),
+        "skipped_pages": format_page_ranges(skipped),
+        "error_pages": format_page_ranges(with_errors),
+        "remaining_pages": format_page_ranges(remaining),
+        "errors": sum(len(page_info.get("errors", ())) for page_info in pages),
+    }
+
+def count_page_links(page_info):
+    return sum(len(entry["extracted_links"]) for entry in page_info["images"])
+
+def count_scan_totals(pages, images, links, duplicate_images, text_layer_hits, ocr_stats):
+    """Add one finished scan's totals to the current telemetry breakdown."""
+    count("scans")
+    count("pages", pages)
+    count("images", images)
+    count("links", links)
+    count("duplicate_images", duplicate_images)
+    count("text_layer_hits", text_layer_hits)
+    count("ocr_images", ocr_stats["ocr_images"])
+    count("ocr_skipped", ocr_stats["ocr_skipped"])
+    count("ocr_retries_skipped", ocr_stats["retry_skipped"])
+    count("ocr_calls_avoided", ocr_calls_avoided(ocr_stats))
+
+def _base_name(source_name):
+    return os.path.splitext(source_name)[0].replace(" ", "_")
+
+def _artifact_name(url):
+    # Image URLs end in /images/<namespace>/<content hash>.<ext>
+    return url.rsplit("/", 1)[-1]
+
+def store_cached_report(pdf_hash, source_name, report):
+    """Save a finished report plus its image files in the report cache."""
+    attachments = {}
+    for page_info in report:
+        for entry in page_info["images"]:
+            if not entry["url"] or _is_render_url(entry["url"]):
+                continue
+            img_path = artifact_store.resolve(entry["url"].split("/images/", 1)[-1])
+            if img_path:
+                attachments[_artifact_name(entry["url"])] = img_path
+    report_cache.put(pdf_hash, {"base_name": _base_name(source_name), "report": report}, attachments)
+
+def load_cached_report(pdf_hash, source_name, options):
+    """Return a cached report renamed for ``source_name``, or None.
+
+    With ``save_images`` the cached image files are copied into the scan's
+    artifact namespace and the URLs point there; lazy render URLs are kept
+    as they are, since they only depend on the PDF's content.
+    """
+    cached = report_cache.get(pdf_hash)
+    if cached is None:
+        return None
+    old_base, new_base = cached["base_name"], _base_name(source_name)
+    report = cached["report"]
+    try:
+        for page_info in report:
+            for entry in page_info["images"]:
+                entry["filename"] = new_base + entry["filename"][len(old_base):]
+                url, entry["url"] = entry["url"], None
+                if url and _is_render_url(url):
+                    entry["url"] = url if options["save_images"] else None
+                    continue
+                name = _artifact_name(url) if url else None
+                if name and options["save_images"]:
+                    name = artifact_store.put_file(options["namespace"], report_cache.attachment(pdf_hash, name),
+                                                   os.path.splitext(name)[1][1:])
+                    entry["url"] = artifact_store.url(options["namespace"], name)
+    except OSError as e:
+        log.warning("Cached report for %s is incomplete, rescanning: %s", pdf_hash[:12], e)
+        return None
+    return report
+
+def report_cacheable(options):
+    """Cached reports are built with the default pipeline; other variants always rescan."""
+    return options["use_cache"] and options["text_layer"] and not options["full_page"]
+
+def cache_stats():
+    return {"reports": report_cache.stats(), "images": image_cache.stats(),
+            "documents": document_cache.stats(), "renders": render_cache.stats(),
+            "similar_images": phash_index.stats()}
+
+def scan_pdf(filepath, source_name, progress=None, parallel=None, status=None, **options):
+    """Scan every page of a PDF for link areas and embedded images.
+
+    ``progress`` is called as ``progress(pages_done, total_pages)`` as pages
+    finish. With ``parallel`` (default: ``SCAN_PROCESSES`` > 1 and at least
+    ``PARALLEL_MIN_PAGES`` pages) pages are scanned in chunks on a process pool
+    and merged back in page order, images recurring across chunks named as
+    in a serial scan (``merge_duplicate_images``), so the report is the same.
+    Reports are cached by the SHA-256 of the PDF bytes and individual images
+    by content hash; ``use_cache=False`` bypasses both lookups. Other
+    keyword options are listed in ``DEFAULT_SCAN_OPTIONS``. Stage timings and
+    counters go to the caller's telemetry breakdown (see telemetry.py).
+
+    ``pages``, ``max_pages`` and ``deadline`` bound the scan for a fast
+    preview: it stops cleanly, returns the pages it has (truncated ones are
+    marked) and fills ``status``, if given, with ``scan_status``, whose
+    ``remaining_pages`` resumes it later.
+    """
+    with telemetry.collect():
+        return _scan_pdf(filepath, source_name, progress, parallel, scan_options(**options),
+                         status if status is not None else {})
+
+def _scan_pdf(filepath, source_name, progress, parallel, options, status):
+    pdf_hash = sha256_file(filepath)
+    options["document"] = pdf_hash
+    if options["save_images"]:
+        keep_document(pdf_hash, filepath)
+    if report_cacheable(options):
+        report = load_cached_report(pdf_hash, source_name, options)
+        if report is not None:
+            log.info("Report cache hit for %s (%s)", source_name, pdf_hash[:12])
+            count("report_cache_hits")
+            page_count = len(report)
+            planned, deferred = plan_pages(options, page_count)
+            wanted = set(planned)
+            report = [page_info for page_info in report if page_info["page"] in wanted]
+            status.update(scan_status(page_count, planned, deferred, report))
+            status["ocr_calls_avoided"] = 0
+            if progress:
+                progress(len(report), len(report))
+            return report
+
+    pdf = fitz.open(filepath)
+    page_count = len(pdf)
+    planned, deferred = plan_pages(options, page_count)
+    if parallel is None:
+        parallel = SCAN_PROCESSES > 1 and len(planned) >= PARALLEL_MIN_PAGES
+
+    results = {}
+    ocr_stats = add_ocr_stats({}, {})
+    if parallel:
+        pdf.close()
+        futures = _submit_page_chunks(filepath, source_name, planned, options)
+        for future in as_completed(futures):
+            chunk_results, chunk_ocr_stats, chunk_timings = future.result()
+            add_ocr_stats(ocr_stats, chunk_ocr_stats)
+            telemetry.merge(chunk_timings)
+            for result in chunk_results:
+                results[result[0]["page"]] = result
+            if progress:
+                progress(len(results), len(planned))
+        merge_duplicate_images(results[page_num] for page_num in sorted(results))
+    else:
+        # OCR is batched across pages (up to OCR_PENDING_PIXELS of crops);
+        # under a deadline each page is OCR'd before the next one starts
+        pending_ocr = [] if options["stop_at"] is None else None
+        registry = new_image_registry()
+        for page_num in planned:
+            if past_deadline(options):
+                log.info("Deadline reached for %s after %d of %d pages", source_name, len(results), len(planned))
+                break
+            results[page_num] = scan_page(pdf, page_num, source_name, pending_ocr, options, registry)
+            if pending_ocr is None:
+                add_ocr_stats(ocr_stats, results[page_num][1])
+            else:
+                flush_pending_ocr(pending_ocr, ocr_stats)
+            if progress:
+                progress(len(results), len(planned))
+        pdf.close()
+        if pending_ocr is not None:
+            run_pending_ocr(pending_ocr, ocr_stats)
+        for page_info, _ in results.values():
+            note_ocr_errors(page_info)
+        ocr_stats["ocr_reused"] = reused_ocr_calls(registry)
+
+    report = _finish_report(pdf_hash, source_name, results, ocr_stats, options, page_count)
+    status.update(scan_status(page_count, planned, deferred, report))
+    status["ocr_calls_avoided"] = ocr_calls_avoided(ocr_stats)
+    return report
+
+def _finish_report(pdf_hash, source_name, results, ocr_stats, options, page_count):
+    """Put ``{page_num: (page_info, stats)}`` in page order, record the totals and cache the report.
+
+    Only reports of every page, none of them truncated or with errors, are cached.
+    """
+    report = []
+    total_images = 0
+    total_links = 0
+    duplicate_images = 0
+    text_layer_hits = 0
+    for page_num in sorted(results):
+        page_info, stats = results[page_num]
+        report.append(page_info)
+        total_images += stats["images_created"]
+        duplicate_images += stats["duplicate_images"]
+        text_layer_hits += stats.get("text_layer_hits", 0)
+        total_links += count_page_links(page_info)
+    
+    count_scan_totals(len(report), total_images, total_links, duplicate_images, text_layer_hits, ocr_stats)
+    log.info("Scan of %s completed: %d pages, %d images, %d links, %d duplicate images reused, "
+             "%d areas from the text layer, OCR %d run / %d skipped / %d retries skipped",
+             source_name, len(report), total_images, total_links, duplicate_images, text_layer_hits,
+             ocr_stats["ocr_images"], ocr_stats["ocr_skipped"], ocr_stats["retry_skipped"])
+
+    cache_complete_report(pdf_hash, source_name, report, options, page_count)
+    return report
+
+def will_cache_report(options, planned, page_count):
+    """Whether a scan of ``planned`` pages can end in a cacheable report."""
+    # Only reports with their images on disk are complete enough to cache
+    return options["save_images"] and report_cacheable(options) and len(planned) == page_count
+
+def cache_complete_report(pdf_hash, source_name, report, options, page_count):
+    """Store ``report`` if it covers every page and none is truncated or has errors."""
+    if not will_cache_report(options, report, page_count):
+        return
+    if not any(page_info.get("truncated") or page_info.get("errors") for page_info in report):
+        store_cached_report(pdf_hash, source_name, report)
+
+def iter_scan_events(filepath, source_name, parallel=None, **options):
+    """Scan a PDF and yield events as pages finish, for streaming responses.
+
+    Yields ``{"type": "start"}``, then a ``page`` event carrying each
+    ``page_info`` (in page order, also when parallel) followed by a
+    ``progress`` event, and finally a ``summary`` with the totals. OCR is
+    batched per page rather than per document so the first page is sent as
+    soon as it is done. Pages are kept only while the finished report can
+    still be cached, as ``scan_pdf`` does. The summary also carries the scan's ``timings`` breakdown and its ``scan``
+    status (see ``scan_status``; ``pages``, ``max_pages`` and ``deadline``
+    work as for ``scan_pdf``).
+    """
+    with telemetry.collect() as breakdown:
+        yield from _iter_scan_events(filepath, source_name, parallel, scan_options(**options), breakdown)
+
+def _iter_scan_events(filepath, source_name, parallel, options, breakdown):
+    started = time.time()
+    pdf_hash = sha256_file(filepath)
+    options["document"] = pdf_hash
+    if options["save_images"]:
+        keep_document(pdf_hash, filepath)
+    cached = None
+    if report_cacheable(options):
+        cached = load_cached_report(pdf_hash, source_name, options)
+        if cached is not None:
+            count("report_cache_hits")
+
+    pdf = fitz.open(filepath)
+    page_count = len(pdf)
+    planned, deferred = plan_pages(options, page_count)
+    if parallel is None:
+        parallel = SCAN_PROCESSES > 1 and len(planned) >= PARALLEL_MIN_PAGES
+    yield {"type": "start", "file": source_name, "total_pages": page_count,
+           "selected_pages": format_page_ranges(planned), "cached": cached is not None}
+
+    ocr_stats = add_ocr_stats({}, {})
+    if cached is not None:
+        pdf.close()
+        wanted = set(planned)
+        results = ((page_info, {"images_created": len(page_info["images"]), "duplicate_images": 0})
+                   for page_info in cached if page_info["page"] in wanted)
+    elif parallel:
+        pdf.close()
+        futures = _submit_page_chunks(filepath, source_name, planned, options)
+        def parallel_results():
+            # In page order, so recurring images get the names a serial scan gives them
+            seen = {}
+            for future in futures:
+                chunk_results, chunk_ocr_stats, chunk_timings = future.result()
+                add_ocr_stats(ocr_stats, chunk_ocr_stats)
+                telemetry.merge(chunk_timings)
+                merge_duplicate_images(chunk_results, seen)
+                yield from chunk_results
+        results = parallel_results()
+    else:
+        def serial_results():
+            registry = new_image_registry()
+            try:
+                for page_num in planned:
+                    if past_deadline(options):
+                        break
+                    result = scan_page(pdf, page_num, source_name, None, options, registry)
+                    add_ocr_stats(ocr_stats, result[1])
+                    yield result
+            finally:
+                pdf.close()
+            ocr_stats["ocr_reused"] = reused_ocr_calls(registry)
+        results = serial_results()
+
+    pages_done = 0
+    total_images = 0
+    total_links = 0
+    duplicate_images = 0
+    text_layer_hits = 0
+    scanned = []  # just enough of each page for scan_status
+    report = [] if cached is None and will_cache_report(options, planned, page_count) else None
+    for page_info, stats in results:
+        pages_done += 1
+        total_images += stats["images_created"]
+        duplicate_images += stats["duplicate_images"]
+        text_layer_hits += stats.get("text_layer_hits", 0)
+        total_links += count_page_links(page_info)
+        scanned.append({key: page_info[key] for key in ("page", "truncated", "errors") if key in page_info})
+        if report is not None:
+            report.append(page_info)
+        yield {"type": "page", "page": page_info}
+        yield {
+            "type": "progress",
+            "pages_done": pages_done,
+            "total_pages": len(planned),
+            "images_done": total_images,
+            "elapsed": round(time.time() - started, 3),
+        }
+
+    count_scan_totals(pages_done, total_images, total_links, duplicate_images, text_layer_hits, ocr_stats)
+    log.info("Streamed scan of %s completed: %d pages, %d images, %d links",
+             source_name, pages_done, total_images, total_links)
+    if report is not None:
+        cache_complete_report(pdf_hash, source_name, report, options, page_count)
+    yield {
+        "type": "summary",
+        "total_pages": page_count,
+        "total_images": total_images,
+        "total_links": total_links,
+        "duplicate_images": duplicate_images,
+        "ocr_calls_avoided": ocr_calls_avoided(ocr_stats),
+        "ocr_skipped": ocr_stats["ocr_skipped"],
+        "text_layer_hits": text_layer_hits,
+        "ocr_retries_skipped": ocr_stats["retry_skipped"],
+        "elapsed": round(time.time() - started, 3),
+        "timings": breakdown.as_dict(),
+        "scan": scan_status(page_count, planned, deferred, scanned),
+    }
+
+def iter_batch_events(documents, parallel=None, **options):
+    """Scan several PDFs together and yield events as documents finish.
+
+    ``documents`` lists ``(filepath, source_name)`` pairs. Their pages are
+    cut into ``BATCH_CHUNK_PAGES``-page chunks handed out round-robin over
+    the documents, shortest document first, so small documents finish in
+    the first rounds however long the others are. Chunks run on the process
+    pool when ``parallel`` (default: ``SCAN_PROCESSES`` > 1), otherwise one
+    after another in this thread.
+
+    Yields ``start`` (every document with its page count), ``progress``
+    after each chunk, ``document`` as each document finishes (with its
+    ``report``, or an ``error``; cached reports come straight after
+    ``start``) and a ``summary`` with totals over the batch.
+    """
+    with telemetry.collect() as breakdown:
+        yield from _iter_batch_events(documents, parallel, scan_options(**options), breakdown)
+
+def scan_batch(documents, progress=None, parallel=None, **options):
+    """Like ``iter_batch_events``, as ``{"documents": [...], "summary": {...}}`` in input order.
+
+    ``progress`` is called as ``progress(pages_done, total_pages)`` over the whole batch.
+    """
+    finished = {}
+    summary = None
+    for event in iter_batch_events(documents, parallel, **options):
+        event_type = event.pop("type")
+        if event_type == "document":
+            finished[event["index"]] = event
+        elif event_type == "progress" and progress:
+            progress(event["pages_done"], event["total_pages"])
+        elif event_type == "summary":
+            summary = event
+    return {"documents": [finished[index] for index in sorted(finished)], "summary": summary}
+
+def _open_batch_document(index, filepath, source_name, options):
+    """Hash, cache lookup and page count of one batch document; failures are kept in ``error``."""
+    doc = {"index": index, "file": source_name, "path": filepath, "options": dict(options),
+           "hash": None, "page_count": 0, "total_pages": 0, "planned": [], "deferred": [],
+           "cached": False, "report": None, "error": None, "finished": False,
+           "chunks": collections.deque(), "pending": 0, "results": {}, "ocr_stats": add_ocr_stats({}, {})}
+    try:
+        doc["hash"] = doc["options"]["document"] = sha256_file(filepath)
+        if options["save_images"]:
+            keep_document(doc["hash"], filepath)
+        if report_cacheable(options):
+            doc["report"] = load_cached_report(doc["hash"], source_name, doc["options"])
+        if doc["report"] is not None:
+            count("report_cache_hits")
+            doc["cached"] = True
+            doc["page_count"] = len(doc["report"])
+        else:
+            with fitz.open(filepath) as pdf:
+                doc["page_count"] = len(pdf)
+        doc["planned"], doc["deferred"] = plan_pages(options, doc["page_count"])
+    except Exception as e:
+        log.warning("Can't scan %s: %s", source_name, e)
+        doc["error"] = f"{type(e).__name__}: {e}".replace(filepath, source_name)
+        return doc
+    doc["total_pages"] = len(doc["planned"])
+    if doc["cached"]:
+        wanted = set(doc["planned"])
+        doc["report"] = [page_info for page_info in doc["report"] if page_info["page"] in wanted]
+        return doc
+    planned = doc["planned"]
+    doc["chunks"].extend(planned[start:start + BATCH_CHUNK_PAGES]
+                         for start in range(0, len(planned), BATCH_CHUNK_PAGES))
+    return doc
+
+def _run_batch_chunks(docs, parallel):
+    """Yield ``(doc, chunk result or exception)`` as chunks finish.
+
+    Chunks are taken round-robin, shortest document first; the pool gets
+    no more than one chunk per process at a time, so a chunk of a small
+    document never waits behind a queue of chunks of a long one.
+    """
+    rotation = collections.deque(sorted((doc for doc in docs if doc["chunks"]), key=lambda doc: doc["total_pages"]))
+
+    def next_chunk():
+        while rotation:
+            doc = rotation.popleft()
+            if not doc["chunks"]:
+                continue  # failed meanwhile
+            if past_deadline(doc["options"]):
+                doc["chunks"].clear()  # the pages not reached are reported as skipped
+                continue
+            chunk = doc["chunks"].popleft()
+            if doc["chunks"]:
+                rotation.append(doc)
+            doc["pending"] += 1
+            return doc, chunk
+        return None, None
+
+    if not parallel:
+        while True:
+            doc, chunk = next_chunk()
+            if doc is None:
+                return
+            try:
+                # Chunk timings fold into the current breakdown directly in this thread
+                outcome = _scan_page_chunk(doc["path"], doc["file"], chunk, doc["options"])
+            except Exception as e:
+                outcome = e
+            yield doc, outcome
+
+    pool = _get_process_pool()
+    in_flight = {}
+    while True:
+        while len(in_flight) < SCAN_PROCESSES:
+            doc, chunk = next_chunk()
+            if doc is None:
+                break
+            in_flight[pool.submit(_scan_page_chunk, doc["path"], doc["file"], chunk, doc["options"])] = doc
+        if not in_flight:
+            return
+        finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in finished:
+            doc = in_flight.pop(future)
+            try:
+                outcome = future.result()
+                telemetry.merge(outcome[2])
+            except Exception as e:
+                outcome = e
+            yield doc, outcome
+
+def _batch_document_event(doc, started):
+    event = {"type": "document", "index": doc["index"], "file": doc["file"],
+             "status": "failed" if doc["error"] else "done", "cached": doc["cached"],
+             "total_pages": doc["total_pages"], "elapsed": round(time.time() - started, 3)}
+    if doc["error"]:
+        event["error"] = doc["error"]
+    else:
+        report = doc["report"]
+        event["total_images"] = sum(len(page_info["images"]) for page_info in report)
+        event["total_links"] = sum(count_page_links(page_info) for page_info in report)
+        event["scan"] = scan_status(doc["page_count"], doc["planned"], doc["deferred"], report)
+        event["report"] = report
+    doc["finished"] = True
+    doc["report"] = doc["results"] = None  # the caller owns the report now
+    return event
+
+def _iter_batch_events(documents, parallel, options, breakdown):
+    started = time.time()
+    if parallel is None:
+        parallel = SCAN_PROCESSES > 1
+    docs = [_open_batch_document(index, filepath, source_name, options)
+            for index, (filepath, source_name) in enumerate(documents)]
+    total_pages = sum(doc["total_pages"] for doc in docs)
+    yield {"type": "start", "total_pages": total_pages,
+           "documents": [{"index": doc["index"], "file": doc["file"], "total_pages": doc["total_pages"],
+                          "cached": doc["cached"]} for doc in docs]}
+
+    summary = {"type": "summary", "documents": len(docs), "failed": 0, "cached": 0,
+               "total_pages": total_pages, "total_images": 0, "total_links": 0, "ocr_calls_avoided": 0}
+
+    def finished(doc):
+        event = _batch_document_event(doc, started)
+        if doc["error"]:
+            summary["failed"] += 1
+        if doc["cached"]:
+            summary["cached"] += 1
+        summary["total_images"] += event.get("total_images", 0)
+        summary["total_links"] += event.get("total_links", 0)
+        summary["ocr_calls_avoided"] += ocr_calls_avoided(doc["ocr_stats"])
+        return event
+
+    for doc in docs:
+        if doc["error"] or doc["cached"] or not doc["chunks"]:
+            if not doc["error"] and doc["report"] is None:
+                doc["report"] = []  # a PDF without pages
+            yield finished(doc)
+
+    pages_done = sum(doc["total_pages"] for doc in docs if doc["cached"])
+    for doc, outcome in _run_batch_chunks(docs, parallel):
+        doc["pending"] -= 1
+        if doc["error"]:
+            continue  # already reported; its remaining chunks are dropped
+        if isinstance(outcome, Exception):
+            log.error("Batch scan of %s failed: %s", doc["file"], outcome)
+            doc["error"] = f"{type(outcome).__name__}: {outcome}"
+            doc["chunks"].clear()
+            yield finished(doc)
+            continue
+        chunk_results, chunk_ocr_stats, _ = outcome
+        add_ocr_stats(doc["ocr_stats"], chunk_ocr_stats)
+        for result in chunk_results:
+            doc["results"][result[0]["page"]] = result
+        pages_done += len(chunk_results)
+        yield {"type": "progress", "pages_done": pages_done, "total_pages": total_pages,
+               "elapsed": round(time.time() - started, 3)}
+        if not doc["chunks"] and not doc["pending"]:
+            merge_duplicate_images(doc["results"][page_num] for page_num in sorted(doc["results"]))
+            doc["report"] = _finish_report(doc["hash"], doc["file"], doc["results"], doc["ocr_stats"],
+                                           doc["options"], doc["page_count"])
+            yield finished(doc)
+
+    # Documents whose remaining chunks were dropped at the deadline
+    for doc in docs:
+        if not doc["finished"]:
+            merge_duplicate_images(doc["results"][page_num] for page_num in sorted(doc["results"]))
+            doc["report"] = _finish_report(doc["hash"], doc["file"], doc["results"], doc["ocr_stats"],
+                                           doc["options"], doc["page_count"])
+            yield finished(doc)
+
+    log.info("Batch of %d documents completed: %d pages, %d failed",
+             len(docs), total_pages, summary["failed"])
+    summary["elapsed"] = round(time.time() - started, 3)
+    summary["timings"] = breakdown.as_dict()
+    yield summary
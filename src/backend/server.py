@@ -1,215 +1,143 @@
-from flask import Flask, request, jsonify, send_file
+import time
+_import_started = time.time()
+
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
 import os
-import fitz  # PyMuPDF
-from PIL import Image
-import numpy as np
-from pyzbar.pyzbar import decode
-import easyocr
-import re
-import io
-import cv2
+import logging
+import importlib.metadata
+import json
+import uuid
+import shutil
 import signal
 import sys
+import zipfile
 
-app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})
+from werkzeug.utils import secure_filename
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-UPLOAD_FOLDER = os.path.join(BASE_DIR, "pdf_uploads")
-EXTRACT_FOLDER = os.path.join(BASE_DIR, "extracted_images")
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(EXTRACT_FOLDER, exist_ok=True)
+import telemetry
+import warmup
+from artifacts import artifact_store
+from config import BACKEND_URL, UPLOAD_FOLDER
+from governor import AdmissionTimeout, OverBudget, ResourceGovernor
+from jobs import JobQueue, QueueFull
+from links import LinkIndex
+from pageranges import PageRangeError, parse_page_spans
 
-BACKEND_URL = "https://hidden-backend-1.onrender.com"
+telemetry.setup_logging()
+log = logging.getLogger("server")
 
-print("Initializing EasyOCR...")
-reader = easyocr.Reader(['en'], gpu=False)
-print("EasyOCR ready!")
+app = Flask(__name__)
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=["X-OCR-Calls-Avoided"])
+
+# The scanner (fitz, cv2, EasyOCR) is loaded through warmup.get_scanner():
+#   background - load on a daemon thread at startup (default)
+#   preload    - load during import; use with `gunicorn --preload` so forked
+#                workers share the loaded model copy-on-write
+#   lazy       - load on the first scan or /ready probe
+WARMUP_MODE = os.environ.get("WARMUP_MODE", "background")
+
+SCAN_WORKERS = int(os.environ.get("SCAN_WORKERS", 2))
+SCAN_QUEUE_SIZE = int(os.environ.get("SCAN_QUEUE_SIZE", 8))
+job_queue = JobQueue(workers=SCAN_WORKERS, max_queued=SCAN_QUEUE_SIZE)
+
+# Scans start only while their estimated peak memory fits in
+# SCAN_MEMORY_BUDGET_MB for this process (0 turns the check off); see
+# governor.py. Requests wait up to ADMISSION_TIMEOUT seconds for room and
+# then get a 503, queued jobs wait for as long as it takes.
+SCAN_MEMORY_BUDGET_MB = int(os.environ.get("SCAN_MEMORY_BUDGET_MB", 2048))
+ADMISSION_TIMEOUT = float(os.environ.get("ADMISSION_TIMEOUT", 30))
+governor = ResourceGovernor(SCAN_MEMORY_BUDGET_MB * 1024 * 1024)
+
+# Request bodies over MAX_UPLOAD_MB are refused before they are read, and
+# single PDFs (zip members included) over MAX_PDF_MB before they are saved
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", 512))
+MAX_PDF_BYTES = int(os.environ.get("MAX_PDF_MB", 100)) * 1024 * 1024
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_MB * 1024 * 1024
+
+# /upload/batch takes at most BATCH_MAX_FILES PDFs, zip members included, and
+# extracts at most BATCH_MAX_UNZIPPED_MB from zip archives
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", 100))
+BATCH_MAX_UNZIPPED_BYTES = int(os.environ.get("BATCH_MAX_UNZIPPED_MB", 1024)) * 1024 * 1024
+
+# Image URLs are content-addressed, so browsers and proxies may keep them this long
+IMAGE_MAX_AGE = int(os.environ.get("IMAGE_MAX_AGE", 365 * 24 * 3600))
+
+# Per-stage timings go out as a Server-Timing header with ?timings=1, or on
+# every response with SERVER_TIMING=1
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "0") == "1"
 
 def handle_sigint(sig, frame):
-    print("Shutting down gracefully...")
+    log.info("Shutting down gracefully...")
     sys.exit(0)
 
 signal.signal(signal.SIGINT, handle_sigint)
 
-def preprocess_image_for_ocr(img_path):
-    try:
-        img = cv2.imread(img_path)
-        if img is None:
-            return None
-        scale = 2
-        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
-        return binary
-    except Exception as e:
-        print(f"Preprocessing failed: {e}")
-        return None
-
-def extract_qr_codes(img_path):
-    links = []
-    try:
-        image = Image.open(img_path)
-        qr_results = decode(image)
-        if not qr_results:
-            img_cv = cv2.imread(img_path)
-            if img_cv is not None:
-                gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
-                qr_results = decode(gray)
-                if not qr_results:
-                    _, binary = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
-                    qr_results = decode(binary)
-        for qr in qr_results:
-            try:
-                content = qr.data.decode("utf-8").strip()
-                if content:
-                    links.append({
-                        "type": f"{qr.type}",
-                        "content": content,
-                        "description": f"{qr.type} detected"
-                    })
-                    print(f"Found {qr.type}: {content[:50]}...")
-            except Exception as e:
-                print(f"Decoding QR: {e}")
-    except Exception as e:
-        print(f"QR extraction: {e}")
-    return links
+def run_scan(filepath, source_name, progress=None, usage=None, **kwargs):
+    """Job entry point; imports the scanner in the worker thread, not the request.
 
-def extract_text_and_urls(img_path):
-    links = []
-    all_text = []
+    Waits for scan memory without a time limit: the job is already queued.
+    """
     try:
-        print("Running OCR on image...")
-        image = Image.open(img_path).convert("RGB")
-        img_array = np.array(image)
-        ocr_results = reader.readtext(img_array, detail=1, paragraph=False)
-        print(f"Found {len(ocr_results)} text blocks")
-        
-        url_pattern = r'https?://[^\s<>"{}|\\^`\[\]]+'
-        www_pattern = r'www\.[a-zA-Z0-9][a-zA-Z0-9-]+\.[a-zA-Z]{2,}'
-        
-        def clean_url(u):
-            return u.strip().rstrip('.,;:!?)"]\'')
-        
-        for bbox, text, confidence in ocr_results:
-            text = text.strip()
-            if text and confidence > 0.3:
-                all_text.append(text)
-                print(f"OCR: '{text}' (confidence: {confidence:.2f})")
-                
-                for url in re.findall(url_pattern, text, re.IGNORECASE):
-                    url = clean_url(url)
-                    if len(url) > 10:
-                        links.append({
-                            "type": "url",
-                            "content": url,
-                            "description": "URL found in image text",
-                            "confidence": round(confidence, 2)
-                        })
-                        print(f"Found URL: {url}")
-                
-                for url in re.findall(www_pattern, text, re.IGNORECASE):
-                    url = clean_url(url)
-                    full_url = f"https://{url}"
-                    links.append({
-                        "type": "url",
-                        "content": full_url,
-                        "description": "URL found in image text",
-                        "confidence": round(confidence, 2)
-                    })
-                    print(f"Found www URL: {full_url}")
-        
-        if not links and not all_text:
-            print("No text found, trying preprocessed image...")
-            preprocessed = preprocess_image_for_ocr(img_path)
-            if preprocessed is not None:
-                ocr_results = reader.readtext(preprocessed, detail=1, paragraph=False)
-                print(f"Preprocessed OCR found {len(ocr_results)} text blocks")
-                for bbox, text, confidence in ocr_results:
-                    text = text.strip()
-                    if text and confidence > 0.3:
-                        all_text.append(text)
-                        print(f"OCR (enhanced): '{text}' (confidence: {confidence:.2f})")
-                        for url in re.findall(url_pattern, text, re.IGNORECASE):
-                            url = clean_url(url)
-                            if len(url) > 10:
-                                links.append({
-                                    "type": "url",
-                                    "content": url,
-                                    "description": "URL found (enhanced scan)",
-                                    "confidence": round(confidence, 2)
-                                })
-                                print(f"Found URL (enhanced): {url}")
-        
-        if not links and all_text:
-            combined = " ".join(all_text[:3])
-            links.append({
-                "type": "text",
-                "content": combined[:250],
-                "description": "Text detected (no URLs found)"
-            })
-            print(f"No URLs found, returning text content: {combined}")
-        
-        seen = set()
-        unique_links = []
-        for link in links:
-            if link["content"] not in seen:
-                seen.add(link["content"])
-                unique_links.append(link)
-        return unique_links
-    except Exception as e:
-        print(f"OCR extraction: {e}")
-        import traceback
-        traceback.print_exc()
-        return []
-
-def extract_pdf_links_for_area(page, image_area, slice_index):
-    links = []
-    link_dicts = page.get_links()
-    
-    print(f"Slice {slice_index} area: {image_area}")
-    print(f"Found {len(link_dicts)} total links on page")
-    
-    def overlaps(a, b):
-        return not (a[2] <= b[0] or a[0] >= b[2] or a[3] <= b[1] or a[1] >= b[3])
-    
-    for i, ld in enumerate(link_dicts):
-        rect = ld.get("from")
-        uri = ld.get("uri")
-        kind = ld.get("kind")
-        
-        if rect and uri and kind == 2:
-            bbox = [rect.x0, rect.y0, rect.x1, rect.y1]
-            print(f"Link {i}: {uri} at {bbox}")
-            print(f"Comparing with image area: {image_area}")
-            
-            if overlaps(bbox, image_area):
-                links.append({
-                    "content": uri,
-                    "type": "pdf_structural",
-                    "bbox": bbox,
-                    "description": "PDF structural link"
-                })
-                print(f"✅ Matched link: {uri}")
-            else:
-                print(f"❌ No overlap - Link: {bbox} vs Image: {image_area}")
-    
-    print(f"Found {len(links)} matching links for slice {slice_index}")
-    return links
+        scanner = warmup.get_scanner()
+        estimate = scanner.estimate_scan_memory([(filepath, source_name)], **kwargs)
+        with governor.admit(source_name, estimate["bytes"]) as admission:
+            status = {}
+            report = scanner.scan_pdf(filepath, source_name, progress, status=status, **kwargs)
+        if usage:
+            usage(dict(admission.usage(), ocr_calls_avoided=status["ocr_calls_avoided"]))
+        if partial_scan_requested(kwargs):
+            return {"report": report, "scan": status}
+        return report
+    finally:
+        remove_upload(filepath)
+
+@app.before_request
+def start_request_timing():
+    g.request_started = time.perf_counter()
+    g.timings = telemetry.start()
+
+@app.after_request
+def add_request_timing(response):
+    """Record request latency and, when asked for, send the stage breakdown as Server-Timing.
+
+    Streaming responses are measured up to their first byte; their scan's
+    breakdown arrives in the summary event instead.
+    """
+    started = g.get("request_started")
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    telemetry.registry.observe_request(endpoint, response.status_code, elapsed)
+    breakdown = g.get("timings")
+    if breakdown is not None and query_flag("timings", default=SERVER_TIMING):
+        stages = breakdown.server_timing()
+        response.headers["Server-Timing"] = (stages + ", " if stages else "") + f"total;dur={elapsed * 1000:.1f}"
+    return response
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({"error": f"Upload larger than {MAX_UPLOAD_MB}MB"}), 413
+
+@app.teardown_request
+def finish_request_timing(exc):
+    breakdown = g.pop("timings", None)
+    if breakdown is not None:
+        telemetry.finish(breakdown)
 
 # ===== DIAGNOSTIC ENDPOINTS =====
 @app.route("/version")
 def version():
     """Check backend version and PyMuPDF status"""
     try:
-        import fitz
-        pymupdf_version = fitz.__doc__.split(' ')[1] if fitz.__doc__ else "unknown"
+        # Read the installed version without importing fitz, so this answers during warm-up
+        pymupdf_version = importlib.metadata.version("PyMuPDF")
         return jsonify({
             "backend_version": "2.0",
             "pymupdf_version": pymupdf_version,
             "status": "✅ PyMuPDF is working",
-            "endpoints": ["/upload", "/debug-upload", "/simple-test", "/diagnostics", "/test-pymupdf", "/version"]
+            "endpoints": ["/upload", "/upload/stream", "/upload/batch", "/jobs", "/cache", "/debug-upload", "/simple-test", "/diagnostics", "/test-pymupdf", "/version", "/ready", "/metrics"]
         })
     except ImportError as e:
         return jsonify({
@@ -241,7 +169,12 @@ def diagnostics():
         "python_version": sys.version,
         "pymupdf_status": pymupdf_status,
         "pymupdf_version": pymupdf_version,
-        "installed_packages": installed_packages
+        "installed_packages": installed_packages,
+        "startup": {
+            "warmup_mode": WARMUP_MODE,
+            "server_import_seconds": SERVER_IMPORT_SECONDS,
+            **warmup.status()
+        }
     })
 
 @app.route("/test-pymupdf")
@@ -275,263 +208,432 @@ def test_pymupdf():
 @app.route("/simple-test", methods=["POST"])
 def simple_test():
     """Super simple test - just return the links as JSON"""
-    print("🔍 SIMPLE-TEST: Starting...")
+    log.debug("simple-test: starting")
     
     if "file" not in request.files:
         return jsonify({"error": "No file uploaded"}), 400
     
     file = request.files["file"]
-    print(f"📁 File received: {file.filename}")
+    log.debug("simple-test: received %s", file.filename)
+    import fitz
     
     # Save file temporarily
-    filepath = os.path.join(UPLOAD_FOLDER, "test_file.pdf")
-    file.save(filepath)
-    print(f"💾 File saved: {filepath}")
+    filepath = save_upload(file)
+    log.debug("simple-test: saved as %s", filepath)
     
     try:
         pdf = fitz.open(filepath)
-        print(f"📄 PDF opened successfully, pages: {len(pdf)}")
+        log.debug("simple-test: PDF opened, %d pages", len(pdf))
         
         results = []
         
         for page_num, page in enumerate(pdf, start=1):
-            print(f"🔍 Checking page {page_num}...")
-            links = page.get_links()
-            print(f"📊 Found {len(links)} links on page {page_num}")
+            link_index = LinkIndex.for_page(page)
+            log.debug("simple-test: page %d has %d links", page_num, len(link_index.links))
             
             page_links = []
-            for link in links:
-                print(f"   Link: {link}")
-                if link.get('kind') == 2 and link.get('uri'):
-                    page_links.append({
-                        "uri": link.get('uri'),
-                        "position": {
-                            "x0": link['from'].x0,
-                            "y0": link['from'].y0,
-                            "x1": link['from'].x1, 
-                            "y1": link['from'].y1
-                        }
-                    })
+            for record in link_index.uri_links:
+                log.debug("simple-test: link %s at %s", record["uri"], record["bbox"])
+                page_links.append({
+                    "uri": record["uri"],
+                    "position": {
+                        "x0": record["rect"].x0,
+                        "y0": record["rect"].y0,
+                        "x1": record["rect"].x1, 
+                        "y1": record["rect"].y1
+                    }
+                })
             
             results.append({
                 "page": page_num,
-                "total_links": len(links),
+                "total_links": len(link_index.links),
                 "uri_links": page_links
             })
         
         pdf.close()
-        print(f"🎉 SIMPLE-TEST: Returning {sum(len(p['uri_links']) for p in results)} URI links")
+        log.debug("simple-test: returning %d URI links", sum(len(p["uri_links"]) for p in results))
         return jsonify({"success": True, "results": results})
         
     except Exception as e:
-        print(f"💥 ERROR: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("simple-test failed: %s", e)
         return jsonify({"error": str(e)}), 500
+    finally:
+        remove_upload(filepath)
 
 # ===== MAIN ENDPOINTS =====
-@app.route("/images/<filename>")
-def serve_image(filename):
+@app.route("/images/<path:artifact>")
+def serve_image(artifact):
+    """Serve a scan image: ``<namespace>/<content hash>.<ext>`` from the artifact
+    store or ``r/<pdf hash>/<region>.png``, rendered on first request.
+    ``?size=128|256|512`` returns a thumbnail. URLs never change meaning, so
+    responses carry an ETag, answer If-None-Match with 304 and may be cached
+    for a year."""
     try:
-        img_path = os.path.join(EXTRACT_FOLDER, filename)
-        if not os.path.exists(img_path):
-            return jsonify({"error": "Image not found"}), 404
-        return send_file(img_path, mimetype='image/png')
+        found = warmup.get_scanner().image_file(artifact, request.args.get("size", type=int))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        print(f"Serving image: {e}")
+        log.exception("Serving image %s failed", artifact)
         return jsonify({"error": str(e)}), 500
-
-@app.route("/upload", methods=["POST"])
-def upload_file():
-    print("\n" + "="*60)
-    print("🚀 NEW PDF UPLOAD REQUEST - FIXED VERSION")
-    print("="*60)
-    
+    if found is None:
+        return jsonify({"error": "Image not found"}), 404
+    img_path, etag = found
+    response = send_file(img_path, etag=etag, conditional=True, max_age=IMAGE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+def validate_pdf_upload():
+    """Return (file, None) for a valid PDF upload or (None, error response)."""
     if "file" not in request.files:
-        return jsonify({"error": "No file uploaded"}), 400
+        return None, (jsonify({"error": "No file uploaded"}), 400)
     
     file = request.files["file"]
     if file.filename == "":
-        return jsonify({"error": "No file selected"}), 400
+        return None, (jsonify({"error": "No file selected"}), 400)
     if not file.filename.lower().endswith(".pdf"):
-        return jsonify({"error": "Only PDF files allowed"}), 400
-
-    filepath = os.path.join(UPLOAD_FOLDER, file.filename)
+        return None, (jsonify({"error": "Only PDF files allowed"}), 400)
+    if upload_size(file) > MAX_PDF_BYTES:
+        return None, (jsonify({"error": f"PDF larger than {MAX_PDF_BYTES // (1024 * 1024)}MB"}), 413)
+    return file, None
+
+def upload_size(file):
+    """Size of an uploaded file; werkzeug has already spooled it, so this reads nothing"""
+    stream = file.stream
+    position = stream.tell()
+    size = stream.seek(0, os.SEEK_END)
+    stream.seek(position)
+    return size
+
+def upload_path(filename):
+    """A unique path in UPLOAD_FOLDER so concurrent requests never share a file"""
+    return os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4().hex}_{secure_filename(filename) or 'upload.pdf'}")
+
+def save_upload(file):
+    filepath = upload_path(file.filename)
     file.save(filepath)
-    print(f"📁 Saved PDF: {file.filename}")
-
-    # Clear old images
-    for f in os.listdir(EXTRACT_FOLDER):
+    return filepath
+
+def save_zip_pdfs(file, documents, unzipped):
+    """Extract the PDFs of an uploaded zip archive; returns the bytes extracted so far."""
+    with zipfile.ZipFile(file.stream) as archive:
+        for member in archive.infolist():
+            name = member.filename
+            if member.is_dir() or not name.lower().endswith(".pdf") or name.startswith("__MACOSX/"):
+                continue
+            # zipfile never returns more than the declared size, so this bounds the disk use
+            unzipped += member.file_size
+            if unzipped > BATCH_MAX_UNZIPPED_BYTES:
+                raise ValueError(f"Zip contents exceed {BATCH_MAX_UNZIPPED_BYTES // (1024 * 1024)}MB")
+            if member.file_size > MAX_PDF_BYTES:
+                raise ValueError(f"{name} is larger than {MAX_PDF_BYTES // (1024 * 1024)}MB")
+            if len(documents) >= BATCH_MAX_FILES:
+                raise ValueError(f"At most {BATCH_MAX_FILES} PDFs per batch")
+            filepath = upload_path(os.path.basename(name))
+            # Listed before writing, so a member that fails halfway is removed too
+            documents.append((filepath, os.path.basename(name)))
+            with archive.open(member) as source, open(filepath, "wb") as target:
+                shutil.copyfileobj(source, target)
+    return unzipped
+
+def save_batch_upload():
+    """Save every PDF of a batch upload (``files`` fields; zip archives are unpacked).
+
+    Returns ([(filepath, source_name), ...], None) or (None, error response)
+    once anything already saved has been removed.
+    """
+    uploads = request.files.getlist("files") + request.files.getlist("file")
+    if not uploads:
+        return None, (jsonify({"error": "No files uploaded"}), 400)
+
+    documents = []
+    unzipped = 0
+    saved = False
+    try:
+        for file in uploads:
+            name = (file.filename or "").lower()
+            if name.endswith(".zip"):
+                unzipped = save_zip_pdfs(file, documents, unzipped)
+            elif not name.endswith(".pdf"):
+                raise ValueError(f"Only PDF and zip files allowed: {file.filename or '(no name)'}")
+            elif len(documents) >= BATCH_MAX_FILES:
+                raise ValueError(f"At most {BATCH_MAX_FILES} PDFs per batch")
+            elif upload_size(file) > MAX_PDF_BYTES:
+                raise ValueError(f"{file.filename} is larger than {MAX_PDF_BYTES // (1024 * 1024)}MB")
+            else:
+                documents.append((save_upload(file), file.filename))
+        if not documents:
+            raise ValueError("No PDF files in the upload")
+        saved = True
+    except (ValueError, zipfile.BadZipFile, RuntimeError, NotImplementedError) as e:
+        # zipfile raises RuntimeError for encrypted members and
+        # NotImplementedError for compression methods it can't read
+        return None, (jsonify({"error": str(e)}), 400)
+    finally:
+        if not saved:
+            for filepath, _ in documents:
+                remove_upload(filepath)
+    return documents, None
+
+def remove_upload(filepath):
+    try:
+        os.remove(filepath)
+    except OSError:
+        pass
+
+def query_flag(name, default=True):
+    """Read a boolean query flag such as ``?cache=0`` (0/false/no/off disable it)"""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    return value.lower() not in ("0", "false", "no", "off")
+
+def requested_scan_options():
+    """Scan options from the query string: ``?cache=0`` bypasses the result
+    caches, ``?images=0`` leaves out image URLs the client won't fetch,
+    ``?text_layer=0`` forces OCR even where the PDF has vector text,
+    ``?full_page=1`` scans whole rendered pages (flattened/scanned PDFs).
+
+    For a quick preview ``?pages=1-5,8`` picks pages, ``?max_pages=N`` caps
+    how many are scanned and ``?deadline=S`` stops the scan after S seconds
+    (for jobs, counted from when the job starts).
+
+    Returns (options, None) or (None, error response).
+    """
+    options = {
+        "use_cache": query_flag("cache"),
+        "save_images": query_flag("images"),
+        "text_layer": query_flag("text_layer"),
+        "full_page": query_flag("full_page", default=False),
+    }
+    try:
+        pages = request.args.get("pages")
+        if pages:
+            parse_page_spans(pages)  # check the syntax; the page count isn't known yet
+            options["pages"] = pages
+        max_pages = request.args.get("max_pages")
+        if max_pages:
+            options["max_pages"] = int(max_pages)
+            if options["max_pages"] < 1:
+                raise ValueError("max_pages must be at least 1")
+        deadline = request.args.get("deadline")
+        if deadline:
+            options["deadline"] = float(deadline)
+            if not options["deadline"] > 0:
+                raise ValueError("deadline must be a positive number of seconds")
+    except ValueError as e:
+        return None, (jsonify({"error": str(e)}), 400)
+    return options, None
+
+def partial_scan_requested(options):
+    """Bounded scans answer ``{"report": [...], "scan": status}`` so clients can resume them."""
+    return any(options.get(name) for name in ("pages", "max_pages", "deadline"))
+
+def admit_scan(documents, options, batch=False):
+    """Estimate a scan's memory and wait for room in the budget.
+
+    Returns (admission, None) or (None, error response): 400 for ``pages``
+    outside the document, 413 for a scan that can never fit, 503 with
+    Retry-After when no room freed up in time.
+    """
+    name = documents[0][1] if len(documents) == 1 else f"batch of {len(documents)} PDFs"
+    try:
+        estimate = warmup.get_scanner().estimate_scan_memory(documents, batch=batch, **options)
+    except PageRangeError as e:
+        return None, (jsonify({"error": str(e)}), 400)
+    try:
+        return governor.admit(name, estimate["bytes"], ADMISSION_TIMEOUT), None
+    except OverBudget as e:
+        return None, (jsonify({"error": str(e), "estimate": estimate}), 413)
+    except AdmissionTimeout as e:
+        response = jsonify({"error": str(e), "memory": governor.stats()})
+        response.headers["Retry-After"] = "10"
+        return None, (response, 503)
+
+def event_stream(events, stream_format, filepaths, admission=None):
+    """Stream scan events as NDJSON or SSE, removing ``filepaths`` and closing ``admission`` once done."""
+    def generate():
         try:
-            os.remove(os.path.join(EXTRACT_FOLDER, f))
-        except:
-            pass
-
-    pdf = fitz.open(filepath)
-    report = []
-    total_images = 0
-    total_links = 0
-
-    for page_num, page in enumerate(pdf, start=1):
-        page_info = {"page": page_num, "images": []}
-        
-        print(f"\n📄 PROCESSING PAGE {page_num}")
-        print("-" * 40)
-        
-        # STEP 1: Get ALL PDF links (this works as your test shows)
-        all_pdf_links = page.get_links()
-        print(f"🔍 Found {len(all_pdf_links)} total links on page {page_num}")
-        
-        # Filter only URI links (kind 2)
-        uri_links = [ld for ld in all_pdf_links if ld.get('kind') == 2 and ld.get('uri')]
-        print(f"🌐 Found {len(uri_links)} URI links")
-        
-        # STEP 2: Process each URI link and create images from link areas
-        for link_idx, ld in enumerate(uri_links):
-            rect = ld.get("from")
-            uri = ld.get("uri")
-            
-            print(f"\n  🔗 Processing URI Link {link_idx}:")
-            print(f"     URL: {uri}")
-            print(f"     Position: [{rect.x0:.1f}, {rect.y0:.1f}, {rect.x1:.1f}, {rect.y1:.1f}]")
-            
-            # Create image from link area
-            base_name = os.path.splitext(file.filename)[0].replace(" ", "_")
-            filename = f"{base_name}_page{page_num}_link{link_idx}.png"
-            img_path = os.path.join(EXTRACT_FOLDER, filename)
-            
-            try:
-                # Render the link area as high-quality image with padding
-                padding = 5
-                clip_rect = fitz.Rect(
-                    max(0, rect.x0 - padding),
-                    max(0, rect.y0 - padding),
-                    min(page.rect.width, rect.x1 + padding),
-                    min(page.rect.height, rect.y1 + padding)
-                )
-                
-                # High quality rendering
-                mat = fitz.Matrix(2, 2)  # 2x zoom for better quality
-                pix = page.get_pixmap(matrix=mat, clip=clip_rect)
-                pix.save(img_path)
-                total_images += 1
-                
-                print(f"     ✅ Saved link area image: {filename}")
-                print(f"     📐 Image size: {pix.width} x {pix.height} pixels")
-                
-                # STEP 3: Create the PDF structural link entry (THIS IS WHAT WE NEED!)
-                pdf_link = {
-                    "content": uri,
-                    "type": "pdf_structural",
-                    "bbox": [rect.x0, rect.y0, rect.x1, rect.y1],
-                    "description": f"PDF structural link"
-                }
-                
-                # Also scan for QR codes and OCR (optional)
-                qr_links = extract_qr_codes(img_path)
-                ocr_links = extract_text_and_urls(img_path)
-                
-                # Combine all links - PDF structural link is MOST IMPORTANT
-                all_links = [pdf_link] + qr_links + ocr_links
-                
-                # Deduplicate
-                seen = set()
-                unique_links = []
-                for link in all_links:
-                    content = link["content"]
-                    if content not in seen:
-                        seen.add(content)
-                        unique_links.append(link)
-                
-                total_links += len(unique_links)
-                
-                # Log results
-                if unique_links:
-                    print(f"     ✅ FOUND {len(unique_links)} LINK(S)!")
-                    for link in unique_links:
-                        print(f"        - {link['type']}: {link['content'][:60]}...")
+            for event in events:
+                payload = json.dumps(event)
+                if stream_format == "sse":
+                    yield f"event: {event['type']}\ndata: {payload}\n\n"
                 else:
-                    print(f"     ❌ No additional links detected")
-                
-                # Add to page results - THIS IS WHAT GOES TO FRONTEND
-                page_info["images"].append({
-                    "filename": filename,
-                    "url": f"{BACKEND_URL}/images/{filename}",
-                    "image_area": [rect.x0, rect.y0, rect.x1, rect.y1],
-                    "clickable_links_found": len(unique_links) > 0,
-                    "extracted_links": unique_links
-                })
-                
-            except Exception as e:
-                print(f"     💥 ERROR processing link area: {e}")
-                import traceback
-                traceback.print_exc()
-        
-        # STEP 4: Also process any actual embedded images (if they exist)
-        images = page.get_images(full=True)
-        print(f"\n  🖼️  Found {len(images)} embedded images on page")
-        
-        for img_index, img in enumerate(images):
-            xref = img[0]
-            try:
-                base_image = pdf.extract_image(xref)
-                image_bytes = base_image["image"]
-                base_name = os.path.splitext(file.filename)[0].replace(" ", "_")
-                filename = f"{base_name}_page{page_num}_img{img_index}.png"
-                img_path = os.path.join(EXTRACT_FOLDER, filename)
-
-                img_pil = Image.open(io.BytesIO(image_bytes))
-                img_pil.save(img_path, "PNG")
-                total_images += 1
-
-                image_rects = page.get_image_rects(xref)
-                image_area = [0, 0, 0, 0]
-                if image_rects:
-                    rect = image_rects[0]
-                    image_area = [rect.x0, rect.y0, rect.x1, rect.y1]
-
-                print(f"     Processing embedded image {img_index} at {image_area}")
-
-                # Extract links from embedded image
-                pdf_links = extract_pdf_links_for_area(page, image_area, img_index)
-                qr_links = extract_qr_codes(img_path)
-                ocr_links = extract_text_and_urls(img_path)
-
-                all_links = pdf_links + qr_links + ocr_links
-                
-                seen = set()
-                unique_links = []
-                for link in all_links:
-                    content = link["content"]
-                    if content not in seen:
-                        seen.add(content)
-                        unique_links.append(link)
-
-                total_links += len(unique_links)
-
-                page_info["images"].append({
-                    "filename": filename,
-                    "url": f"{BACKEND_URL}/images/{filename}",
-                    "image_area": image_area,
-                    "clickable_links_found": len(unique_links) > 0,
-                    "extracted_links": unique_links
-                })
+                    yield payload + "\n"
+        except Exception as e:
+            log.exception("Streaming scan failed: %s", e)
+            payload = json.dumps({"type": "error", "error": str(e)})
+            yield f"event: error\ndata: {payload}\n\n" if stream_format == "sse" else payload + "\n"
+        finally:
+            if admission is not None:
+                admission.close()
+            for filepath in filepaths:
+                remove_upload(filepath)
+
+    mimetype = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    if admission is not None:
+        # Also when the client goes away before the stream starts, so generate() never runs
+        response.call_on_close(admission.close)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # don't let nginx buffer the stream
+    return response
 
-            except Exception as e:
-                print(f"     💥 ERROR processing embedded image: {e}")
+@app.route("/upload", methods=["POST"])
+def upload_file():
+    file, error = validate_pdf_upload()
+    if error:
+        return error
+    options, error = requested_scan_options()
+    if error:
+        return error
 
-        report.append(page_info)
+    filepath = save_upload(file)
+    log.info("Saved PDF for scan: %s", file.filename)
 
-    pdf.close()
-    
-    print(f"\n" + "="*60)
-    print(f"🎉 SCAN COMPLETED!")
-    print(f"📊 Total Images Created: {total_images}")
-    print(f"🔗 Total Links Found: {total_links}")
-    print(f"📄 Total Pages Processed: {len(report)}")
-    print("="*60)
-    
-    return jsonify(report)
+    status = {}
+    try:
+        admission, error = admit_scan([(filepath, file.filename)], options)
+        if error:
+            return error
+        with admission:
+            report = warmup.get_scanner().scan_pdf(filepath, file.filename, status=status, **options)
+    finally:
+        remove_upload(filepath)
+    if partial_scan_requested(options):
+        response = jsonify({"report": report, "scan": status})
+    else:
+        response = jsonify(report)
+    response.headers["X-OCR-Calls-Avoided"] = str(status["ocr_calls_avoided"])
+    return response
+
+@app.route("/upload/stream", methods=["POST"])
+def upload_file_stream():
+    """Like /upload, but streams each page as soon as it is scanned.
+
+    ``?format=ndjson`` (default) sends one JSON event per line;
+    ``?format=sse`` sends Server-Sent Events named after the event type.
+    """
+    file, error = validate_pdf_upload()
+    if error:
+        return error
+
+    stream_format = request.args.get("format", "ndjson")
+    if stream_format not in ("ndjson", "sse"):
+        return jsonify({"error": "format must be ndjson or sse"}), 400
+    options, error = requested_scan_options()
+    if error:
+        return error
+
+    filepath = save_upload(file)
+    log.info("Saved PDF for streaming scan: %s", file.filename)
+
+    admission, error = admit_scan([(filepath, file.filename)], options)
+    if error:
+        remove_upload(filepath)
+        return error
+    events = warmup.get_scanner().iter_scan_events(filepath, file.filename, **options)
+    return event_stream(events, stream_format, [filepath], admission)
+
+@app.route("/upload/batch", methods=["POST"])
+def upload_batch():
+    """Scan many PDFs, or zip archives of them, in one request.
+
+    The documents' pages share the scan workers round-robin, so small
+    documents finish within seconds even next to a long one.
+    ``?format=json`` (default) answers with every document's report and a
+    summary once all are done; ``ndjson``/``sse`` stream a ``document``
+    event as each one finishes (see scanner.iter_batch_events).
+    """
+    stream_format = request.args.get("format", "json")
+    if stream_format not in ("json", "ndjson", "sse"):
+        return jsonify({"error": "format must be json, ndjson or sse"}), 400
+    options, error = requested_scan_options()
+    if error:
+        return error
+
+    documents, error = save_batch_upload()
+    if error:
+        return error
+    log.info("Saved %d PDF(s) for batch scan", len(documents))
+
+    filepaths = [filepath for filepath, _ in documents]
+    admission, error = admit_scan(documents, options, batch=True)
+    if error:
+        for filepath in filepaths:
+            remove_upload(filepath)
+        return error
+    if stream_format != "json":
+        events = warmup.get_scanner().iter_batch_events(documents, **options)
+        return event_stream(events, stream_format, filepaths, admission)
+    try:
+        with admission:
+            result = warmup.get_scanner().scan_batch(documents, **options)
+    finally:
+        for filepath in filepaths:
+            remove_upload(filepath)
+    return jsonify(result)
+
+@app.route("/jobs", methods=["POST"])
+def create_job():
+    """Queue a PDF scan and return its job ID immediately"""
+    file, error = validate_pdf_upload()
+    if error:
+        return error
+    options, error = requested_scan_options()
+    if error:
+        return error
+
+    filepath = save_upload(file)
+
+    try:
+        job_id = job_queue.submit(run_scan, filepath, file.filename, **options)
+    except QueueFull as e:
+        remove_upload(filepath)
+        response = jsonify({"error": str(e), "queue": job_queue.stats()})
+        response.headers["Retry-After"] = "10"
+        return response, 429
+
+    log.info("Queued job %s for %s", job_id, file.filename)
+    return jsonify({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"{BACKEND_URL}/jobs/{job_id}"
+    }), 202
+
+@app.route("/jobs/<job_id>")
+def get_job(job_id):
+    """Report status, progress and (when finished) results of a scan job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route("/cache")
+def cache_status():
+    """Hit/miss counters and disk usage of the report and image caches and the artifact store"""
+    stats = warmup.get_scanner().cache_stats()
+    stats["artifacts"] = artifact_store.stats()
+    return jsonify(stats)
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus metrics for this process: stage timings, scan counters, request latency"""
+    queue = job_queue.stats()
+    memory = governor.stats()
+    gauges = {
+        "jobs_queued": queue["queued"],
+        "jobs_running": queue["jobs"].get("running", 0),
+        "uptime_seconds": round(time.time() - warmup.PROCESS_STARTED, 1),
+        "scan_memory_budget_bytes": memory["budget_bytes"],
+        "scan_memory_admitted_bytes": memory["admitted_bytes"],
+        "scans_admitted": memory["scans_admitted"],
+        "scans_waiting": memory["scans_waiting"],
+        "scans_rejected": memory["scans_rejected"],
+        "scan_admission_timeouts": memory["admission_timeouts"],
+        "scan_peak_rss_bytes": memory["peak_scan_rss_bytes"],
+    }
+    return Response(telemetry.registry.render(gauges), mimetype="text/plain; version=0.0.4")
 
 @app.route("/debug-upload", methods=["POST"])
 def debug_upload():
@@ -543,9 +645,9 @@ def debug_upload():
     if file.filename == "":
         return jsonify({"error": "No file selected"}), 400
 
-    filepath = os.path.join(UPLOAD_FOLDER, "debug_" + file.filename)
-    file.save(filepath)
+    filepath = save_upload(file)
     
+    import fitz
     pdf = fitz.open(filepath)
     debug_info = {
         "file_info": {
@@ -568,37 +670,37 @@ def debug_upload():
         }
         
         # Get ALL links
-        links = page.get_links()
-        print(f"\n=== PAGE {page_num} DEBUG ===")
-        print(f"Total links found: {len(links)}")
+        link_index = LinkIndex.for_page(page)
+        log.debug("debug-upload: page %d has %d links", page_num, len(link_index.links))
+        for i, link in enumerate(link_index.links):
+            log.debug("debug-upload: link %d: %s", i, link)
         
-        for i, link in enumerate(links):
-            print(f"Link {i}: {link}")
-            if link.get('kind') == 2 and link.get('uri'):  # URI links
-                rect = link.get('from')
-                page_info["links"].append({
-                    "link_number": i,
-                    "uri": link.get('uri'),
-                    "position": {
-                        "x0": rect.x0,
-                        "y0": rect.y0,
-                        "x1": rect.x1, 
-                        "y1": rect.y1
-                    },
-                    "area": f"{rect.x0},{rect.y0} to {rect.x1},{rect.y1}"
-                })
+        for record in link_index.uri_links:  # URI links
+            rect = record["rect"]
+            page_info["links"].append({
+                "link_number": record["index"],
+                "uri": record["uri"],
+                "position": {
+                    "x0": rect.x0,
+                    "y0": rect.y0,
+                    "x1": rect.x1, 
+                    "y1": rect.y1
+                },
+                "area": f"{rect.x0},{rect.y0} to {rect.x1},{rect.y1}"
+            })
         
         # Check images
         images = page.get_images()
         page_info["images_found"] = len(images)
-        print(f"Images found: {len(images)}")
+        log.debug("debug-upload: page %d has %d images", page_num, len(images))
         
         for img_index, img in enumerate(images):
-            print(f"Image {img_index}: {img}")
+            log.debug("debug-upload: image %d: %s", img_index, img)
         
         debug_info["pages"].append(page_info)
     
     pdf.close()
+    remove_upload(filepath)
     return jsonify(debug_info)
     
 @app.route("/")
@@ -609,6 +711,20 @@ def home():
 def health():
     return jsonify({"status": "healthy"})
 
+@app.route("/ready")
+def ready():
+    """Readiness probe: 200 once the scanner and OCR model are loaded, 503 before"""
+    warmup.start_background_warmup()
+    status = warmup.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+if WARMUP_MODE == "preload":
+    warmup.load_models()
+elif WARMUP_MODE == "background":
+    warmup.start_background_warmup()
+
+SERVER_IMPORT_SECONDS = round(time.time() - _import_started, 3)
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
     app.run(host="0.0.0.0", port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,220 @@
+"""Logging setup, per-scan timing breakdowns and the Prometheus registry.
+
+Scanning code wraps its hot spots in ``timer("ocr")`` and bumps counters
+with ``count("images")``. Both record into the *current breakdown*, a
+per-thread ``Breakdown`` opened with ``collect()``. When the outermost
+breakdown closes it is added to ``registry``, which ``/metrics`` renders in
+the Prometheus text format; nested ones fold into their parent, so each
+measurement is counted once. Breakdowns are plain dicts underneath, so
+process-pool workers return theirs and the parent ``merge``s them.
+
+Standard library only: ``setup_logging`` is also the initializer of the
+scanner's process pool, and a spawned worker should not pay for more than
+logging before its first chunk.
+"""
+import bisect
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# "text" for people, "json" for one JSON object per line (log shippers)
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+
+STAGES = ("render", "extract", "qr", "ocr", "ocr_enhanced", "link_match")
+# Request latency histogram buckets, in seconds
+REQUEST_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+def setup_logging(level=None):
+    """Configure the root logger once; ``LOG_LEVEL``/``LOG_FORMAT`` come from the environment."""
+    root = logging.getLogger()
+    if getattr(root, "_hidden_configured", False):
+        return
+    handler = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(level or LOG_LEVEL)
+    root._hidden_configured = True
+
+
+class Breakdown:
+    """Stage timings and counters of one request or scan."""
+
+    def __init__(self):
+        self.stages = {}    # stage -> [seconds, calls]
+        self.counters = {}  # name -> count
+
+    def add_time(self, stage, seconds, calls=1):
+        entry = self.stages.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += calls
+
+    def incr(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, data):
+        """Fold in another breakdown, or the ``as_dict()`` of one."""
+        if isinstance(data, Breakdown):
+            data = data.as_dict()
+        for stage, entry in data.get("stages", {}).items():
+            self.add_time(stage, entry["seconds"], entry["calls"])
+        for name, n in data.get("counters", {}).items():
+            self.incr(name, n)
+
+    def as_dict(self):
+        return {
+            "stages": {stage: {"seconds": round(seconds, 6), "calls": calls}
+                       for stage, (seconds, calls) in self.stages.items()},
+            "counters": dict(self.counters),
+        }
+
+    def server_timing(self):
+        """``Server-Timing`` header value (durations in milliseconds)."""
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, (seconds, _) in self.stages.items())
+
+
+_local = threading.local()
+
+def current():
+    """The calling thread's innermost open breakdown, or None."""
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else None
+
+def start():
+    breakdown = Breakdown()
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(breakdown)
+    return breakdown
+
+def finish(breakdown):
+    """Close ``breakdown``: fold it into its parent, or into ``registry`` if outermost."""
+    stack = getattr(_local, "stack", None)
+    if not stack or breakdown not in stack:
+        return
+    while stack and stack.pop() is not breakdown:
+        pass
+    parent = current()
+    if parent is not None:
+        parent.merge(breakdown)
+    else:
+        registry.add(breakdown)
+
+@contextlib.contextmanager
+def collect():
+    breakdown = start()
+    try:
+        yield breakdown
+    finally:
+        finish(breakdown)
+
+@contextlib.contextmanager
+def timer(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        breakdown = current()
+        if breakdown is not None:
+            breakdown.add_time(stage, time.perf_counter() - started)
+
+def add_time(stage, seconds):
+    """Record ``seconds`` for ``stage`` measured by the caller, e.g. around a conditional step."""
+    breakdown = current()
+    if breakdown is not None:
+        breakdown.add_time(stage, seconds)
+
+def count(name, n=1):
+    breakdown = current()
+    if breakdown is not None and n:
+        breakdown.incr(name, n)
+
+def merge(data):
+    """Fold a worker's breakdown into the current one (or straight into the registry)."""
+    breakdown = current()
+    if breakdown is not None:
+        breakdown.merge(data)
+    else:
+        registry.add(data)
+
+
+class Registry:
+    """Process-wide totals, rendered in the Prometheus text exposition format."""
+
+    def __init__(self, prefix="hidden"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._totals = Breakdown()
+        self._requests = {}  # (endpoint, status) -> [bucket counts..., sum, count]
+
+    def add(self, breakdown):
+        with self._lock:
+            self._totals.merge(breakdown)
+
+    def observe_request(self, endpoint, status, seconds):
+        with self._lock:
+            entry = self._requests.setdefault((endpoint, status), [0] * len(REQUEST_BUCKETS) + [0.0, 0])
+            index = bisect.bisect_left(REQUEST_BUCKETS, seconds)
+            if index < len(REQUEST_BUCKETS):
+                entry[index] += 1
+            entry[-2] += seconds
+            entry[-1] += 1
+
+    def render(self, gauges=None):
+        """Exposition text; ``gauges`` adds ``{name: value}`` point-in-time values."""
+        p = self.prefix
+        with self._lock:
+            totals = self._totals.as_dict()
+            requests = {key: list(entry) for key, entry in self._requests.items()}
+        lines = [
+            f"# HELP {p}_stage_seconds_total Time spent per pipeline stage.",
+            f"# TYPE {p}_stage_seconds_total counter",
+        ]
+        stages = totals["stages"]
+        for stage in sorted(set(STAGES) | set(stages)):
+            lines.append(f'{p}_stage_seconds_total{{stage="{stage}"}} {stages.get(stage, {}).get("seconds", 0)}')
+        lines += [f"# HELP {p}_stage_calls_total Timed calls per pipeline stage.",
+                  f"# TYPE {p}_stage_calls_total counter"]
+        for stage in sorted(set(STAGES) | set(stages)):
+            lines.append(f'{p}_stage_calls_total{{stage="{stage}"}} {stages.get(stage, {}).get("calls", 0)}')
+        for name, value in sorted(totals["counters"].items()):
+            lines += [f"# TYPE {p}_{name}_total counter", f"{p}_{name}_total {value}"]
+
+        lines += [f"# HELP {p}_request_seconds HTTP request latency.",
+                  f"# TYPE {p}_request_seconds histogram"]
+        for (endpoint, status), entry in sorted(requests.items()):
+            labels = f'endpoint="{endpoint}",status="{status}"'
+            cumulative = 0
+            for bound, n in zip(REQUEST_BUCKETS, entry):
+                cumulative += n
+                lines.append(f'{p}_request_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{p}_request_seconds_bucket{{{labels},le="+Inf"}} {entry[-1]}')
+            lines.append(f"{p}_request_seconds_sum{{{labels}}} {round(entry[-2], 6)}")
+            lines.append(f"{p}_request_seconds_count{{{labels}}} {entry[-1]}")
+
+        for name, value in sorted((gauges or {}).items()):
+            lines += [f"# TYPE {p}_{name} gauge", f"{p}_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
@@ -0,0 +1,38 @@
+import importlib
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Tests import the backend's flat modules the way server.py does, and keep
+# the scanner's disk caches, uploads and images out of the source tree.
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="scanner-cache-"))
+os.environ.setdefault("UPLOAD_FOLDER", tempfile.mkdtemp(prefix="scanner-uploads-"))
+os.environ.setdefault("EXTRACT_FOLDER", tempfile.mkdtemp(prefix="scanner-images-"))
+os.environ.setdefault("WARMUP_MODE", "lazy")  # no OCR model for the server's requests
+
+
+def import_with_zbar(name):
+    # pyzbar itself imports without the zbar shared library; pyzbar.pyzbar doesn't
+    pytest.importorskip("pyzbar.pyzbar", exc_type=ImportError)
+    return importlib.import_module(name)
+
+
+@pytest.fixture(scope="session")
+def scanner():
+    """The scanner module; tests using it are skipped where zbar is missing."""
+    return import_with_zbar("scanner")
+
+
+@pytest.fixture(scope="session")
+def barcodes():
+    return import_with_zbar("barcodes")
+
+
+@pytest.fixture(scope="session")
+def server():
+    """The Flask app's module; it imports the scanner, so it needs zbar too."""
+    return import_with_zbar("server")
@@ -0,0 +1,84 @@
+import os
+import time
+
+import pytest
+
+from artifacts import ArtifactStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = ArtifactStore(str(tmp_path), ttl=60, max_bytes=10_000)
+    monkeypatch.setattr(store, "start_sweeper", lambda: None)  # sweeps run by hand here
+    return store
+
+
+def age(store, namespace, seconds):
+    past = time.time() - seconds
+    os.utime(os.path.join(store.directory, namespace), (past, past))
+
+
+def test_identical_bytes_are_stored_once_per_namespace(store, tmp_path):
+    namespace = store.new_namespace()
+    first = store.put_bytes(namespace, b"same pixels")
+    again = store.put_bytes(namespace, b"same pixels")
+    source = tmp_path / "copy.bin"
+    source.write_bytes(b"same pixels")
+    from_file = store.put_file(namespace, str(source))
+    other = store.put_bytes(namespace, b"other pixels", "jpg")
+
+    assert first == again == from_file
+    assert other != first and other.endswith(".jpg")
+    assert sorted(os.listdir(os.path.join(store.directory, namespace))) == sorted([first, other])
+    with open(store.resolve(f"{namespace}/{first}"), "rb") as f:
+        assert f.read() == b"same pixels"
+    assert store.url(namespace, first).endswith(f"/images/{namespace}/{first}")
+
+
+def test_namespaces_never_share_files(store):
+    a, b = store.new_namespace(), store.new_namespace()
+    name = store.put_bytes(a, b"logo")
+    assert store.put_bytes(b, b"logo") == name
+    assert store.path(a, name) != store.path(b, name)
+
+
+def test_expired_namespaces_are_swept(store):
+    old, fresh = store.new_namespace(), store.new_namespace()
+    old_name = store.put_bytes(old, b"old")
+    fresh_name = store.put_bytes(fresh, b"fresh")
+    age(store, old, 120)
+
+    store.sweep()
+
+    assert store.path(old, old_name) is None
+    assert store.path(fresh, fresh_name) is not None
+    assert store.stats()["namespaces"] == 1 and store.stats()["evictions"] == 1
+
+
+def test_reading_keeps_a_namespace_alive(store):
+    namespace = store.new_namespace()
+    name = store.put_bytes(namespace, b"still wanted")
+    age(store, namespace, 120)
+    assert store.path(namespace, name) is not None  # a read refreshes the TTL
+    store.sweep()
+    assert store.path(namespace, name) is not None
+
+
+def test_oldest_namespaces_go_first_past_max_bytes(store):
+    namespaces = [store.new_namespace() for _ in range(3)]
+    for seconds, namespace in zip((30, 20, 10), namespaces):
+        store.put_bytes(namespace, os.urandom(4000))
+        age(store, namespace, seconds)
+
+    store.sweep()
+
+    assert [os.path.isdir(os.path.join(store.directory, n)) for n in namespaces] == [False, True, True]
+    assert store.stats()["size_bytes"] <= store.max_bytes
+
+
+def test_malformed_names_resolve_to_nothing(store):
+    namespace = store.new_namespace()
+    name = store.put_bytes(namespace, b"x")
+    assert store.resolve(f"../{namespace}/{name}") is None
+    assert store.path(namespace, "../../etc/passwd") is None
+    assert store.resolve(f"{namespace}/{'0' * 64}.png") is None
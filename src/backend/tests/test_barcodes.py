@@ -0,0 +1,48 @@
+import cv2
+import numpy as np
+import pytest
+
+
+def qr(text, module=6):
+    code = cv2.QRCodeEncoder.create().encode(text)
+    return cv2.resize(code, None, fx=module, fy=module, interpolation=cv2.INTER_NEAREST)
+
+
+def paste(image, code, x, y):
+    h, w = code.shape
+    image[y:y + h, x:x + w] = np.where(code > 127, 235, 20)
+
+
+def payloads(codes):
+    return sorted(data.decode() for _, data, _ in codes)
+
+
+def test_several_codes_in_one_image(barcodes):
+    image = np.full((700, 900), 255, np.uint8)
+    paste(image, qr("https://example.com/a"), 40, 40)
+    paste(image, qr("https://example.com/b"), 500, 60)
+    paste(image, qr("https://example.com/c"), 260, 420)
+    codes = barcodes.detect_codes(image)
+    assert payloads(codes) == ["https://example.com/a", "https://example.com/b", "https://example.com/c"]
+    x0, y0, x1, y1 = next(bbox for _, data, bbox in codes if data == b"https://example.com/c")
+    assert 250 <= x0 < x1 <= 480 and 410 <= y0 < y1 <= 650
+
+
+@pytest.mark.parametrize("sigma", [15, 30])
+def test_code_on_a_noisy_gradient(sigma, barcodes):
+    image = np.tile(np.linspace(60, 220, 600), (600, 1))
+    code = qr("https://example.com/noisy")
+    h, w = code.shape
+    image[150:150 + h, 150:150 + w] = np.where(code > 127, 235, 20)
+    image += np.random.RandomState(0).normal(0, sigma, image.shape)
+    image = np.clip(image, 0, 255).astype(np.uint8)
+    assert payloads(barcodes.detect_codes(image)) == ["https://example.com/noisy"]
+
+
+def test_no_code(barcodes):
+    blank = np.full((400, 400), 255, np.uint8)
+    photo = cv2.GaussianBlur(np.random.RandomState(1).randint(0, 255, (480, 640)).astype(np.uint8), (0, 0), 3)
+    text = blank.copy()
+    cv2.putText(text, "https://example.com", (10, 200), cv2.FONT_HERSHEY_SIMPLEX, 0.8, 0, 2)
+    for image in (blank, photo, text):
+        assert barcodes.detect_codes(image) == []
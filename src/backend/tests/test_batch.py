@@ -0,0 +1,34 @@
+import json
+import os
+
+import batch
+
+
+def fake_scan_file(path, sha256, options):
+    """Stands in for batch.scan_file in the workers; dies on files named crash*.pdf."""
+    if os.path.basename(path).startswith("crash"):
+        os._exit(1)
+    return {"file": path, "sha256": sha256, "pages": 1, "images": 0, "links": 0, "elapsed": 0.0}
+
+
+def records(output):
+    with open(output, encoding="utf-8") as f:
+        return {os.path.basename(record["file"]): record for record in map(json.loads, f)}
+
+
+def test_a_dead_worker_fails_its_documents_and_the_batch_goes_on(monkeypatch, tmp_path):
+    monkeypatch.setattr(batch, "scan_file", fake_scan_file)
+    names = ["a.pdf", "crash.pdf", "c.pdf", "d.pdf", "e.pdf"]
+    for name in names:
+        (tmp_path / name).write_bytes(f"%PDF-1.4 {name}".encode())
+    output = str(tmp_path / "results.jsonl")
+
+    counts = batch.run_batch([str(tmp_path)], output, workers=1)
+
+    found = records(output)
+    assert sorted(found) == sorted(names)
+    assert "BrokenProcessPool" in found["crash.pdf"]["error"]
+    assert "error" not in found["e.pdf"]  # scanned by the new pool
+    assert counts["found"] == 5 and counts["scanned"] + counts["failed"] == 5 and counts["failed"] >= 1
+    # Failed documents stay out of the checkpoint, so a rerun retries them
+    assert found["crash.pdf"]["sha256"] not in batch.load_checkpoint(output)
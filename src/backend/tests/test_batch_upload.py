@@ -0,0 +1,68 @@
+import io
+import json
+import os
+import zipfile
+
+import fitz
+import pytest
+
+from config import UPLOAD_FOLDER
+
+
+def pdf_bytes(page_count, text=None):
+    pdf = fitz.open()
+    for number in range(page_count):
+        pdf.new_page().insert_text((72, 72), f"{text or 'page'} {number + 1}")
+    return pdf.tobytes()
+
+
+def zip_bytes(*members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def patch_member(data, name, flag_bits=None, method=None):
+    """Rewrite a stored member's headers as if it were encrypted or used another compression method."""
+    data = bytearray(data)
+    encoded = name.encode()
+    for signature, flags_at, name_at in ((b"PK\x03\x04", 6, 30), (b"PK\x01\x02", 8, 46)):
+        start = data.find(signature)
+        while data[start + name_at:start + name_at + len(encoded)] != encoded:
+            start = data.find(signature, start + 1)
+        if flag_bits is not None:
+            data[start + flags_at:start + flags_at + 2] = flag_bits.to_bytes(2, "little")
+        if method is not None:
+            data[start + flags_at + 2:start + flags_at + 4] = method.to_bytes(2, "little")
+    return bytes(data)
+
+
+def post_batch(client, *files, query=""):
+    return client.post(f"/upload/batch{query}", data={"files": [(io.BytesIO(data), name) for name, data in files]},
+                       content_type="multipart/form-data")
+
+
+@pytest.mark.parametrize("patch", [{"flag_bits": 0x1}, {"method": 97}], ids=["encrypted", "unsupported-method"])
+def test_unreadable_zip_member_is_a_client_error(patch, server):
+    archive = patch_member(zip_bytes(("a.pdf", pdf_bytes(1)), ("b.pdf", pdf_bytes(1))), "b.pdf", **patch)
+    before = set(os.listdir(UPLOAD_FOLDER))
+    response = post_batch(server.app.test_client(), ("first.pdf", pdf_bytes(1)), ("docs.zip", archive))
+    assert response.status_code == 400
+    assert response.get_json()["error"]
+    assert set(os.listdir(UPLOAD_FOLDER)) == before  # nothing of the failed upload is left behind
+
+
+def test_large_batch_does_not_starve_a_single_file(monkeypatch, scanner, server):
+    monkeypatch.setattr(scanner, "SCAN_PROCESSES", 1)
+    response = post_batch(server.app.test_client(), ("long.pdf", pdf_bytes(40, "long")),
+                          ("short.pdf", pdf_bytes(1, "short")), query="?format=ndjson&cache=0&images=0")
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    finished = [event["file"] for event in events if event["type"] == "document"]
+    assert finished == ["short.pdf", "long.pdf"]
+    assert events[-1]["type"] == "summary" and events[-1]["ocr_calls_avoided"] == 0
+    # The short document's only chunk runs in the first round, not after the long one's ten
+    short_at = next(i for i, event in enumerate(events) if event["type"] == "document" and event["file"] == "short.pdf")
+    pages_done = max((event["pages_done"] for event in events[:short_at] if event["type"] == "progress"), default=0)
+    assert pages_done <= scanner.BATCH_CHUNK_PAGES + 1
@@ -0,0 +1,18 @@
+import benchmark
+
+STAGE = {"p50_ms": 10.0, "p95_ms": 20.0, "peak_rss_mb": 100.0, "per_sec": 50.0}
+
+
+def test_same_results_pass():
+    assert benchmark.compare({"scan_pdf": dict(STAGE)}, {"stages": {"scan_pdf": dict(STAGE)}}) == []
+
+
+def test_slower_stage_fails():
+    slower = dict(STAGE, p95_ms=40.0, per_sec=20.0)
+    failures = benchmark.compare({"scan_pdf": slower}, {"tolerance": 0.25, "stages": {"scan_pdf": dict(STAGE)}})
+    assert len(failures) == 2
+
+
+def test_stage_missing_from_baseline_fails():
+    failures = benchmark.compare({"corpus": dict(STAGE)}, {"stages": {"scan_pdf": dict(STAGE)}})
+    assert failures and "not in the baseline" in failures[0]
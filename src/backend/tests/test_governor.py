@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+from governor import MB, AdmissionTimeout, OverBudget, ResourceGovernor, process_memory
+
+
+def test_scan_above_the_whole_budget_is_refused():
+    governor = ResourceGovernor(100 * MB)
+    with pytest.raises(OverBudget):
+        governor.admit("huge.pdf", 101 * MB)
+    assert governor.stats()["scans_rejected"] == 1
+
+
+def test_no_budget_admits_everything():
+    governor = ResourceGovernor(0)
+    with governor.admit("a.pdf", 10_000 * MB), governor.admit("b.pdf", 10_000 * MB):
+        assert governor.stats()["scans_admitted"] == 2
+
+
+def test_scans_share_the_budget_and_give_it_back():
+    governor = ResourceGovernor(100 * MB)
+    first = governor.admit("a.pdf", 60 * MB)
+    with pytest.raises(AdmissionTimeout):
+        governor.admit("b.pdf", 60 * MB, timeout=0.05)
+    assert governor.stats()["admission_timeouts"] == 1
+    with governor.admit("c.pdf", 40 * MB):
+        assert governor.stats()["admitted_bytes"] == 100 * MB
+    first.close()
+    first.close()  # closing twice gives the share back once
+    assert governor.stats()["admitted_bytes"] == 0
+
+
+def test_waiting_scan_is_admitted_once_room_frees_up():
+    governor = ResourceGovernor(100 * MB)
+    first = governor.admit("a.pdf", 80 * MB)
+    threading.Timer(0.1, first.close).start()
+    with governor.admit("b.pdf", 50 * MB, timeout=5) as second:
+        assert second.waited >= 0.05
+        assert second.usage()["estimated_mb"] == 50
+
+
+def test_admission_is_first_come_first_served():
+    governor = ResourceGovernor(100 * MB)
+    running = governor.admit("a.pdf", 90 * MB)
+    order = []
+
+    def scan(name, estimate):
+        with governor.admit(name, estimate, timeout=5):
+            order.append(name)
+
+    big = threading.Thread(target=scan, args=("big.pdf", 95 * MB))
+    big.start()
+    while not governor.stats()["scans_waiting"]:
+        time.sleep(0.01)
+    # Fits right now, but must not overtake the big scan already waiting
+    small = threading.Thread(target=scan, args=("small.pdf", 10 * MB))
+    small.start()
+    time.sleep(0.1)
+    assert order == []
+    running.close()
+    big.join(5)
+    small.join(5)
+    assert order == ["big.pdf", "small.pdf"]
+
+
+def test_idle_server_takes_any_scan_that_fits_the_budget():
+    governor = ResourceGovernor(100 * MB)
+    with governor.admit("a.pdf", 100 * MB):
+        pass
+
+
+def test_usage_reports_memory_where_proc_exists():
+    governor = ResourceGovernor(100 * MB, sample_interval=0.01)
+    with governor.admit("a.pdf", 10 * MB) as admission:
+        time.sleep(0.05)
+    usage = admission.usage()
+    if process_memory() is None:
+        assert usage["peak_rss_mb"] is None
+    else:
+        assert usage["peak_rss_mb"] > 0 and usage["rss_growth_mb"] >= 0
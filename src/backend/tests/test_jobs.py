@@ -0,0 +1,110 @@
+import io
+import os
+import threading
+import time
+
+import fitz
+import pytest
+
+from config import UPLOAD_FOLDER
+from jobs import JobQueue, QueueFull
+
+
+def wait_for(queue, job_id, *statuses, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} stayed {queue.get(job_id)['status']}")
+
+
+@pytest.fixture
+def gate():
+    """An event that blocked jobs wait on; set on teardown so worker threads finish."""
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def blocked(gate, progress=None, usage=None):
+    progress(1, 2)
+    gate.wait(5)
+    usage({"peak_rss_mb": 12})
+    progress(2, 2)
+    return ["report"]
+
+
+def test_job_goes_from_queued_through_running_to_done(gate):
+    queue = JobQueue(workers=1, max_queued=4)
+    first = queue.submit(blocked, gate)
+    second = queue.submit(blocked, gate)
+
+    running = wait_for(queue, first, "running")
+    assert running["started_at"] is not None and running["result"] is None
+    assert running["progress"] == {"done": 1, "total": 2}
+    waiting = queue.get(second)
+    assert waiting["status"] == "queued" and waiting["queue_position"] == 0
+
+    gate.set()
+    done = wait_for(queue, first, "done")
+    assert done["result"] == ["report"] and done["error"] is None
+    assert done["progress"] == {"done": 2, "total": 2} and done["usage"] == {"peak_rss_mb": 12}
+    assert done["created_at"] <= done["started_at"] <= done["finished_at"]
+    assert done["queue_position"] is None
+    wait_for(queue, second, "done")
+    assert queue.stats()["jobs"] == {"done": 2}
+
+
+def test_failed_job_keeps_its_error():
+    def broken(progress=None, usage=None):
+        raise RuntimeError("PDF is damaged")
+
+    queue = JobQueue(workers=1)
+    failed = wait_for(queue, queue.submit(broken), "failed", "done")
+    assert failed["status"] == "failed"
+    assert failed["error"] == "PDF is damaged" and failed["result"] is None
+    assert failed["finished_at"] is not None
+
+
+def test_full_queue_refuses_more_jobs(gate):
+    queue = JobQueue(workers=1, max_queued=2)
+    running = queue.submit(blocked, gate)
+    wait_for(queue, running, "running")
+    queue.submit(blocked, gate)
+    queue.submit(blocked, gate)
+    with pytest.raises(QueueFull):
+        queue.submit(blocked, gate)
+    assert queue.stats()["queued"] == 2
+    assert queue.stats()["jobs"] == {"running": 1, "queued": 2}
+
+
+def test_finished_jobs_are_retired():
+    queue = JobQueue(workers=1, keep_finished=2)
+    job_ids = [queue.submit(lambda progress=None, usage=None: None) for _ in range(3)]
+    wait_for(queue, job_ids[-1], "done")
+    deadline = time.time() + 5
+    while queue.get(job_ids[0]) is not None and time.time() < deadline:
+        time.sleep(0.01)  # retired just after the last job is marked done
+    assert queue.get(job_ids[0]) is None
+    assert queue.get(job_ids[1])["status"] == "done"
+
+
+def test_jobs_endpoint_answers_429_when_the_queue_is_full(monkeypatch, gate, server):
+    queue = JobQueue(workers=1, max_queued=1)
+    wait_for(queue, queue.submit(blocked, gate), "running")
+    queue.submit(blocked, gate)
+    monkeypatch.setattr(server, "job_queue", queue)
+    before = set(os.listdir(UPLOAD_FOLDER))
+
+    pdf = fitz.open()
+    pdf.new_page()
+    response = server.app.test_client().post("/jobs", data={"file": (io.BytesIO(pdf.tobytes()), "one.pdf")},
+                                             content_type="multipart/form-data")
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "10"
+    body = response.get_json()
+    assert "full" in body["error"] and body["queue"]["queued"] == 1
+    assert set(os.listdir(UPLOAD_FOLDER)) == before  # the upload isn't left behind
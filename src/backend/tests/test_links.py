@@ -0,0 +1,59 @@
+import random
+
+import fitz
+
+from links import LinkIndex, overlaps
+
+
+def uri_link(x0, y0, x1, y1, uri="https://example.com/"):
+    return {"kind": fitz.LINK_URI, "from": fitz.Rect(x0, y0, x1, y1), "uri": uri}
+
+
+def brute_force(link_dicts, area):
+    return [i for i, ld in enumerate(link_dicts)
+            if ld.get("kind") == fitz.LINK_URI and ld.get("uri")
+            and overlaps([ld["from"].x0, ld["from"].y0, ld["from"].x1, ld["from"].y1], area)]
+
+
+def test_touching_edges_do_not_overlap():
+    assert overlaps([0, 0, 10, 10], [5, 5, 15, 15])
+    assert not overlaps([0, 0, 10, 10], [10, 0, 20, 10])
+    assert not overlaps([0, 0, 10, 10], [0, 10, 10, 20])
+
+
+def test_only_uri_links_are_indexed():
+    links = [uri_link(0, 0, 10, 10),
+             {"kind": fitz.LINK_GOTO, "from": fitz.Rect(0, 0, 10, 10), "page": 1},
+             {"kind": fitz.LINK_URI, "from": fitz.Rect(0, 0, 10, 10), "uri": ""}]
+    index = LinkIndex(links)
+    assert [record["index"] for record in index.uri_links] == [0]
+
+
+def test_grid_query_matches_a_straight_scan():
+    rng = random.Random(7)
+    links = []
+    for i in range(300):
+        x, y = rng.uniform(0, 600), rng.uniform(0, 800)
+        links.append(uri_link(x, y, x + rng.uniform(1, 150), y + rng.uniform(1, 40), f"https://example.com/{i}"))
+    links.append(uri_link(-1e6, -1e6, 1e6, 1e6, "https://example.com/huge"))  # too big for the grid
+    index = LinkIndex(links, cell_size=50)
+    for _ in range(200):
+        x, y = rng.uniform(-50, 650), rng.uniform(-50, 850)
+        area = [x, y, x + rng.uniform(0, 300), y + rng.uniform(0, 300)]
+        assert [record["index"] for record in index.query(area)] == brute_force(links, area)
+
+
+def test_infinite_area_falls_back_to_a_scan():
+    links = [uri_link(i * 20, 0, i * 20 + 10, 10) for i in range(10)]
+    index = LinkIndex(links)
+    assert len(index.query([0, 0, float("inf"), float("inf")])) == 10
+
+
+def test_for_page_reads_the_page_annotations():
+    pdf = fitz.open()
+    page = pdf.new_page()
+    page.insert_link({"kind": fitz.LINK_URI, "from": fitz.Rect(72, 72, 200, 90), "uri": "https://example.com/a"})
+    page.insert_link({"kind": fitz.LINK_URI, "from": fitz.Rect(72, 400, 200, 420), "uri": "https://example.com/b"})
+    pdf = fitz.open("pdf", pdf.tobytes())  # links inserted in memory only show up once saved
+    index = LinkIndex.for_page(pdf[0])
+    assert [record["uri"] for record in index.query([0, 0, 300, 300])] == ["https://example.com/a"]
@@ -0,0 +1,65 @@
+import cv2
+import numpy as np
+import pytest
+
+from images import ImageBuffer
+
+
+def banner(text, jpeg_quality=None):
+    # Small text: the two URLs below differ by less than PHASH_MAX_DIFF
+    rgb = np.full((160, 640, 3), 235, np.uint8)
+    cv2.rectangle(rgb, (0, 0), (200, 160), (40, 90, 160), -1)
+    if text:
+        cv2.putText(rgb, text, (10, 80), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 1)
+    if jpeg_quality:
+        data = cv2.imencode(".jpg", rgb, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])[1]
+        rgb = cv2.imdecode(data, cv2.IMREAD_COLOR)
+    return ImageBuffer(rgb=rgb)
+
+
+@pytest.fixture
+def analyze(scanner):
+    """Analyse an image and run its OCR; returns ``(entry, whether it was queued for OCR)``."""
+    def analyze(image, key):
+        entry = {"filename": key, "extracted_links": [], "clickable_links_found": False}
+        pending = []
+        scanner.analyze_image(entry, image, key, pending)
+        queued = bool(pending)
+        scanner.run_pending_ocr(pending)
+        return entry, queued
+    return analyze
+
+
+def links(entry):
+    return {link["content"] for link in entry["extracted_links"]}
+
+
+@pytest.fixture
+def ocr(monkeypatch, scanner):
+    """Fake OCR: each image OCR'd takes the next queued answer, or finds nothing."""
+    answers = []
+
+    def fake_batch(images, stats=None, read=None):
+        if read is not None:
+            read.update(range(len(images)))
+        return [answers.pop(0) if answers else [] for _ in images]
+
+    monkeypatch.setattr(scanner, "extract_text_and_urls_batch", fake_batch)
+    return answers
+
+
+def test_text_is_not_reused_from_a_look_alike(ocr, analyze):
+    ocr.append([{"content": "https://example.com/item/4821", "type": "url"}])
+    first, _ = analyze(banner("https://example.com/item/4821"), "a1" * 32)
+    assert links(first) == {"https://example.com/item/4821"}
+
+    ocr.append([{"content": "https://example.com/item/4827", "type": "url"}])
+    second, queued = analyze(banner("https://example.com/item/4827"), "a2" * 32)
+    assert queued
+    assert links(second) == {"https://example.com/item/4827"}
+
+
+def test_text_free_look_alike_is_reused(ocr, analyze):
+    analyze(banner(None), "b1" * 32)
+    _, queued = analyze(banner(None, jpeg_quality=80), "b2" * 32)
+    assert not queued
@@ -0,0 +1,24 @@
+import pytest
+
+import ocr_service
+
+
+def test_tcp_needs_an_authkey(monkeypatch):
+    monkeypatch.setattr(ocr_service, "AUTHKEY", None)
+    with pytest.raises(ValueError, match="OCR_SERVICE_AUTHKEY"):
+        ocr_service.authkey_for(ocr_service.parse_address("10.0.0.5:7000"))
+    with pytest.raises(ValueError, match="OCR_SERVICE_AUTHKEY"):
+        ocr_service.OcrClient(["/tmp/ocr.sock", "10.0.0.5:7000"])
+    with pytest.raises(ValueError, match="OCR_SERVICE_AUTHKEY"):
+        ocr_service.serve("127.0.0.1:7000")  # refuses before loading EasyOCR
+
+
+def test_unix_sockets_fall_back_to_the_fixed_key(monkeypatch):
+    monkeypatch.setattr(ocr_service, "AUTHKEY", None)
+    assert ocr_service.authkey_for(ocr_service.parse_address("/tmp/ocr.sock")) == b"hidden-image-tool"
+
+
+def test_configured_authkey_is_used_everywhere(monkeypatch):
+    monkeypatch.setattr(ocr_service, "AUTHKEY", "s3cret")
+    client = ocr_service.OcrClient(["/tmp/ocr.sock", "10.0.0.5:7000"])
+    assert client.authkeys == [b"s3cret", b"s3cret"]
@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+from pageranges import format_page_ranges, parse_page_ranges, parse_page_spans
+
+
+def test_pages_and_ranges_are_sorted_without_repeats():
+    assert parse_page_ranges("8, 1-3,2,5-5", page_count=10) == [1, 2, 3, 5, 8]
+
+
+def test_open_range_runs_to_the_last_page():
+    assert parse_page_ranges("8-", page_count=10) == [8, 9, 10]
+    assert parse_page_spans("8-,2") == [(8, None), (2, 2)]
+
+
+def test_pages_past_the_end_are_dropped():
+    assert parse_page_ranges("9-12,20", page_count=10) == [9, 10]
+    assert parse_page_ranges("99", page_count=10) == []
+    assert parse_page_ranges("11-", page_count=10) == []
+
+
+def test_huge_ranges_are_never_expanded():
+    started = time.perf_counter()
+    assert parse_page_spans("1-2000000000") == [(1, 2000000000)]
+    assert parse_page_ranges("1-2000000000,5-99999999999", page_count=3) == [1, 2, 3]
+    assert time.perf_counter() - started < 0.1
+
+
+@pytest.mark.parametrize("spec", ["", "a", "0", "5-3", "1-2-3", "-4", "1,,2"])
+def test_bad_specs_raise(spec):
+    with pytest.raises(ValueError):
+        parse_page_spans(spec)
+    with pytest.raises(ValueError):
+        parse_page_ranges(spec, page_count=10)
+
+
+def test_format_is_the_shortest_spec():
+    assert format_page_ranges([8, 1, 2, 3, 3, 10, 11]) == "1-3,8,10-11"
+    assert format_page_ranges([]) == ""
+
+
+def test_format_round_trips():
+    pages = [1, 2, 4, 7, 8, 9, 15]
+    assert parse_page_ranges(format_page_ranges(pages), page_count=20) == pages
@@ -0,0 +1,63 @@
+import cv2
+import fitz
+import numpy as np
+import pytest
+
+PAGES = 8
+
+
+def png(color, seed):
+    image = np.full((90, 240, 3), color, np.uint8)
+    cv2.circle(image, (45 + seed * 20 % 150, 45), 30, (255 - color, 80, 160), -1)
+    return cv2.imencode(".png", image)[1].tobytes()
+
+
+@pytest.fixture
+def document(tmp_path):
+    """Pages with links and images that all carry vector text, so no OCR model is needed.
+
+    One logo repeats on every page, so parallel chunks meet it separately.
+    """
+    pdf = fitz.open()
+    logo = png(200, 0)
+    for number in range(1, PAGES + 1):
+        page = pdf.new_page()
+        for row in range(2):
+            y = 72 + row * 40
+            page.insert_text((72, y), f"https://example.com/p{number}/{row}", fontsize=11)
+            page.insert_link({"kind": fitz.LINK_URI, "from": fitz.Rect(70, y - 12, 300, y + 4),
+                              "uri": f"https://example.com/p{number}/{row}"})
+        for slot, data in enumerate((logo, png(40 + number * 20, number))):
+            area = fitz.Rect(72, 200 + slot * 150, 312, 290 + slot * 150)
+            page.insert_image(area, stream=data)
+            page.insert_text((80, area.y0 + 40), f"www.example.org/img{slot}", fontsize=10)
+    path = tmp_path / "doc.pdf"
+    pdf.save(str(path))
+    return str(path)
+
+
+@pytest.fixture
+def two_processes(monkeypatch, scanner):
+    monkeypatch.setattr(scanner, "SCAN_PROCESSES", 2)
+    yield
+    if scanner._process_pool is not None:
+        scanner._process_pool.shutdown()
+        scanner._process_pool = None
+
+
+def test_parallel_scan_matches_serial(document, two_processes, scanner):
+    options = {"use_cache": False, "save_images": False}
+    serial_status, parallel_status = {}, {}
+    serial = scanner.scan_pdf(document, "doc.pdf", parallel=False, status=serial_status, **options)
+    parallel = scanner.scan_pdf(document, "doc.pdf", parallel=True, status=parallel_status, **options)
+    events = list(scanner.iter_scan_events(document, "doc.pdf", parallel=True, **options))
+    streamed = [event["page"] for event in events if event["type"] == "page"]
+
+    assert len(serial) == PAGES
+    assert parallel == serial
+    assert streamed == serial
+    assert parallel_status == serial_status
+    logos = {page_info["images"][2]["filename"] for page_info in serial}
+    assert len(logos) == 1
+    assert {"https://example.com/p3/0", "https://example.com/p3/1"} <= {
+        link["content"] for entry in serial[2]["images"] for link in entry["extracted_links"]}
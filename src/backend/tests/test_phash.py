@@ -0,0 +1,65 @@
+import cv2
+import numpy as np
+
+from images import ImageBuffer
+from phash import ImageSignature, PerceptualIndex, dhash
+
+
+def banner(text="https://example.com/item/4821", width=640, height=160):
+    rgb = np.full((height, width, 3), 235, np.uint8)
+    cv2.rectangle(rgb, (0, 0), (width // 3, height), (40, 90, 160), -1)
+    cv2.putText(rgb, text, (10, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 2)
+    return ImageBuffer(rgb=rgb)
+
+
+def reencoded(image, scale):
+    rgb = cv2.resize(image.rgb, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    data = cv2.imencode(".jpg", rgb, [cv2.IMWRITE_JPEG_QUALITY, 85])[1]
+    return ImageBuffer(rgb=cv2.imdecode(data, cv2.IMREAD_COLOR))
+
+
+def distance(a, b):
+    return bin(a.hash ^ b.hash).count("1")
+
+
+def test_dhash_is_64_bits_and_stable():
+    gray = banner().gray
+    assert dhash(gray) == dhash(gray.copy())
+    assert 0 <= dhash(gray) < 2 ** 64
+
+
+def test_reencoded_copy_is_close():
+    original = ImageSignature.from_image(banner())
+    copy = ImageSignature.from_image(reencoded(banner(), 0.75))
+    assert distance(original, copy) <= 6
+    assert original.difference(copy.thumb) < 16
+
+
+def test_one_changed_digit_keeps_the_hash():
+    # Why scanner.py never reuses text on a near match
+    a = ImageSignature.from_image(banner("https://example.com/item/4821"))
+    b = ImageSignature.from_image(banner("https://example.com/item/4827"))
+    assert distance(a, b) <= 6
+
+
+def test_index_finds_within_distance_and_aspect(tmp_path):
+    index = PerceptualIndex(str(tmp_path), max_entries=100)
+    signature = ImageSignature.from_image(banner())
+    index.add(signature, "ab" * 32)
+    assert index.find(signature, 0) == ["ab" * 32]
+    assert index.find(ImageSignature.from_image(reencoded(banner(), 0.5)), 6) == ["ab" * 32]
+    tall = ImageSignature(signature.hash, signature.aspect / 2, signature.thumb)
+    assert index.find(tall, 6) == []
+    far = ImageSignature(signature.hash ^ 0xFFFF, signature.aspect, signature.thumb)
+    assert index.find(far, 6) == []
+
+
+def test_index_is_shared_through_the_file_and_compacts(tmp_path):
+    writer = PerceptualIndex(str(tmp_path), max_entries=4)
+    reader = PerceptualIndex(str(tmp_path), max_entries=4)
+    signature = ImageSignature.from_image(banner())
+    for i in range(6):
+        writer.add(ImageSignature(i << 32, 1.0, signature.thumb), f"{i:064x}")
+    assert reader.find(ImageSignature(5 << 32, 1.0, signature.thumb), 0) == [f"{5:064x}"]
+    assert reader.stats()["records"] == 4
+    assert reader.find(ImageSignature(0, 1.0, signature.thumb), 0) == []
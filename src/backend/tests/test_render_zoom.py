@@ -0,0 +1,23 @@
+import fitz
+import pytest
+
+
+def test_small_link_is_upscaled_to_the_target(scanner):
+    zoom = scanner.render_zoom(fitz.Rect(0, 0, 120, 32))
+    assert zoom == pytest.approx(scanner.RENDER_TARGET_PX / 32)
+
+
+def test_tiny_link_stops_at_max_zoom(scanner):
+    assert scanner.render_zoom(fitz.Rect(0, 0, 60, 10)) == scanner.RENDER_MAX_ZOOM
+
+
+def test_large_link_keeps_the_2x_baseline(scanner):
+    # 90pt tall: the target alone would ask for about 1.07x
+    assert scanner.render_zoom(fitz.Rect(0, 0, 445, 90)) == 2
+
+
+def test_huge_area_is_capped_by_the_pixel_budget(scanner):
+    rect = fitz.Rect(0, 0, 2000, 2000)
+    zoom = scanner.render_zoom(rect)
+    assert zoom < 2
+    assert rect.width * rect.height * zoom * zoom <= scanner.OCR_PIXEL_BUDGET * 1.0001
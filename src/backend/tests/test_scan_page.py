@@ -0,0 +1,95 @@
+import cv2
+import fitz
+import numpy as np
+import pytest
+
+OCR_URL = "https://example.com/from-ocr"
+
+
+def fake_ocr(images, stats=None, read=None):
+    if read is not None:
+        read.update(range(len(images)))
+    return [[{"content": OCR_URL, "type": "url", "description": "URL found in image text"}]
+            for _ in images]
+
+
+def banner_png():
+    image = np.full((120, 480, 3), 255, np.uint8)
+    cv2.putText(image, "example.com", (10, 80), cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 0), 3)
+    return cv2.imencode(".png", image)[1].tobytes()
+
+
+def links(entry):
+    return {link["content"] for link in entry["extracted_links"]}
+
+
+def test_placement_without_text_layer_is_ocrd_after_one_with_it(monkeypatch, scanner):
+    monkeypatch.setattr(scanner, "extract_text_and_urls_batch", fake_ocr)
+    pdf = fitz.open()
+    png = banner_png()
+    area = fitz.Rect(72, 72, 312, 132)
+    first = pdf.new_page()
+    xref = first.insert_image(area, stream=png)
+    first.insert_text((80, 100), "https://example.com/vector", fontsize=10)
+    second = pdf.new_page()
+    second.insert_image(area, xref=xref)
+
+    options = scanner.scan_options(use_cache=False)
+    registry = scanner.new_image_registry()
+    page1, _ = scanner.scan_page(pdf, 1, "doc.pdf", None, options, registry)
+    page2, stats = scanner.scan_page(pdf, 2, "doc.pdf", None, options, registry)
+
+    assert links(page1["images"][0]) == {"https://example.com/vector"}
+    assert links(page2["images"][0]) == {OCR_URL}
+    assert page2["images"][0]["filename"] == page1["images"][0]["filename"]
+    assert stats["duplicate_images"] == 1
+
+
+def triage_rejects_all(images, stats=None, read=None):
+    stats["ocr_skipped"] = stats.get("ocr_skipped", 0) + len(images)
+    return [[] for _ in images]
+
+
+def banner_pdf(path, vector_text_on=()):
+    """The same banner image on three pages, with vector text over it on ``vector_text_on``."""
+    pdf = fitz.open()
+    area = fitz.Rect(72, 72, 312, 132)
+    xref = None
+    for page_num in (1, 2, 3):
+        page = pdf.new_page()
+        if xref is None:
+            xref = page.insert_image(area, stream=banner_png())
+        else:
+            page.insert_image(area, xref=xref)
+        if page_num in vector_text_on:
+            page.insert_text((80, 100), "https://example.com/vector", fontsize=10)
+    pdf.save(path)
+    return str(path)
+
+
+@pytest.mark.parametrize("ocr, vector_text_on, avoided", [
+    (fake_ocr, (), 2),            # OCR'd once, reused by both other placements
+    (fake_ocr, (1,), 1),          # the text layer covered the first: page 2 is OCR'd, page 3 reuses it
+    (fake_ocr, (1, 2, 3), 0),     # nothing needed OCR
+    (triage_rejects_all, (), 1),  # the one triage skip; its duplicates saved no OCR call
+])
+def test_ocr_calls_avoided_counts_only_saved_calls(monkeypatch, tmp_path, ocr, vector_text_on, avoided, scanner):
+    monkeypatch.setattr(scanner, "extract_text_and_urls_batch", ocr)
+    path = banner_pdf(tmp_path / "banners.pdf", vector_text_on)
+    status = {}
+    scanner.scan_pdf(path, "banners.pdf", parallel=False, status=status, use_cache=False, save_images=False)
+    assert status["ocr_calls_avoided"] == avoided
+    events = list(scanner.iter_scan_events(path, "banners.pdf", parallel=False, use_cache=False, save_images=False))
+    assert events[-1]["ocr_calls_avoided"] == avoided
+
+
+def test_unavailable_ocr_reader_is_a_per_image_error(monkeypatch, tmp_path, scanner):
+    def no_reader():
+        raise RuntimeError("EasyOCR model download failed")
+
+    monkeypatch.setattr(scanner, "get_reader", no_reader)
+    path = banner_pdf(tmp_path / "banners.pdf")
+    report = scanner.scan_pdf(path, "banners.pdf", parallel=False, use_cache=False, save_images=False)
+
+    assert [page_info["errors"] for page_info in report] == [[{"source": "ocr", "index": 0, "error": "OCR failed"}]] * 3
+    assert all(page_info["images"][0]["filename"] for page_info in report)
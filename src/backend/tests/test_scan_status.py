@@ -0,0 +1,76 @@
+import time
+
+import fitz
+import pytest
+
+from pageranges import PageRangeError
+
+
+def pages(*numbers, **flags):
+    return [dict({"page": number}, **flags.get(str(number), {})) for number in numbers]
+
+
+def test_plan_pages_selects_ranges_and_defers_past_max_pages(scanner):
+    options = scanner.scan_options(pages="2-6", max_pages=3)
+    assert scanner.plan_pages(options, 10) == ([2, 3, 4], [5, 6])
+    assert scanner.plan_pages(scanner.scan_options(), 3) == ([1, 2, 3], [])
+
+
+def test_plan_pages_rejects_ranges_outside_the_document(scanner):
+    with pytest.raises(PageRangeError, match="outside this 10-page PDF"):
+        scanner.plan_pages(scanner.scan_options(pages="99"), 10)
+    with pytest.raises(PageRangeError):
+        scanner.plan_pages(scanner.scan_options(pages="11-"), 10)
+
+
+def test_complete_scan(scanner):
+    status = scanner.scan_status(3, [1, 2, 3], [], pages(1, 2, 3))
+    assert status["complete"] and status["stopped_by"] is None
+    assert status["scanned_pages"] == "1-3" and status["remaining_pages"] == ""
+
+
+def test_max_pages_leaves_the_rest_to_resume(scanner):
+    status = scanner.scan_status(10, [1, 2, 3], [4, 5, 6, 7, 8, 9, 10], pages(1, 2, 3))
+    assert not status["complete"]
+    assert status["stopped_by"] == "max_pages"
+    assert status["remaining_pages"] == "4-10"
+
+
+def test_deadline_reports_truncated_and_unreached_pages(scanner):
+    report = pages(1, 2, **{"2": {"truncated": True}})
+    status = scanner.scan_status(4, [1, 2, 3, 4], [], report)
+    assert status["stopped_by"] == "deadline"
+    assert status["truncated_pages"] == "2"
+    assert status["skipped_pages"] == "3-4"
+    assert status["remaining_pages"] == "2-4"
+
+
+def test_pages_with_errors_are_incomplete(scanner):
+    report = pages(1, 2, **{"1": {"errors": [{"source": "ocr", "index": 0, "error": "OCR failed"}]}})
+    status = scanner.scan_status(2, [1, 2], [], report)
+    assert not status["complete"]
+    assert status["error_pages"] == "1" and status["remaining_pages"] == "1"
+    assert status["errors"] == 1
+
+
+def test_full_page_scan_stops_at_the_scan_deadline(monkeypatch, scanner):
+    def slow_ocr(images):
+        time.sleep(0.2)
+        return [[] for _ in images]
+
+    monkeypatch.setattr(scanner, "readtext_batched", slow_ocr)
+    monkeypatch.setattr(scanner, "FULL_PAGE_TILE", 256)
+    monkeypatch.setattr(scanner, "OCR_BATCH_SIZE", 1)
+    pdf = fitz.open()
+    page = pdf.new_page()
+    for y in range(40, 800, 24):
+        page.insert_text((40, y), "https://example.com/a/long/path/to/some/page " * 2, fontsize=11)
+
+    options = scanner.scan_options(use_cache=False, full_page=True, deadline=0.5)
+    started = time.time()
+    page_info, _ = scanner.scan_page(pdf, 1, "flat.pdf", None, options)
+
+    assert time.time() - started < 2
+    assert page_info["truncated"]
+    full_page = page_info["images"][0]["full_page"]
+    assert full_page["timed_out"] and full_page["tiles_skipped"] > 0
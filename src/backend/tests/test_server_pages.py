@@ -0,0 +1,47 @@
+import io
+import time
+
+import fitz
+import pytest
+
+
+def pdf_bytes(page_count):
+    pdf = fitz.open()
+    for _ in range(page_count):
+        pdf.new_page()
+    return pdf.tobytes()
+
+
+@pytest.mark.parametrize("route", ["/upload", "/upload/stream"])
+def test_pages_outside_the_document_are_rejected(route, server):
+    client = server.app.test_client()
+    response = client.post(f"{route}?pages=99", data={"file": (io.BytesIO(pdf_bytes(10)), "ten.pdf")},
+                           content_type="multipart/form-data")
+    assert response.status_code == 400
+    assert "outside this 10-page PDF" in response.get_json()["error"]
+
+
+def test_bad_page_range_syntax_is_rejected(server):
+    client = server.app.test_client()
+    response = client.post("/upload?pages=3-1", data={"file": (io.BytesIO(pdf_bytes(3)), "three.pdf")},
+                           content_type="multipart/form-data")
+    assert response.status_code == 400
+
+
+def test_huge_page_range_is_clamped_to_the_document(server):
+    client = server.app.test_client()
+    started = time.perf_counter()
+    response = client.post("/upload?pages=1-2000000000&cache=0&images=0",
+                           data={"file": (io.BytesIO(pdf_bytes(3)), "three.pdf")},
+                           content_type="multipart/form-data")
+    assert response.status_code == 200
+    assert response.get_json()["scan"]["scanned_pages"] == "1-3"
+    assert time.perf_counter() - started < 5
+
+
+def test_upload_reports_ocr_calls_avoided(server):
+    client = server.app.test_client()
+    response = client.post("/upload?cache=0&images=0", data={"file": (io.BytesIO(pdf_bytes(2)), "two.pdf")},
+                           content_type="multipart/form-data")
+    assert response.status_code == 200
+    assert response.headers["X-OCR-Calls-Avoided"] == "0"
@@ -0,0 +1,34 @@
+import io
+import json
+import os
+
+import fitz
+
+
+def linked_pdf(marker):
+    """Two pages of links over vector text, so no OCR runs; ``marker`` makes the bytes unique."""
+    pdf = fitz.open()
+    for number in (1, 2):
+        page = pdf.new_page()
+        page.insert_text((72, 72), f"https://example.com/{marker}/{number}", fontsize=11)
+        page.insert_link({"kind": fitz.LINK_URI, "from": fitz.Rect(70, 60, 300, 76),
+                          "uri": f"https://example.com/{marker}/{number}"})
+    return pdf.tobytes()
+
+
+def stream(client, data):
+    response = client.post("/upload/stream", data={"file": (io.BytesIO(data), "links.pdf")},
+                           content_type="multipart/form-data")
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_second_stream_upload_is_served_from_the_report_cache(server):
+    client = server.app.test_client()
+    data = linked_pdf(os.urandom(4).hex())
+    first = stream(client, data)
+    second = stream(client, data)
+    assert first[0]["cached"] is False
+    assert second[0]["cached"] is True
+    pages = [event["page"] for event in first if event["type"] == "page"]
+    assert [event["page"] for event in second if event["type"] == "page"] == pages
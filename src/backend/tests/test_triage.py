@@ -0,0 +1,43 @@
+import cv2
+import numpy as np
+import pytest
+
+
+def url_image(width, height, text_px, background=255, ink=0):
+    """One line of URL text, ``text_px`` tall, on an otherwise flat image."""
+    image = np.full((height, width, 3), background, np.uint8)
+    scale = cv2.getFontScaleFromHeight(cv2.FONT_HERSHEY_SIMPLEX, text_px, 2)
+    cv2.putText(image, "https://example.com/item/4821", (20, height // 2),
+                cv2.FONT_HERSHEY_SIMPLEX, scale, (ink, ink, ink), 2, cv2.LINE_AA)
+    return image
+
+
+@pytest.mark.parametrize("width, height, text_px", [
+    (1600, 900, 20), (1600, 900, 40),
+    (1920, 1080, 20), (1920, 1080, 30), (1920, 1080, 40),
+    (800, 450, 20), (800, 450, 28),
+    (1600, 900, 14),
+])
+def test_single_url_line_on_large_image_is_ocrd(width, height, text_px, scanner):
+    run_ocr, allow_retry, _ = scanner.ocr_triage(url_image(width, height, text_px))
+    assert run_ocr and allow_retry
+
+
+@pytest.mark.parametrize("width, height, text_px", [(600, 60, 24), (476, 96, 14), (300, 40, 16)])
+def test_small_link_crop_gets_the_retry(width, height, text_px, scanner):
+    run_ocr, allow_retry, _ = scanner.ocr_triage(url_image(width, height, text_px))
+    assert run_ocr and allow_retry
+
+
+def test_low_contrast_text_is_ocrd(scanner):
+    assert scanner.ocr_triage(url_image(1920, 1080, 24, background=200, ink=140))[0]
+
+
+def test_text_free_images_are_skipped(scanner):
+    blank = np.full((600, 800, 3), 255, np.uint8)
+    x = np.linspace(0, 255, 1200)[None, :]
+    y = np.linspace(0, 255, 800)[:, None]
+    gradient = cv2.cvtColor(((x + y) / 2).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+    tiny = url_image(6, 6, 4)
+    for image in (blank, gradient, tiny):
+        assert scanner.ocr_triage(image)[:2] == (False, False)
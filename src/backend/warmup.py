@@ -0,0 +1,71 @@
+import importlib
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+PROCESS_STARTED = time.time()
+
+_lock = threading.Lock()
+_thread = None
+_components = {
+    "scanner": {"state": "not_loaded", "seconds": None, "error": None},
+    "ocr_model": {"state": "not_loaded", "seconds": None, "error": None},
+}
+
+
+def _timed(name, load):
+    status = _components[name]
+    with _lock:
+        if status["state"] == "ready":
+            return
+        status["state"] = "loading"
+    started = time.time()
+    try:
+        load()
+    except Exception as e:
+        with _lock:
+            status.update(state="failed", error=str(e), seconds=round(time.time() - started, 3))
+        raise
+    with _lock:
+        status.update(state="ready", error=None, seconds=round(time.time() - started, 3))
+
+def get_scanner():
+    """Import the scanning pipeline (fitz, cv2, numpy, pyzbar) on first use."""
+    _timed("scanner", lambda: importlib.import_module("scanner"))
+    return importlib.import_module("scanner")
+
+def load_models():
+    """Import the pipeline and build the OCR reader (or connect to the OCR service)."""
+    scanner = get_scanner()
+    _timed("ocr_model", scanner.get_reader)
+    return scanner
+
+def _warm():
+    try:
+        load_models()
+    except Exception as e:
+        log.exception("Warm-up failed: %s", e)
+
+def start_background_warmup():
+    """Load everything on a daemon thread so the app can answer /health meanwhile."""
+    global _thread
+    with _lock:
+        if _thread is not None:
+            return
+        _thread = threading.Thread(target=_warm, name="model-warmup", daemon=True)
+    _thread.start()
+
+def is_ready():
+    with _lock:
+        return all(c["state"] == "ready" for c in _components.values())
+
+def status():
+    with _lock:
+        components = {name: dict(c) for name, c in _components.items()}
+    return {
+        "ready": all(c["state"] == "ready" for c in components.values()),
+        "components": components,
+        "uptime_seconds": round(time.time() - PROCESS_STARTED, 3),
+    }
@@ -47,6 +47,9 @@ export default function ResultViewer({ result }: ResultViewerProps) {
     setFailedImages((prev) => new Set(prev).add(url));
   };
 
+  // The grid only needs a small copy; the backend renders and caches thumbnails
+  const thumbnailUrl = (url: string) => `${url}${url.includes("?") ? "&" : "?"}size=256`;
+
   const openLink = (url: string) => {
     window.open(url, "_blank");
   };
@@ -131,9 +134,10 @@ export default function ResultViewer({ result }: ResultViewerProps) {
                       <div className="text-gray-500 text-center">Failed to load image</div>
                     ) : (
                       <Image
-                        src={img.url}
+                        src={thumbnailUrl(img.url)}
                         alt={img.filename}
                         fill
+                        unoptimized
                         style={{ objectFit: "contain" }}
                         className="cursor-pointer"
                         onError={() => handleImageError(img.url)}